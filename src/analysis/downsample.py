@@ -0,0 +1,189 @@
+"""Oracle and price series downsampled to the width of a plot.
+
+The analysis notebook plots whole frames, e.g. `oracle_df[["block", "current_price"]].plot(...)`, which hands
+matplotlib one point per block of the history. A view a few thousand pixels wide cannot show more than a minimum and
+a maximum per pixel column, so `LevelOfDetail` keeps exactly those, per bucket of rows, at a pyramid of bucket
+sizes. A query for a block range and a width picks the coarsest level that still has a bucket per pixel for that
+range, and only falls back to the full resolution rows once the range is about as narrow as the view.
+
+`lttb` (Largest Triangle Three Buckets) picks one point per bucket instead, for lines that should stay smooth.
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+DEFAULT_WIDTH = 1500
+BASE_BUCKET = 4
+LEVEL_FACTOR = 2
+
+
+def _bucket_extrema(values: np.ndarray, bucket: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows of the minimum and maximum of each bucket of `bucket` rows, NaN only where a bucket is all NaN."""
+    padding = -len(values) % bucket
+    padded = np.concatenate((values, np.full(padding, np.nan)))
+    low = np.where(np.isnan(padded), np.inf, padded).reshape(-1, bucket)
+    high = np.where(np.isnan(padded), -np.inf, padded).reshape(-1, bucket)
+    offsets = np.arange(0, len(padded), bucket)
+    rows = (offsets + low.argmin(axis=1), offsets + high.argmax(axis=1))
+    return np.minimum(rows[0], len(values) - 1), np.minimum(rows[1], len(values) - 1)
+
+
+def _merge_extrema(values: np.ndarray, extrema: np.ndarray, factor: int) -> np.ndarray:
+    """Extrema rows of the next level, each bucket merging `factor` buckets of the given level."""
+    padding = -extrema.shape[1] % factor
+    # Repeating the last bucket's rows does not change the extremes of the last merged bucket
+    padded = np.concatenate((extrema, np.repeat(extrema[:, -1:], padding, axis=1)), axis=1)
+    low, high = (padded[i].reshape(-1, factor) for i in range(2))
+    low_values = np.where(np.isnan(values[low]), np.inf, values[low])
+    high_values = np.where(np.isnan(values[high]), -np.inf, values[high])
+    return np.stack((np.take_along_axis(low, low_values.argmin(axis=1)[:, None], axis=1)[:, 0],
+                     np.take_along_axis(high, high_values.argmax(axis=1)[:, None], axis=1)[:, 0]))
+
+
+def min_max(values: np.ndarray, buckets: int) -> np.ndarray:
+    """Rows of the minimum and maximum of `values` in each of about `buckets` equal buckets, in row order."""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) <= 2 * buckets:
+        return np.arange(len(values))
+    low, high = _bucket_extrema(values, -(-len(values) // buckets))
+    return np.unique(np.concatenate((low, high)))
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Rows of `threshold` points of (x, y) chosen by Largest Triangle Three Buckets, in row order.
+
+    The first and last points are kept, in between each bucket keeps the point spanning the largest triangle with
+    the point kept in the previous bucket and the mean of the next bucket. NaN points are never picked.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.flatnonzero(~np.isnan(y))
+    if len(finite) <= max(threshold, 2):
+        return finite
+    x, y = x[finite], y[finite]
+    # Buckets between the fixed first and last points
+    edges = np.linspace(1, len(x) - 1, threshold - 1).astype(np.int64)
+    picked = np.empty(threshold, dtype=np.int64)
+    picked[0], picked[-1] = 0, len(x) - 1
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else len(x)
+        mean_x, mean_y = x[end:next_end].mean(), y[end:next_end].mean()
+        a = picked[i]
+        areas = np.abs((x[a] - mean_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (mean_y - y[a]))
+        picked[i + 1] = start + int(areas.argmax())
+    return finite[picked]
+
+
+class LevelOfDetail:
+    """Min/max pyramid over the columns of a block sorted frame, for plotting any block range at a given width."""
+
+    def __init__(self, df: DataFrame, x: str = "block", columns: Optional[Sequence[str]] = None,
+                 base_bucket: int = BASE_BUCKET, factor: int = LEVEL_FACTOR):
+        """
+        :param df: Frame sorted by `x`, e.g. the notebook's `oracle_df` or `prices_df.reset_index()`
+        :param columns: Columns to plot, all but `x` by default
+        :param base_bucket: Rows per bucket of the finest level
+        :param factor: Buckets of a level merged into one bucket of the next
+        """
+        self.x_name = x
+        self.x = df[x].to_numpy()
+        self.columns: Dict[str, np.ndarray] = {
+            name: df[name].to_numpy(dtype=np.float64) for name in (columns or [c for c in df.columns if c != x])}
+        self.bucket_sizes: List[int] = []
+        # levels[name][level] holds the rows of the minimum and the maximum of each bucket of that level
+        self.levels: Dict[str, List[np.ndarray]] = {name: [] for name in self.columns}
+        bucket = base_bucket
+        while len(self.x) > 2 * bucket:
+            self.bucket_sizes.append(bucket)
+            bucket *= factor
+        for name, values in self.columns.items():
+            if not self.bucket_sizes:
+                continue
+            levels = self.levels[name]
+            levels.append(np.stack(_bucket_extrema(values, base_bucket)))
+            while len(levels) < len(self.bucket_sizes):
+                levels.append(_merge_extrema(values, levels[-1], factor))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.nbytes for levels in self.levels.values() for level in levels)
+
+    def rows(self, start: Optional[float] = None, end: Optional[float] = None) -> slice:
+        """Rows with `x` from `start` to `end`, both inclusive, None for unbounded."""
+        first = 0 if start is None else int(np.searchsorted(self.x, start, side="left"))
+        last = len(self.x) if end is None else int(np.searchsorted(self.x, end, side="right"))
+        return slice(first, max(first, last))
+
+    def level_for(self, rows: int, width: int) -> Optional[int]:
+        """Coarsest level with at least `width` buckets over `rows` rows, None for the full resolution."""
+        level = None
+        for i, bucket in enumerate(self.bucket_sizes):
+            if rows // bucket >= width:
+                level = i
+        return level
+
+    def query_rows(self, start: Optional[float] = None, end: Optional[float] = None, width: int = DEFAULT_WIDTH,
+                   columns: Optional[Sequence[str]] = None) -> np.ndarray:
+        """Rows to plot for an `x` range at `width` pixels, keeping the extremes of every pixel column."""
+        rows = self.rows(start, end)
+        count = rows.stop - rows.start
+        level = self.level_for(count, width)
+        if level is None:
+            return np.arange(rows.start, rows.stop)
+
+        bucket = self.bucket_sizes[level]
+        first_full = -(-rows.start // bucket)
+        last_full = rows.stop // bucket
+        # The first and last rows keep the line spanning the whole range
+        picked = [np.array([rows.start, rows.stop - 1])]
+        for name in columns or self.columns:
+            picked.append(self.levels[name][level][:, first_full:last_full].ravel())
+            # The partial buckets at both ends only count the rows inside the range
+            for edge in (slice(rows.start, min(first_full * bucket, rows.stop)),
+                         slice(max(last_full * bucket, rows.start), rows.stop)):
+                if edge.start < edge.stop:
+                    picked.append(edge.start + np.concatenate(_bucket_extrema(self.columns[name][edge], bucket)))
+        return np.unique(np.concatenate(picked))
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None, width: int = DEFAULT_WIDTH,
+              columns: Optional[Sequence[str]] = None, method: str = "minmax") -> DataFrame:
+        """Frame of the rows to plot for an `x` range at `width` pixels.
+
+        :param method: "minmax" for the extremes of every pixel column, "lttb" for one point per pixel column of a
+            single column, picked from the min/max rows
+        """
+        columns = list(columns or self.columns)
+        if method not in ("minmax", "lttb"):
+            raise ValueError(f"Unknown downsampling method {method}")
+        if method == "lttb" and len(columns) != 1:
+            raise ValueError(f"LTTB downsamples a single column, not {columns}")
+        picked = self.query_rows(start, end, width if method == "minmax" else 2 * width, columns)
+        if method == "lttb":
+            picked = picked[lttb(self.x[picked], self.columns[columns[0]][picked], width)]
+        return pd.DataFrame({self.x_name: self.x[picked], **{name: self.columns[name][picked] for name in columns}})
+
+    def attach(self, ax, columns: Optional[Sequence[str]] = None, **plot_kwargs) -> list:
+        """Plot columns on matplotlib axes and re-query them whenever the view is zoomed or panned.
+
+        :return: The plotted lines
+        """
+        columns = list(columns or self.columns)
+
+        def width() -> int:
+            return max(1, int(ax.get_window_extent().width))
+
+        df = self.query(width=width(), columns=columns)
+        lines = [ax.plot(df[self.x_name], df[name], label=name, **plot_kwargs)[0] for name in columns]
+
+        def on_xlim_changed(axes):
+            start, end = axes.get_xlim()
+            view = self.query(start, end, width(), columns)
+            for line, name in zip(lines, columns):
+                line.set_data(view[self.x_name], view[name])
+
+        ax.callbacks.connect("xlim_changed", on_xlim_changed)
+        return lines
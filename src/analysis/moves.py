@@ -0,0 +1,164 @@
+"""Block and time range queries and the largest moves over the per-block swap history.
+
+The analysis notebook slices with boolean masks over the whole frame, e.g.
+`(16300300 <= prices_df.index) & (prices_df.index <= 16300450)`, and finds big moves by building `big_moves_df` for
+every block and sorting all of it. `MoveIndex` keeps the moves of the blocks with swaps in sorted arrays, so a range
+is two binary searches, and answers the top k of a range by partial selection. Per-segment maxima let large ranges
+skip every segment whose largest move cannot make the top k.
+"""
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from src.analysis.sparse_block_series import SparseBlockSeries
+
+IN_MOVES = ['amount0In_per_reserve0', 'amount1In_per_reserve1']
+NET_MOVES = ['amount0Net_per_reserve0', 'amount1Net_per_reserve1']
+MAX_IN = 'max_amountIn_per_reserve'
+MAX_NET = 'max_amountNet_per_reserve'
+MOVE_COLUMNS = IN_MOVES + NET_MOVES + [MAX_IN, MAX_NET]
+
+DEFAULT_SEGMENT_SIZE = 1024
+
+
+class MoveIndex:
+    """Moves relative to reserves at the blocks with swaps, the rows of the notebook's `big_moves_df` that are not 0."""
+
+    def __init__(self, blocks: np.ndarray, columns: Dict[str, np.ndarray], timestamps: Optional[np.ndarray] = None,
+                 segment_size: int = DEFAULT_SEGMENT_SIZE):
+        """
+        :param blocks: Sorted, unique block numbers
+        :param columns: float64 values at those blocks by column name
+        :param timestamps: Non decreasing UNIX timestamps of the blocks, for time range queries
+        :param segment_size: Rows per segment of the precomputed maxima
+        """
+        self.blocks = np.asarray(blocks, dtype=np.int64)
+        self.columns = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+        self.timestamps = None if timestamps is None else np.asarray(timestamps, dtype=np.int64)
+        self.segment_size = segment_size
+        self._segment_maxima: Dict[str, np.ndarray] = {}
+
+    @staticmethod
+    def from_series(series: SparseBlockSeries, timestamps: Optional[np.ndarray] = None,
+                    segment_size: int = DEFAULT_SEGMENT_SIZE) -> 'MoveIndex':
+        """Compute the notebook's `big_moves_df` columns at the series' blocks."""
+        amounts = series.columns
+        reserve0, reserve1 = amounts['reserve0'], amounts['reserve1']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            columns = {
+                'amount0In_per_reserve0': amounts['amount0In'] / reserve0,
+                'amount1In_per_reserve1': amounts['amount1In'] / reserve1,
+                'amount0Net_per_reserve0': (amounts['amount0In'] - amounts['amount0Out']) / reserve0,
+                'amount1Net_per_reserve1': (amounts['amount1In'] - amounts['amount1Out']) / reserve1,
+            }
+        # NaN is skipped, like DataFrame.max(axis=1)
+        columns[MAX_IN] = np.fmax(*(columns[name] for name in IN_MOVES))
+        columns[MAX_NET] = np.fmax(*(columns[name] for name in NET_MOVES))
+        return MoveIndex(series.blocks, columns, timestamps, segment_size)
+
+    @staticmethod
+    def from_swaps(state_df: DataFrame, timestamps: Optional[np.ndarray] = None,
+                   segment_size: int = DEFAULT_SEGMENT_SIZE) -> 'MoveIndex':
+        """Index the swap DataFrame of `ProcessStateToDF`, aggregated per block like the notebook's `block_df`."""
+        return MoveIndex.from_series(SparseBlockSeries.from_swaps(state_df), timestamps, segment_size)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def rows(self, start_block: Optional[int] = None, end_block: Optional[int] = None) -> slice:
+        """Rows of the blocks from `start_block` to `end_block`, both inclusive, None for unbounded."""
+        start = 0 if start_block is None else int(np.searchsorted(self.blocks, start_block, side='left'))
+        end = len(self.blocks) if end_block is None else int(np.searchsorted(self.blocks, end_block, side='right'))
+        return slice(start, max(start, end))
+
+    def time_rows(self, start_time: Optional[int] = None, end_time: Optional[int] = None) -> slice:
+        """Rows of the blocks with timestamps from `start_time` to `end_time`, both inclusive."""
+        if self.timestamps is None:
+            raise ValueError("The index has no block timestamps")
+        start = 0 if start_time is None else int(np.searchsorted(self.timestamps, start_time, side='left'))
+        end = len(self.blocks) if end_time is None else int(np.searchsorted(self.timestamps, end_time, side='right'))
+        return slice(start, max(start, end))
+
+    def frame(self, rows: slice) -> DataFrame:
+        """The moves of a range of rows, with their blocks and timestamps."""
+        data = {'block': self.blocks[rows]}
+        if self.timestamps is not None:
+            data['timestamp'] = self.timestamps[rows]
+        data.update({name: values[rows] for name, values in self.columns.items()})
+        return pd.DataFrame(data)
+
+    def block_range(self, start_block: Optional[int] = None, end_block: Optional[int] = None) -> DataFrame:
+        return self.frame(self.rows(start_block, end_block))
+
+    def time_range(self, start_time: Optional[int] = None, end_time: Optional[int] = None) -> DataFrame:
+        return self.frame(self.time_rows(start_time, end_time))
+
+    def segment_maxima(self, name: str) -> np.ndarray:
+        """Largest value of a column in each segment of `segment_size` rows, computed once per column.
+
+        NaN ranks below every value, as it sorts last in `sort_values(ascending=False)`.
+        """
+        if name not in self._segment_maxima:
+            values = self._ranked(name)
+            padding = -len(values) % self.segment_size
+            padded = np.concatenate((values, np.full(padding, -np.inf)))
+            self._segment_maxima[name] = padded.reshape(-1, self.segment_size).max(axis=1)
+        return self._segment_maxima[name]
+
+    def _ranked(self, name: str) -> np.ndarray:
+        values = self.columns[name]
+        return np.where(np.isnan(values), -np.inf, values)
+
+    def range_max(self, name: str, rows: slice) -> float:
+        """Largest value of a column in a range of rows, from the segment maxima and at most two partial segments."""
+        full, edges = self._split(rows)
+        ranked = self._ranked(name)
+        candidates = [ranked[edge] for edge in edges]
+        if full.start < full.stop:
+            candidates.append(self.segment_maxima(name)[full])
+        candidates = [values for values in candidates if len(values)]
+        return float(max(values.max() for values in candidates)) if candidates else np.nan
+
+    def _split(self, rows: slice) -> Tuple[slice, Tuple[slice, slice]]:
+        """Split rows into the segments they fully cover and the partial rows before and after those."""
+        size = self.segment_size
+        first_full = -(-rows.start // size)
+        last_full = rows.stop // size
+        if first_full >= last_full:
+            return slice(0, 0), (rows, slice(rows.stop, rows.stop))
+        return slice(first_full, last_full), (slice(rows.start, first_full * size), slice(last_full * size, rows.stop))
+
+    def top_rows(self, name: str, k: int, rows: slice) -> np.ndarray:
+        """Rows of the `k` largest values of a column in a range of rows, largest first."""
+        ranked = self._ranked(name)
+        full, edges = self._split(rows)
+        candidates = [np.arange(edge.start, edge.stop) for edge in edges]
+        if full.start < full.stop:
+            maxima = self.segment_maxima(name)[full]
+            segments = np.arange(full.start, full.stop)
+            if len(maxima) > k:
+                # Each of the k segments with the largest maxima holds a value at least as large as the k-th of
+                # those maxima, so segments with a smaller maximum cannot hold any of the top k
+                threshold = np.partition(maxima, len(maxima) - k)[len(maxima) - k]
+                segments = segments[maxima >= threshold]
+            offsets = np.arange(self.segment_size)
+            candidates.append((segments[:, None] * self.segment_size + offsets).ravel())
+        candidates = np.concatenate(candidates)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-ranked[candidates], k - 1)[:k]]
+        # Largest first, ties by block
+        return candidates[np.lexsort((candidates, -ranked[candidates]))]
+
+    def top_moves(self, k: int = 10, start_block: Optional[int] = None, end_block: Optional[int] = None,
+                  by: str = MAX_NET) -> DataFrame:
+        """The `k` largest moves between two blocks, like sorting `big_moves_df` over the range and taking the head.
+
+        :param by: Column to rank by, `max_amountNet_per_reserve` or `max_amountIn_per_reserve` for the largest
+            net or in moves, or any single token column
+        """
+        if k <= 0:
+            return self.frame(slice(0, 0))
+        return self.frame(self.top_rows(by, k, self.rows(start_block, end_block))).reset_index(drop=True)
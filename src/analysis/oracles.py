@@ -0,0 +1,145 @@
+"""Evaluate many oracle kinds and window sizes over a pair's history in one sweep.
+
+`OracleBuilder` in the analysis notebook recomputes reserve ratios, logs and cumulative sums in every `add_*`
+call and handles one window per call. `OracleEngine` computes each prefix sum once as float64 NumPy and turns
+any number of windows into differences of prefix sums with a single broadcast, so a grid of windows costs little
+more than one window.
+
+Column names match those of `OracleBuilder`, e.g. `twap_30_x_per_y`.
+"""
+
+import math
+from typing import Dict, Iterable, Sequence, Union
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from src.analysis.sparse_block_series import SparseBlockSeries
+
+TWAP = "twap"
+GEOM_TWAP = "geom_twap"
+VWAP = "vwap"
+PROPOSED = "proposed"
+ALL_KINDS = (TWAP, GEOM_TWAP, VWAP, PROPOSED)
+
+TICK_LOG = math.log(1.0001)
+
+
+def minutes_to_blocks(minutes: int) -> int:
+    return minutes * 5  # minutes * 60 second / 12 second per block
+
+
+def _ffill(values: np.ndarray) -> np.ndarray:
+    """Forward fill NaNs, leading NaNs stay."""
+    positions = np.where(np.isnan(values), -1, np.arange(len(values)))
+    np.maximum.accumulate(positions, out=positions)
+    filled = values[np.maximum(positions, 0)]
+    return np.where(positions < 0, np.nan, filled)
+
+
+class OracleEngine:
+    """Oracles of every requested kind and window over a block frame or a sparse block series.
+
+    With a dense block frame (one row per block, like `block_df` in the notebook) every row gets a value.
+    With a `SparseBlockSeries` values are given at event blocks only, the `proposed` oracle needs the dense frame.
+    """
+
+    def __init__(self, blocks: Union[DataFrame, SparseBlockSeries]):
+        self.sparse = isinstance(blocks, SparseBlockSeries)
+        self._prefix_sums: Dict[str, np.ndarray] = {}
+        if self.sparse:
+            if 'tick' not in blocks.columns:
+                blocks.with_prices()
+            self.series = blocks
+            self.block_numbers = blocks.blocks
+        else:
+            self.block_df = blocks
+            self.block_numbers = blocks['block'].to_numpy()
+
+    def _dense_column(self, name: str) -> np.ndarray:
+        df = self.block_df
+        if name in ('reserve0', 'reserve1', 'amount0In', 'amount1In', 'amount0Out', 'amount1Out'):
+            return df[name].to_numpy(dtype=np.float64)
+        if name == 'x_per_y':
+            return self._dense_column('reserve0') / self._dense_column('reserve1')
+        if name == 'tick':
+            return np.log(self._dense_column('x_per_y')) / TICK_LOG
+        if name == 'volume0':
+            return self._dense_column('amount0In') + self._dense_column('amount0Out')
+        if name == 'volume1':
+            return self._dense_column('amount1In') + self._dense_column('amount1Out')
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if name == 'tick_0In_1Out':
+                amount1_out = self._dense_column('amount1Out')
+                ratio = self._dense_column('amount0In') / np.where(amount1_out == 0, np.nan, amount1_out)
+                return np.log(_ffill(ratio)) / TICK_LOG
+            if name == 'tick_1In_0Out':
+                amount1_in = self._dense_column('amount1In')
+                ratio = self._dense_column('amount0Out') / np.where(amount1_in == 0, np.nan, amount1_in)
+                return np.log(_ffill(ratio)) / TICK_LOG
+        raise KeyError(name)
+
+    def prefix_sum(self, name: str) -> np.ndarray:
+        """Cumulative sum of a dense column with a leading zero, NaNs are skipped like pandas' cumsum does."""
+        if name not in self._prefix_sums:
+            values = self._dense_column(name)
+            self._prefix_sums[name] = np.concatenate(([0.0], np.nancumsum(values)))
+            if np.isnan(values).any():
+                self._prefix_sums[name + ':nan'] = np.concatenate(([False], np.isnan(values)))
+        return self._prefix_sums[name]
+
+    def window_sums(self, name: str, windows: np.ndarray) -> np.ndarray:
+        """Sum of a column over each window ending at every row.
+
+        :return: array of shape (rows, windows), NaN where a window reaches before the first block
+        """
+        if self.sparse:
+            ends = self.block_numbers[:, None]
+            return self.series.window_sum(name, ends, windows[None, :])
+
+        prefix = self.prefix_sum(name)
+        rows = np.arange(1, len(prefix))[:, None]
+        starts = rows - windows[None, :]
+        # Like `cumsum - cumsum.shift(window)`, the first `window` rows have no value
+        valid = starts >= 1
+        clipped = np.maximum(starts, 0)
+        sums = np.where(valid, prefix[rows] - prefix[clipped], np.nan)
+        nan_rows = self._prefix_sums.get(name + ':nan')
+        if nan_rows is not None:
+            # pandas keeps NaN at rows whose own value was NaN
+            sums = np.where(nan_rows[rows] | nan_rows[clipped], np.nan, sums)
+        return sums
+
+    def evaluate(self, minutes: Iterable[int], kinds: Sequence[str] = ALL_KINDS) -> DataFrame:
+        """All requested oracle kinds for all window sizes.
+
+        :param minutes: Window sizes in minutes
+        :param kinds: Any of TWAP, GEOM_TWAP, VWAP and PROPOSED
+        :return: Wide frame with a `block` column and one column per kind and window
+        """
+        minutes = list(minutes)
+        windows = np.array([minutes_to_blocks(m) for m in minutes], dtype=np.int64)
+        columns = {'block': self.block_numbers}
+
+        def add(template, values):
+            for i, m in enumerate(minutes):
+                columns[template.format(m)] = values[:, i]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if TWAP in kinds:
+                add("twap_{}_x_per_y", self.window_sums('x_per_y', windows) / windows)
+            if GEOM_TWAP in kinds:
+                add("geom_twap_{}_x_per_y", np.power(1.0001, self.window_sums('tick', windows) / windows))
+            if VWAP in kinds:
+                volume1 = self.window_sums('volume1', windows)
+                add("vwap_{}_x_per_y", self.window_sums('volume0', windows) / np.where(volume1 == 0, np.nan, volume1))
+            if PROPOSED in kinds:
+                if self.sparse:
+                    raise ValueError("The proposed oracle needs a dense block frame")
+                add("proposed_0In_1Out_oracle_{}",
+                    np.power(1.0001, self.window_sums('tick_0In_1Out', windows) / windows))
+                add("proposed_1In_0Out_oracle_{}",
+                    np.power(1.0001, self.window_sums('tick_1In_0Out', windows) / windows))
+
+        return pd.DataFrame(columns)
@@ -0,0 +1,164 @@
+"""Payout surfaces of liquidity and borrow portfolios over price changes, APYs and days.
+
+`get_princ_perc` in the payout charts notebook evaluates one portfolio over a price change grid and `make_heat_df`
+adds the interest of one APY day by day. `payout_surface` evaluates any number of portfolios, price changes, APYs and
+days in one broadcast, optionally in chunks of portfolios to cap the memory of each evaluation.
+
+A portfolio is given by its six positions, as in the notebook: `dl` and `bl` deposited and borrowed liquidity,
+`dx` and `bx` deposited and borrowed X, `dy` and `by` deposited and borrowed Y, all valued in X at the start price.
+"""
+
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from pandas import DataFrame
+
+POSITIONS = ("dl", "bl", "dx", "bx", "dy", "by")
+DAYS_PER_YEAR = 365
+
+
+class Portfolio(NamedTuple):
+    dl: float = 0.0
+    bl: float = 0.0
+    dx: float = 0.0
+    bx: float = 0.0
+    dy: float = 0.0
+    by: float = 0.0
+
+
+# The portfolios plotted in the payout charts notebook
+EXAMPLES: Dict[str, Portfolio] = {
+    "Market Making": Portfolio(dl=1),
+    "Leveraged Market Making": Portfolio(dl=10, bx=4.5, by=4.5),
+    "Delta Nuetral Market Making": Portfolio(dl=1, by=1 / 2),
+    "Short Market Making": Portfolio(dl=3, by=2),
+    "Long Market Making": Portfolio(dl=3, bx=2),
+    "Long Straddle": Portfolio(bl=1, dx=1.5, dy=0.5),
+    "Leveraged Long Straddle": Portfolio(bl=5, dx=3.5, dy=2.5),
+}
+
+Portfolios = Union[Portfolio, Sequence[Portfolio], np.ndarray, DataFrame]
+
+
+def portfolio_array(portfolios: Portfolios) -> np.ndarray:
+    """Portfolios as a float64 array of shape (portfolios, 6) with columns in the order of `POSITIONS`.
+
+    :param portfolios: A `Portfolio`, a sequence of them, an array of rows or a DataFrame with position columns
+    """
+    if isinstance(portfolios, DataFrame):
+        return portfolios.reindex(columns=list(POSITIONS), fill_value=0.0).to_numpy(dtype=np.float64)
+    if isinstance(portfolios, Portfolio):
+        portfolios = [portfolios]
+    array = np.asarray(portfolios, dtype=np.float64)
+    if array.ndim != 2 or array.shape[1] != len(POSITIONS):
+        raise ValueError(f"Portfolios must have shape (n, {len(POSITIONS)}), not {array.shape}")
+    return array
+
+
+def portfolio_grid(**positions: Iterable[float]) -> DataFrame:
+    """Every combination of the given position values, one portfolio per row.
+
+    E.g. `portfolio_grid(dl=np.linspace(1, 10, 50), bx=np.linspace(0, 5, 50), by=np.linspace(0, 5, 50))` gives
+    125000 portfolios. Positions not given are 0.
+    """
+    unknown = set(positions) - set(POSITIONS)
+    if unknown:
+        raise ValueError(f"Unknown positions {sorted(unknown)}, expected some of {POSITIONS}")
+    values = [np.asarray(list(positions.get(name, [0.0])), dtype=np.float64) for name in POSITIONS]
+    grid = np.stack([axis.ravel() for axis in np.meshgrid(*values, indexing="ij")], axis=1)
+    return DataFrame(grid, columns=list(POSITIONS))
+
+
+def daily_rate(apy: Union[float, np.ndarray]) -> Union[float, np.ndarray]:
+    """Daily rate compounding to `apy` over a year."""
+    return (np.asarray(apy, dtype=np.float64) + 1) ** (1 / DAYS_PER_YEAR) - 1
+
+
+def principal_change(portfolios: Portfolios, percent: np.ndarray) -> np.ndarray:
+    """Relative change of each portfolio's value for each price change, like the notebook's `get_princ_perc`.
+
+    Portfolios without principal give inf or NaN.
+
+    :return: Array of shape (portfolios, price changes)
+    """
+    positions = portfolio_array(portfolios)
+    percent = np.asarray(percent, dtype=np.float64)
+    dl, bl, dx, bx, dy, by = (positions[:, i, None] for i in range(len(POSITIONS)))
+    liquidity, x, y = dl - bl, dx - bx, dy - by
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (liquidity * np.sqrt(1 + percent) + x + y * (1 + percent)) / (liquidity + x + y) - 1
+
+
+def _chunk_rows(row_size: int, max_bytes: Optional[int]) -> Optional[int]:
+    return None if max_bytes is None else max(1, max_bytes // max(1, row_size * np.dtype(np.float64).itemsize))
+
+
+def iter_payout_chunks(portfolios: Portfolios, percent: np.ndarray, apys: Union[float, np.ndarray],
+                       days: Union[int, np.ndarray], max_bytes: Optional[int] = None
+                       ) -> Iterator[Tuple[slice, np.ndarray]]:
+    """Payout surface in chunks of portfolios, for reductions over sweeps too large to hold at once.
+
+    :param days: Day horizons, or a number of days for `range(days)` like `make_heat_df`
+    :param max_bytes: Largest chunk, None for a single chunk
+    :return: Iterator of (slice of the portfolios, payouts of shape (chunk, price changes, APYs, days))
+    """
+    positions = portfolio_array(portfolios)
+    percent = np.asarray(percent, dtype=np.float64)
+    rates = np.atleast_1d(daily_rate(apys))
+    days = np.arange(days, dtype=np.float64) if np.ndim(days) == 0 else np.asarray(days, dtype=np.float64)
+    # Interest of each APY and day, shared by all portfolios and price changes
+    interest = rates[:, None] * days[None, :]
+
+    rows = _chunk_rows(len(percent) * interest.size, max_bytes) or max(1, len(positions))
+    for start in range(0, len(positions), rows):
+        chunk = slice(start, min(start + rows, len(positions)))
+        changes = principal_change(positions[chunk], percent)
+        yield chunk, changes[:, :, None, None] + interest[None, None, :, :]
+
+
+def payout_surface(portfolios: Portfolios, percent: np.ndarray, apys: Union[float, np.ndarray],
+                   days: Union[int, np.ndarray], max_bytes: Optional[int] = None) -> np.ndarray:
+    """Portfolio change for every portfolio, price change, APY and day.
+
+    The value after `d` days is the price change payout plus `d` days of interest at the daily rate of the APY,
+    as in the notebook's heat map.
+
+    :param max_bytes: Evaluate in chunks of at most this size, the result itself is allocated once
+    :return: Array of shape (portfolios, price changes, APYs, days)
+    """
+    positions = portfolio_array(portfolios)
+    percent = np.asarray(percent, dtype=np.float64)
+    apy_count = np.size(apys)
+    day_count = int(days) if np.ndim(days) == 0 else len(days)
+    surface = np.empty((len(positions), len(percent), apy_count, day_count), dtype=np.float64)
+    for chunk, payouts in iter_payout_chunks(positions, percent, apys, days, max_bytes):
+        surface[chunk] = payouts
+    return surface
+
+
+def heat_frame(portfolio: Portfolio, percent: np.ndarray, apy: float, days: int) -> DataFrame:
+    """One portfolio's payout by price change (index) and day (columns), the notebook's `make_heat_df`."""
+    surface = payout_surface(portfolio, percent, apy, days)[0, :, 0, :]
+    return DataFrame(surface, index=percent, columns=range(days))
+
+
+def summarize(portfolios: Portfolios, percent: np.ndarray, apys: Union[float, np.ndarray],
+              days: Union[int, np.ndarray], max_bytes: Optional[int] = 2 ** 28) -> DataFrame:
+    """Worst, best and mean payout of each portfolio over all price changes, APYs and days.
+
+    Evaluated chunk by chunk, so sweeps of any size fit in `max_bytes` of payouts at a time.
+
+    :return: One row per portfolio with its positions and `min`, `max` and `mean` columns
+    """
+    positions = portfolio_array(portfolios)
+    stats = np.empty((len(positions), 3), dtype=np.float64)
+    for chunk, payouts in iter_payout_chunks(positions, percent, apys, days, max_bytes):
+        flat = payouts.reshape(len(payouts), -1)
+        # Portfolios without principal are NaN rather than a warning
+        with np.errstate(invalid="ignore"):
+            stats[chunk, 0] = flat.min(axis=1)
+            stats[chunk, 1] = flat.max(axis=1)
+            stats[chunk, 2] = flat.mean(axis=1)
+    summary = DataFrame(positions, columns=list(POSITIONS))
+    summary[["min", "max", "mean"]] = stats
+    return summary
@@ -0,0 +1,165 @@
+"""Per-block pair data stored only at the blocks where something happened.
+
+The analysis notebook reindexes swaps onto every block between the first and the last swap and backfills the
+reserves, which mostly stores empty blocks. `SparseBlockSeries` keeps one row per block with swaps and the number
+of dense blocks the row stands for, and answers the same questions from cumulative sums:
+
+* step columns (reserves, prices) hold their value over the whole run of blocks ending at the row's block,
+  the same as backfilling the dense frame
+* point columns (swap amounts) only have a value at the row's block, zero on the empty blocks in between
+"""
+
+import math
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+STEP = "step"
+POINT = "point"
+
+AMOUNT_COLUMNS = ['amount0In', 'amount1In', 'amount0Out', 'amount1Out']
+RESERVE_COLUMNS = ['reserve0', 'reserve1']
+
+TICK_LOG = math.log(1.0001)
+
+
+class SparseBlockSeries:
+    """Block series holding values only at event blocks, plus the run length each one covers."""
+
+    def __init__(self, blocks: np.ndarray, columns: Dict[str, np.ndarray], fills: Dict[str, str]):
+        """
+        :param blocks: Sorted, unique block numbers with events
+        :param columns: float64 values at those blocks by column name
+        :param fills: STEP or POINT by column name, how the column behaves on the blocks between rows
+        """
+        self.blocks = np.asarray(blocks, dtype=np.int64)
+        self.columns = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+        self.fills = dict(fills)
+        # Row i stands for the dense blocks (blocks[i - 1], blocks[i]], the first row only for itself
+        self.run_lengths = np.diff(self.blocks, prepend=self.blocks[0] - 1) if len(self.blocks) else self.blocks
+        self._prefix_sums: Dict[str, np.ndarray] = {}
+
+    @staticmethod
+    def from_swaps(state_df: DataFrame) -> 'SparseBlockSeries':
+        """Aggregate the swap DataFrame of `ProcessStateToDF` per block.
+
+        Amounts are summed over the swaps of a block, reserves are those before the first swap of the block.
+        """
+        block_df = state_df[['block'] + AMOUNT_COLUMNS + RESERVE_COLUMNS].copy()
+        block_df['block'] = block_df['block'].astype(np.int64)
+        block_df = block_df.groupby('block', sort=True).agg(
+            {**{column: 'sum' for column in AMOUNT_COLUMNS}, **{column: 'first' for column in RESERVE_COLUMNS}})
+        columns = {column: block_df[column].astype(float).to_numpy() for column in AMOUNT_COLUMNS + RESERVE_COLUMNS}
+        fills = {**{column: POINT for column in AMOUNT_COLUMNS}, **{column: STEP for column in RESERVE_COLUMNS}}
+        return SparseBlockSeries(block_df.index.to_numpy(), columns, fills)
+
+    def __len__(self):
+        return len(self.blocks)
+
+    @property
+    def first_block(self) -> int:
+        return int(self.blocks[0])
+
+    @property
+    def last_block(self) -> int:
+        return int(self.blocks[-1])
+
+    @property
+    def nbytes(self) -> int:
+        return self.blocks.nbytes + self.run_lengths.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    def with_column(self, name: str, values: np.ndarray, fill: str) -> 'SparseBlockSeries':
+        """Add a column derived from the others, e.g. a price from the reserves."""
+        self.columns[name] = np.asarray(values, dtype=np.float64)
+        self.fills[name] = fill
+        self._prefix_sums.pop(name, None)
+        return self
+
+    def with_prices(self) -> 'SparseBlockSeries':
+        """Add the reserve price, its tick and the traded volumes the oracles are built from."""
+        price = self.columns['reserve0'] / self.columns['reserve1']
+        self.with_column('x_per_y', price, STEP)
+        self.with_column('y_per_x', 1 / price, STEP)
+        self.with_column('tick', np.log(price) / TICK_LOG, STEP)
+        self.with_column('volume0', self.columns['amount0In'] + self.columns['amount0Out'], POINT)
+        self.with_column('volume1', self.columns['amount1In'] + self.columns['amount1Out'], POINT)
+        return self
+
+    def prefix_sum(self, name: str) -> np.ndarray:
+        """Sum of a column over all dense blocks up to and including each row's block.
+
+        Computed once per column, with a leading zero so that `prefix[i]` covers rows before i.
+        """
+        if name not in self._prefix_sums:
+            values = self.columns[name]
+            weighted = values * self.run_lengths if self.fills[name] == STEP else values
+            self._prefix_sums[name] = np.concatenate(([0.0], np.cumsum(weighted)))
+        return self._prefix_sums[name]
+
+    def cumulative(self, name: str, block_numbers) -> np.ndarray:
+        """Sum of a column over the dense blocks from the first block up to and including each given block."""
+        block_numbers = np.asarray(block_numbers, dtype=np.int64)
+        prefix = self.prefix_sum(name)
+        if self.fills[name] == POINT:
+            return prefix[np.searchsorted(self.blocks, block_numbers, side='right')]
+
+        # The run containing the block ends at the first row at or after it
+        row = np.searchsorted(self.blocks, block_numbers, side='left')
+        clipped = np.minimum(row, len(self.blocks) - 1)
+        run_start = self.blocks[clipped] - self.run_lengths[clipped]
+        partial = self.columns[name][clipped] * np.clip(block_numbers - run_start, 0, None)
+        result = prefix[clipped] + partial
+        # Past the last row the step column has no value left to add
+        return np.where(row >= len(self.blocks), prefix[-1], result)
+
+    def window_sum(self, name: str, block_numbers, window: int) -> np.ndarray:
+        """Block weighted sum of a column over the `window` blocks ending at each given block.
+
+        NaN where the window reaches before the first block, like `cumsum - cumsum.shift(window)` on the dense frame.
+        """
+        block_numbers = np.asarray(block_numbers, dtype=np.int64)
+        sums = self.cumulative(name, block_numbers) - self.cumulative(name, block_numbers - window)
+        return np.where(block_numbers - window < self.first_block, np.nan, sums)
+
+    def as_of(self, name: str, block_numbers) -> np.ndarray:
+        """Value of a column at each given block, as the dense frame would have it.
+
+        NaN outside of the series' block range.
+        """
+        block_numbers = np.asarray(block_numbers, dtype=np.int64)
+        row = np.searchsorted(self.blocks, block_numbers, side='left')
+        clipped = np.minimum(row, len(self.blocks) - 1)
+        values = self.columns[name][clipped]
+        if self.fills[name] == POINT:
+            values = np.where(self.blocks[clipped] == block_numbers, values, 0.0)
+        outside = (block_numbers < self.first_block) | (row >= len(self.blocks))
+        return np.where(outside, np.nan, values)
+
+    def densify(self, start_block: Optional[int] = None, end_block: Optional[int] = None) -> DataFrame:
+        """One row per block of a sub-range, equal to the notebook's dense block frame over that range."""
+        start_block = self.first_block if start_block is None else max(start_block, self.first_block)
+        end_block = self.last_block if end_block is None else min(end_block, self.last_block)
+        block_numbers = np.arange(start_block, end_block + 1)
+        dense = {'block': block_numbers}
+        for name in self.columns:
+            dense[name] = self.as_of(name, block_numbers)
+        return pd.DataFrame(dense)
+
+    def twap(self, window: int, block_numbers=None) -> np.ndarray:
+        """Block weighted average of the reserve price (x per y) over `window` blocks, at event blocks by default."""
+        block_numbers = self.blocks if block_numbers is None else block_numbers
+        return self.window_sum('x_per_y', block_numbers, window) / window
+
+    def geom_twap(self, window: int, block_numbers=None) -> np.ndarray:
+        """Geometric mean of the reserve price over `window` blocks, through the average tick."""
+        block_numbers = self.blocks if block_numbers is None else block_numbers
+        return np.power(1.0001, self.window_sum('tick', block_numbers, window) / window)
+
+    def vwap(self, window: int, block_numbers=None) -> np.ndarray:
+        """Volume weighted price over `window` blocks, NaN for windows without volume."""
+        block_numbers = self.blocks if block_numbers is None else block_numbers
+        volume1 = self.window_sum('volume1', block_numbers, window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(volume1 == 0, np.nan, self.window_sum('volume0', block_numbers, window) / volume1)
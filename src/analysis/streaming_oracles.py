@@ -0,0 +1,283 @@
+"""TWAP, geometric TWAP and VWAP kept up to date block by block while the scanner runs.
+
+Every block with events adds one checkpoint of cumulative sums: the block weighted sums of the reserve price and
+its tick, and the running swap volumes. Between checkpoints the price is constant, so the cumulative sum at any
+block follows from the checkpoint before it. A window is the difference of two cumulative sums, so each update and
+each oracle value costs the same whatever the window size or history length. Only checkpoints that a window or a
+reorg can still reach are kept. They are dropped in batches rather than kept in a fixed size ring buffer, as blocks
+without events have no checkpoint, so the cost per block is constant amortised.
+
+`StreamingOracleState.save` writes the checkpoints next to the wrapped state's file and `restore` reads them back,
+so a resumed scan continues the windows instead of starting them from empty.
+
+The price of block b is the price entering it, set by the last Sync of an earlier block, as in the notebook's
+backfilled block frame.
+"""
+
+import bisect
+import datetime
+import json
+import logging
+import math
+import os
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from eth_utils import to_checksum_address
+from web3.datastructures import AttributeDict
+
+from src.local_node.event_scanner import EventScannerState
+
+logger = logging.getLogger(__name__)
+
+TICK_LOG = math.log(1.0001)
+
+TWAP = "twap"
+GEOM_TWAP = "geom_twap"
+VWAP = "vwap"
+
+
+class Checkpoint(NamedTuple):
+    block: int
+    # Cumulative sums through `block`, inclusive
+    price_sum: float
+    tick_sum: float
+    volume0: float
+    volume1: float
+    # Price in force after the last Sync of `block`
+    price: float
+    tick: float
+
+
+class StreamingOracle:
+    """Incremental oracles over fixed windows, fed one block of Sync and Swap events at a time."""
+
+    def __init__(self, windows: Iterable[int], max_reorg_depth: int = 64):
+        """
+        :param windows: Window sizes in blocks
+        :param max_reorg_depth: How many blocks back `rollback` must be able to go
+        """
+        self.windows = sorted(set(windows))
+        self.max_reorg_depth = max_reorg_depth
+        self.checkpoints: List[Checkpoint] = []
+        self.checkpoint_blocks: List[int] = []
+        # Checkpoints dropped from the front, kept to tell a too deep rollback apart
+        self.pruned_to_block: Optional[int] = None
+
+    @property
+    def head_block(self) -> Optional[int]:
+        return self.checkpoint_blocks[-1] if self.checkpoint_blocks else None
+
+    @property
+    def first_block(self) -> Optional[int]:
+        """First block with a known entering price, windows may not reach before it."""
+        return self.checkpoint_blocks[0] + 1 if self.checkpoints and self.pruned_to_block is None else (
+            self.pruned_to_block)
+
+    def update_block(self, block_number: int, events: Iterable[dict]):
+        """Add the Sync and Swap events of one block, blocks must come in increasing order.
+
+        :param events: Decoded events of the block in log index order
+        """
+        volume0 = volume1 = 0
+        reserves = None
+        for event in events:
+            args = event["args"]
+            if event["event"] == "Sync":
+                reserves = (args["reserve0"], args["reserve1"])
+            elif event["event"] == "Swap":
+                volume0 += args["amount0In"] + args["amount0Out"]
+                volume1 += args["amount1In"] + args["amount1Out"]
+        self.add_block(block_number, volume0, volume1, reserves)
+
+    def add_block(self, block_number: int, volume0: float, volume1: float, reserves: Optional[tuple]):
+        """Add a block from its swap volumes and the reserves of its last Sync, None if it had no Sync."""
+        previous = self.checkpoints[-1] if self.checkpoints else None
+        if previous is not None and block_number <= previous.block:
+            raise ValueError(f"Block {block_number} is not after the last processed block {previous.block}")
+
+        if previous is None:
+            if reserves is None:
+                # Nothing to anchor the price on yet
+                return
+            price_sum = tick_sum = 0.0
+            cumulative0 = cumulative1 = 0.0
+            price = tick = math.nan
+        else:
+            blocks = block_number - previous.block
+            price_sum = previous.price_sum + previous.price * blocks
+            tick_sum = previous.tick_sum + previous.tick * blocks
+            cumulative0 = previous.volume0 + volume0
+            cumulative1 = previous.volume1 + volume1
+            price, tick = previous.price, previous.tick
+
+        if reserves is not None:
+            price = reserves[0] / reserves[1]
+            tick = math.log(price) / TICK_LOG
+        self.checkpoints.append(Checkpoint(block_number, price_sum, tick_sum, float(cumulative0), float(cumulative1),
+                                           price, tick))
+        self.checkpoint_blocks.append(block_number)
+        self._prune()
+
+    def _prune(self):
+        """Drop checkpoints no window or rollback can reach anymore."""
+        keep_from = self.head_block - self.windows[-1] - self.max_reorg_depth
+        # The checkpoint at or before `keep_from` is still needed to interpolate up to it
+        index = bisect.bisect_right(self.checkpoint_blocks, keep_from) - 1
+        # Compact in batches so pruning stays amortised constant time
+        if index > 1024 and index > len(self.checkpoints) // 2:
+            self.pruned_to_block = self.checkpoint_blocks[index] + 1
+            del self.checkpoints[:index]
+            del self.checkpoint_blocks[:index]
+
+    def _cumulative(self, block_number: int) -> Optional[Checkpoint]:
+        """Cumulative sums through a block, interpolated from the checkpoint at or before it."""
+        index = bisect.bisect_right(self.checkpoint_blocks, block_number) - 1
+        if index < 0:
+            return None
+        checkpoint = self.checkpoints[index]
+        blocks = block_number - checkpoint.block
+        return checkpoint._replace(price_sum=checkpoint.price_sum + checkpoint.price * blocks,
+                                   tick_sum=checkpoint.tick_sum + checkpoint.tick * blocks)
+
+    def value(self, kind: str, window: int, block_number: Optional[int] = None) -> float:
+        """Oracle value over the `window` blocks ending at `block_number`, the last processed block by default.
+
+        NaN while the window reaches before the first block with a known price.
+        """
+        block_number = self.head_block if block_number is None else block_number
+        if block_number is None or self.first_block is None or block_number - window < self.first_block - 1:
+            return math.nan
+        end = self._cumulative(block_number)
+        start = self._cumulative(block_number - window)
+        if kind == TWAP:
+            return (end.price_sum - start.price_sum) / window
+        if kind == GEOM_TWAP:
+            return 1.0001 ** ((end.tick_sum - start.tick_sum) / window)
+        if kind == VWAP:
+            volume1 = end.volume1 - start.volume1
+            return (end.volume0 - start.volume0) / volume1 if volume1 else math.nan
+        raise ValueError(f"Unknown oracle kind {kind}")
+
+    def values(self, block_number: Optional[int] = None) -> Dict[str, float]:
+        """Every kind for every window, named like the columns of `OracleEngine`."""
+        values = {}
+        for window in self.windows:
+            values[f"twap_{window}_x_per_y"] = self.value(TWAP, window, block_number)
+            values[f"geom_twap_{window}_x_per_y"] = self.value(GEOM_TWAP, window, block_number)
+            values[f"vwap_{window}_x_per_y"] = self.value(VWAP, window, block_number)
+        return values
+
+    def rollback(self, since_block: int):
+        """Forget every block from `since_block` on, after a chain reorganisation."""
+        if self.pruned_to_block is not None and since_block < self.pruned_to_block:
+            raise ValueError(f"Cannot roll back to block {since_block}, history was pruned up to "
+                             f"{self.pruned_to_block}, raise max_reorg_depth")
+        index = bisect.bisect_left(self.checkpoint_blocks, since_block)
+        del self.checkpoints[index:]
+        del self.checkpoint_blocks[index:]
+
+    def to_dict(self) -> dict:
+        return {"pruned_to_block": self.pruned_to_block, "checkpoints": [list(c) for c in self.checkpoints]}
+
+    def load_dict(self, data: dict):
+        """Replace the checkpoints with those of `to_dict`."""
+        self.pruned_to_block = data["pruned_to_block"]
+        self.checkpoints = [Checkpoint(*checkpoint) for checkpoint in data["checkpoints"]]
+        self.checkpoint_blocks = [checkpoint.block for checkpoint in self.checkpoints]
+
+
+class StreamingOracleState(EventScannerState):
+    """Feed the events the scanner hands to a state into streaming oracles as well.
+
+    Events are grouped per block and added once the block is complete, `delete_data` rolls the oracles back.
+    """
+
+    def __init__(self, state: EventScannerState, oracles: Dict[str, StreamingOracle], path: Optional[str] = None):
+        """
+        :param state: State that stores the events
+        :param oracles: Oracle by pair address
+        :param path: Where `save` keeps the oracles, next to the file of `state` by default, if it has one
+        """
+        self.state = state
+        self.oracles = {to_checksum_address(address): oracle for address, oracle in oracles.items()}
+        state_path = getattr(state, "path", None)
+        self.path = path or (state_path + ".oracles.json" if state_path else None)
+        self.pending_block: Optional[int] = None
+        self.pending_events: Dict[str, list] = {}
+
+    def _flush(self):
+        if self.pending_block is not None:
+            for address, events in self.pending_events.items():
+                self.oracles[address].update_block(self.pending_block, events)
+        self.pending_block = None
+        self.pending_events = {}
+
+    def save(self):
+        """Save the oracles through the last scanned block, then the wrapped state."""
+        if self.path is not None:
+            data = {"last_scanned_block": self.state.get_last_scanned_block(),
+                    "oracles": {address: oracle.to_dict() for address, oracle in self.oracles.items()}}
+            with open(self.path + ".tmp", "wt") as f:
+                json.dump(data, f)
+            os.replace(self.path + ".tmp", self.path)
+        self.state.save()
+
+    def restore(self):
+        """Restore the wrapped state and the oracles, and line them up on the same last scanned block.
+
+        The wrapped state may have saved on its own after the oracles, e.g. `JSONifiedState` every minute in
+        `end_chunk`. Its blocks the oracles have not seen are deleted so they are scanned again.
+        """
+        self.state.restore()
+        last_scanned_block = self.state.get_last_scanned_block()
+        if self.path is None or not os.path.exists(self.path):
+            if last_scanned_block:
+                logger.warning("No saved oracles, windows start from block %d", last_scanned_block + 1)
+            return
+        with open(self.path, "rt") as f:
+            data = json.load(f)
+        for address, oracle in data["oracles"].items():
+            if address in self.oracles:
+                self.oracles[address].load_dict(oracle)
+        if data["last_scanned_block"] < last_scanned_block:
+            logger.info("Rescanning from block %d for the oracles", data["last_scanned_block"] + 1)
+            self.state.delete_data(data["last_scanned_block"] + 1)
+        elif data["last_scanned_block"] > last_scanned_block:
+            for oracle in self.oracles.values():
+                oracle.rollback(last_scanned_block + 1)
+
+    #
+    # EventScannerState methods implemented below
+    #
+
+    def get_last_scanned_block(self) -> int:
+        return self.state.get_last_scanned_block()
+
+    def start_chunk(self, block_number: int, chunk_size: int):
+        self.state.start_chunk(block_number, chunk_size)
+
+    def end_chunk(self, block_number: int):
+        self._flush()
+        self.state.end_chunk(block_number)
+
+    def process_event(self, block_when: datetime.datetime, event: AttributeDict) -> object:
+        if event["blockNumber"] != self.pending_block:
+            self._flush()
+            self.pending_block = event["blockNumber"]
+        address = to_checksum_address(event["address"])
+        if address in self.oracles:
+            self.pending_events.setdefault(address, []).append(event)
+        return self.state.process_event(block_when, event)
+
+    def delete_data(self, since_block: int) -> int:
+        self.pending_block = None
+        self.pending_events = {}
+        for oracle in self.oracles.values():
+            oracle.rollback(since_block)
+        return self.state.delete_data(since_block)
+
+    def get_block_hash_index(self):
+        return self.state.get_block_hash_index()
+
+    def get_coverage(self):
+        return self.state.get_coverage()
@@ -0,0 +1,181 @@
+"""Backfill a long block range with several processes, each scanning its own shard into its own SQLite partition.
+
+A single scanner is bound to one CPU for decoding and one chain of requests. `BackfillCoordinator` splits the range
+into contiguous shards, scans them in a process pool and merges the partitions into one ordered SQLite store once
+every shard is verified complete. Shard states are kept on disk, so a failed shard is retried, or the whole
+backfill rerun, from where each shard left off.
+"""
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from logging import info, warning
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from src.local_node.event_scanner import EventScanner, EventScannerState
+from src.local_node.sqlite_state import SQLiteState
+
+
+class Shard(NamedTuple):
+    index: int
+    start_block: int
+    end_block: int
+
+
+class ShardResult(NamedTuple):
+    index: int
+    last_scanned_block: int
+    events: int
+    seconds: float
+
+
+def plan_shards(first_block: int, last_block: int, shards: int) -> List[Shard]:
+    """Split a block range into `shards` contiguous ranges of about the same size."""
+    blocks = last_block - first_block + 1
+    shards = max(1, min(shards, blocks))
+    bounds = [first_block + blocks * i // shards for i in range(shards + 1)]
+    return [Shard(i, bounds[i], bounds[i + 1] - 1) for i in range(shards)]
+
+
+def scan_shard(scanner_factory: Callable[[EventScannerState], EventScanner], shard: Shard, path: str) -> ShardResult:
+    """Scan one shard into its partition, resuming with the blocks the partition does not have yet.
+
+    Runs in a worker process, `scanner_factory` has to be picklable, e.g. a module level function or a
+    `functools.partial` of `ScannerRunner.make_scanner`.
+    """
+    start = time.time()
+    state = SQLiteState(os.path.basename(path), os.path.dirname(path))
+    state.restore()
+    try:
+        processed, _ = scanner_factory(state).scan_gaps(shard.start_block, shard.end_block)
+        events = len(processed)
+        return ShardResult(shard.index, state.get_last_scanned_block(), events, time.time() - start)
+    finally:
+        state.close()
+
+
+class BackfillCoordinator:
+    """Run a sharded backfill in `directory` and merge its partitions."""
+
+    PLAN_FILE = "plan.json"
+
+    def __init__(self, directory: str, scanner_factory: Callable[[EventScannerState], EventScanner],
+                 first_block: int, last_block: int, shards: int = 4, max_workers: Optional[int] = None):
+        """
+        :param scanner_factory: Builds the scanner of a shard around its state, in the worker process
+        :param shards: Number of shards, ignored when resuming a backfill that already has a plan
+        :param max_workers: Worker processes, defaults to one per shard
+        """
+        self.directory = directory
+        self.scanner_factory = scanner_factory
+        os.makedirs(directory, exist_ok=True)
+        self.shards = self.load_plan(first_block, last_block, shards)
+        self.max_workers = max_workers or len(self.shards)
+
+    def load_plan(self, first_block: int, last_block: int, shards: int) -> List[Shard]:
+        """The shards of this backfill, planned once and kept so partitions stay valid across reruns."""
+        path = os.path.join(self.directory, self.PLAN_FILE)
+        if os.path.exists(path):
+            with open(path, "rt") as f:
+                plan = [Shard(*shard) for shard in json.load(f)]
+            if plan[0].start_block != first_block or plan[-1].end_block != last_block:
+                raise ValueError(f"{path} plans blocks {plan[0].start_block} - {plan[-1].end_block}, "
+                                 f"not {first_block} - {last_block}")
+            return plan
+        plan = plan_shards(first_block, last_block, shards)
+        with open(path + ".tmp", "wt") as f:
+            json.dump(plan, f)
+        os.replace(path + ".tmp", path)
+        return plan
+
+    def partition_path(self, shard: Shard) -> str:
+        return os.path.join(self.directory, f"shard-{shard.index:04d}.sqlite")
+
+    def run(self, retries: int = 2) -> Dict[int, ShardResult]:
+        """Scan all shards, retrying failed ones up to `retries` more times.
+
+        :return: Result by shard index
+        :raise RuntimeError: If shards still fail after the retries, their partitions are kept for the next run
+        """
+        results: Dict[int, ShardResult] = {}
+        pending = list(self.shards)
+        errors = {}
+        for attempt in range(retries + 1):
+            if not pending:
+                break
+            if attempt:
+                warning(f"Retrying shards {[shard.index for shard in pending]}")
+            errors = {}
+            with ProcessPoolExecutor(max_workers=min(self.max_workers, len(pending))) as executor:
+                futures = {executor.submit(scan_shard, self.scanner_factory, shard, self.partition_path(shard)): shard
+                           for shard in pending}
+                for future in as_completed(futures):
+                    shard = futures[future]
+                    try:
+                        results[shard.index] = future.result()
+                        info(f"Shard {shard.index} done: {results[shard.index]}")
+                    except Exception as e:
+                        errors[shard.index] = e
+            pending = [shard for shard in self.shards if shard.index in errors]
+        if pending:
+            raise RuntimeError(f"Shards failed after {retries} retries: {errors}")
+        return results
+
+    def verify_coverage(self) -> List[Shard]:
+        """Shards whose partition does not cover their whole range, empty if the backfill is complete.
+
+        :raise ValueError: If the plan itself leaves gaps or overlaps
+        """
+        for previous, shard in zip(self.shards, self.shards[1:]):
+            if shard.start_block != previous.end_block + 1:
+                raise ValueError(f"Shards {previous} and {shard} are not contiguous")
+        incomplete = []
+        for shard in self.shards:
+            path = self.partition_path(shard)
+            state = SQLiteState(os.path.basename(path), os.path.dirname(path))
+            if not os.path.exists(path):
+                incomplete.append(shard)
+                continue
+            state.restore()
+            if not state.get_coverage().contains(shard.start_block, shard.end_block):
+                incomplete.append(shard)
+            state.close()
+        return incomplete
+
+    def merge(self, target: SQLiteState) -> int:
+        """Copy all partitions into `target` in block order, once every shard is complete.
+
+        :return: Number of merged events
+        """
+        incomplete = self.verify_coverage()
+        if incomplete:
+            raise ValueError(f"Cannot merge, shards not complete: {incomplete}")
+        connection = target.connection
+        merged = 0
+        for shard in self.shards:
+            # Databases cannot be attached inside a transaction, each shard is merged in one of its own
+            connection.execute("ATTACH DATABASE ? AS shard", (self.partition_path(shard),))
+            try:
+                connection.execute("BEGIN")
+                # Rows outside the shard's own range cannot exist, the filter only guards the merge
+                merged += connection.execute(
+                    "INSERT OR REPLACE INTO events SELECT * FROM shard.events WHERE block BETWEEN ? AND ? "
+                    "ORDER BY block, log_index", (shard.start_block, shard.end_block)).rowcount
+                connection.execute("INSERT OR REPLACE INTO block_hashes SELECT * FROM shard.block_hashes")
+                connection.execute("INSERT OR REPLACE INTO coverage SELECT * FROM shard.coverage")
+                connection.execute("COMMIT")
+            except Exception:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                raise
+            finally:
+                connection.execute("DETACH DATABASE shard")
+        # A target that already scanned past the shards keeps its last scanned block
+        connection.execute(
+            "INSERT INTO scan_state (key, value) VALUES ('last_scanned_block', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = max(value, excluded.value)", (self.shards[-1].end_block,))
+        # Pick up the merged block hashes and coverage
+        target.close()
+        target.restore()
+        return merged
@@ -0,0 +1,85 @@
+"""Hashes of scanned blocks, to tell after a restart whether the chain reorganised under the stored events.
+
+A block hash commits to all blocks before it, so if the node still has the same hash for a stored block, every
+block up to it is unchanged. The first block whose stored data may be stale is found by a binary search over the
+recorded hashes, which needs a logarithmic number of block lookups however deep the reorg went.
+"""
+
+import bisect
+from typing import Callable, Dict, List, Optional
+
+
+class BlockHashIndex:
+    """Block number to hash for scanned blocks, sorted by block.
+
+    Recent blocks are kept one by one. When the index grows past `max_entries` the older half is thinned by
+    dropping every other entry, so old history is covered ever more coarsely but never lost: a deep reorg is
+    still found, it just rescans a little more.
+    """
+
+    def __init__(self, hashes: Optional[Dict[int, str]] = None, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self.blocks: List[int] = []
+        self.hashes: List[str] = []
+        # Changes on every removal, so stores can tell an append-only update from a rewrite
+        self.version = 0
+        for block in sorted(hashes or {}, key=int):
+            self.blocks.append(int(block))
+            self.hashes.append(hashes[block])
+
+    def __len__(self):
+        return len(self.blocks)
+
+    @property
+    def last_block(self) -> Optional[int]:
+        return self.blocks[-1] if self.blocks else None
+
+    def to_dict(self) -> Dict[int, str]:
+        return dict(zip(self.blocks, self.hashes))
+
+    def record(self, block_number: int, block_hash: str):
+        """Add the hash of a scanned block, replacing any recorded hashes from this block on."""
+        if self.blocks and block_number <= self.blocks[-1]:
+            self.truncate(block_number)
+        self.blocks.append(block_number)
+        self.hashes.append(block_hash)
+        if len(self.blocks) > self.max_entries:
+            self._thin()
+
+    def record_many(self, hashes: Dict[int, str]):
+        for block_number in sorted(hashes):
+            self.record(block_number, hashes[block_number])
+
+    def truncate(self, since_block: int):
+        """Forget the hashes of `since_block` and later blocks."""
+        index = bisect.bisect_left(self.blocks, since_block)
+        if index < len(self.blocks):
+            del self.blocks[index:]
+            del self.hashes[index:]
+            self.version += 1
+
+    def _thin(self):
+        older = len(self.blocks) - self.max_entries // 2
+        # Keep the oldest entry, it bounds how far back a reorg can be found
+        keep = list(range(0, older, 2)) + list(range(older, len(self.blocks)))
+        self.blocks = [self.blocks[i] for i in keep]
+        self.hashes = [self.hashes[i] for i in keep]
+        self.version += 1
+
+    def find_fork_block(self, get_hash: Callable[[int], Optional[str]]) -> Optional[int]:
+        """First block whose stored data may belong to an abandoned fork.
+
+        :param get_hash: Hash of a block on the chain the node follows now, None if it has no such block
+        :return: None if the newest recorded block is still on the chain, 0 if not even the oldest one is
+        """
+        if not self.blocks or get_hash(self.blocks[-1]) == self.hashes[-1]:
+            return None
+        # Invariant: entries before `low` match, the entry at `high` does not
+        low, high = 0, len(self.blocks) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if get_hash(self.blocks[middle]) == self.hashes[middle]:
+                low = middle + 1
+            else:
+                high = middle
+        return self.blocks[low - 1] + 1 if low > 0 else 0
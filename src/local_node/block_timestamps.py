@@ -0,0 +1,229 @@
+"""Resolve block numbers to the time they were mined with as few JSON-RPC calls as possible.
+
+Timestamps of all blocks in a chunk are fetched with one JSON-RPC batch request and kept in an
+on-disk cache, so a block is only ever asked from the node once, whatever pair or run needs it.
+"""
+
+import datetime
+import logging
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+import requests
+from web3 import Web3
+from web3.providers import HTTPProvider
+
+logger = logging.getLogger(__name__)
+
+# Mainnet target block time, used to extrapolate past the last anchor block
+SECONDS_PER_BLOCK = 12
+
+
+class BlockTimestampCache:
+    """Persistent block number -> unix timestamp cache stored in SQLite.
+
+    Block timestamps do not depend on the pair, so one cache file can be shared by every scan on the same chain.
+    Safe to use from the scanner worker threads, and from the worker processes of a backfill.
+    """
+
+    def __init__(self, path: str = "state/block_timestamps.sqlite", timeout: float = 60.0):
+        """
+        :param timeout: Seconds to wait for another process writing to the cache
+        """
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+        # Readers do not block the writer, and writers of concurrent processes queue up instead of failing
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS block_timestamps (block INTEGER PRIMARY KEY, timestamp INTEGER NOT NULL)")
+
+    def get_many(self, block_numbers: List[int]) -> Dict[int, int]:
+        """Cached timestamps for the given blocks, blocks not in the cache are left out."""
+        found = {}
+        with self.lock:
+            # Stay well below SQLITE_MAX_VARIABLE_NUMBER
+            for i in range(0, len(block_numbers), 500):
+                batch = block_numbers[i:i + 500]
+                rows = self.connection.execute(
+                    f"SELECT block, timestamp FROM block_timestamps WHERE block IN ({','.join('?' * len(batch))})",
+                    batch)
+                found.update(rows)
+        return found
+
+    def put_many(self, timestamps: Dict[int, int]):
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO block_timestamps (block, timestamp) VALUES (?, ?)", timestamps.items())
+
+    def close(self):
+        self.connection.close()
+
+
+class BlockTimestampResolver:
+    """Turn block numbers into mined timestamps for `EventScanner`.
+
+    Modes:
+
+    * `EXACT` asks the node for every block not in the cache, in one JSON-RPC batch per call
+    * `INTERPOLATED` only asks for anchor blocks every `anchor_interval` blocks and interpolates linearly in between
+    * `NONE` skips timestamps entirely, for analyses that only work in block numbers
+    """
+
+    EXACT = "exact"
+    INTERPOLATED = "interpolated"
+    NONE = "none"
+
+    def __init__(self, web3: Web3, cache: Optional[BlockTimestampCache] = None, mode: str = EXACT,
+                 anchor_interval: int = 1000, max_batch_size: int = 1000, max_memory_entries: int = 100000,
+                 before_request: Optional[Callable[[], None]] = None, transport=None):
+        """
+        :param cache: Persistent cache shared across runs, None keeps timestamps in memory only
+        :param mode: One of EXACT, INTERPOLATED or NONE
+        :param anchor_interval: Distance between anchor blocks in INTERPOLATED mode
+        :param max_batch_size: Most blocks asked in one JSON-RPC batch
+        :param max_memory_entries: In-memory cache is dropped when it grows past this many blocks
+        :param before_request: Called before every request sent to the node, e.g. a rate limiter
+        :param transport: `JsonRpcTransport` sending the batches, instead of the web3 provider
+        """
+        assert mode in (self.EXACT, self.INTERPOLATED, self.NONE), f"Unknown timestamp mode {mode}"
+        self.web3 = web3
+        self.cache = cache
+        self.mode = mode
+        self.anchor_interval = anchor_interval
+        self.max_batch_size = max_batch_size
+        self.max_memory_entries = max_memory_entries
+        self.before_request = before_request
+        self.transport = transport
+        self.memory_cache: Dict[int, int] = {}
+        self.lock = threading.Lock()
+        self.session = None
+
+    def resolve(self, block_numbers: Iterable[int]) -> Dict[int, Optional[datetime.datetime]]:
+        """When each block was mined, None for blocks that are not mined yet or when timestamps are disabled."""
+        block_numbers = set(block_numbers)
+        if self.mode == self.NONE:
+            return {block_num: None for block_num in block_numbers}
+
+        if self.mode == self.EXACT:
+            timestamps = self.get_timestamps(block_numbers)
+        else:
+            timestamps = self.interpolate(block_numbers)
+
+        return {block_num: _to_datetime(timestamps.get(block_num)) for block_num in block_numbers}
+
+    def interpolate(self, block_numbers: Iterable[int]) -> Dict[int, int]:
+        """Estimate timestamps from the surrounding anchor blocks."""
+        interval = self.anchor_interval
+        anchors = set()
+        for block_num in block_numbers:
+            anchor = block_num - block_num % interval
+            anchors.update((anchor, anchor + interval))
+        anchor_timestamps = self.get_timestamps(anchors)
+
+        timestamps = {}
+        for block_num in block_numbers:
+            anchor = block_num - block_num % interval
+            start = anchor_timestamps.get(anchor)
+            end = anchor_timestamps.get(anchor + interval)
+            if start is None:
+                continue
+            if end is None:
+                # Past the chain head, assume the target block time
+                timestamps[block_num] = start + (block_num - anchor) * SECONDS_PER_BLOCK
+            else:
+                timestamps[block_num] = start + (end - start) * (block_num - anchor) // interval
+        return timestamps
+
+    def get_timestamps(self, block_numbers: Iterable[int]) -> Dict[int, int]:
+        """Exact unix timestamps, from the caches if possible, otherwise batched from the node."""
+        with self.lock:
+            timestamps = {b: self.memory_cache[b] for b in block_numbers if b in self.memory_cache}
+        missing = sorted(set(block_numbers) - timestamps.keys())
+
+        if missing and self.cache:
+            cached = self.cache.get_many(missing)
+            timestamps.update(cached)
+            missing = [block_num for block_num in missing if block_num not in cached]
+
+        fetched = {}
+        for i in range(0, len(missing), self.max_batch_size):
+            fetched.update(self.fetch_timestamps(missing[i:i + self.max_batch_size]))
+        if fetched and self.cache:
+            self.cache.put_many(fetched)
+
+        timestamps.update(fetched)
+        with self.lock:
+            if len(self.memory_cache) > self.max_memory_entries:
+                self.memory_cache.clear()
+            self.memory_cache.update(timestamps)
+        return timestamps
+
+    def fetch_timestamps(self, block_numbers: List[int]) -> Dict[int, int]:
+        """Ask the node for the timestamps of blocks in one JSON-RPC batch.
+
+        Blocks that are not mined yet are left out.
+        """
+        calls = [("eth_getBlockByNumber", [hex(block_num), False]) for block_num in block_numbers]
+        if self.before_request:
+            self.before_request()
+        responses = _batch_request(self.web3, self, calls)
+
+        timestamps = {}
+        for block_num, response in zip(block_numbers, responses):
+            block = response.get("result")
+            if block is None:
+                # Block was not mined yet,
+                # minor chain reorganisation?
+                continue
+            timestamps[block_num] = int(block["timestamp"], 16)
+        return timestamps
+
+    def get_session(self) -> requests.Session:
+        """HTTP session kept open between batches."""
+        if self.session is None:
+            self.session = requests.Session()
+        return self.session
+
+
+def _batch_request(web3: Web3, resolver: BlockTimestampResolver, calls: List[tuple]) -> List[dict]:
+    """Send a list of (method, params) as one JSON-RPC batch and return the raw responses in call order.
+
+    A resolver's transport sends the batch if it has one. Providers may offer their own `make_batch_request(calls)`,
+    plain HTTP providers get a batch array POSTed directly since web3.py v5 has no batch support. Any other provider
+    falls back to one request per call.
+    """
+    if resolver.transport is not None:
+        return resolver.transport.make_batch_request(calls)
+
+    provider = web3.provider
+    if hasattr(provider, "make_batch_request"):
+        return provider.make_batch_request(calls)
+
+    if isinstance(provider, HTTPProvider):
+        payload = [{"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+                   for i, (method, params) in enumerate(calls)]
+        kwargs = provider.get_request_kwargs()
+        response = resolver.get_session().post(provider.endpoint_uri, json=payload, **kwargs)
+        response.raise_for_status()
+        body = response.json()
+        if isinstance(body, dict):
+            # Some nodes answer a whole batch with a single error object
+            raise ValueError(f"JSON-RPC batch failed: {body.get('error', body)}")
+        by_id = {item["id"]: item for item in body}
+        return [by_id.get(i, {}) for i in range(len(calls))]
+
+    logger.debug("Provider %s does not support batches, sending %d requests", provider, len(calls))
+    return [provider.make_request(method, params) for method, params in calls]
+
+
+def _to_datetime(timestamp: Optional[int]) -> Optional[datetime.datetime]:
+    if timestamp is None:
+        return None
+    return datetime.datetime.utcfromtimestamp(timestamp)
@@ -0,0 +1,141 @@
+"""Decide how many blocks `EventScanner` asks for in one `eth_getLogs` call and how to back off on failures."""
+
+import random
+import threading
+from abc import ABC, abstractmethod
+from typing import Tuple
+
+
+class ChunkSizeController(ABC):
+    """Chooses the block range of the next `eth_getLogs` request from what previous requests looked like.
+
+    Called from the scanner worker threads, implementations must be thread safe.
+    """
+
+    @abstractmethod
+    def record_success(self, block_count: int, log_count: int, duration: float):
+        """A request over `block_count` blocks returned `log_count` logs in `duration` seconds."""
+
+    @abstractmethod
+    def record_failure(self, start_block: int, end_block: int, attempt: int, error: Exception) -> Tuple[int, float]:
+        """A request failed, decide how to retry it.
+
+        :param attempt: How many times this request has failed before, 0 on the first failure
+        :return: tuple(end block of the retried request, seconds to wait before retrying)
+        """
+
+    @abstractmethod
+    def next_chunk_size(self, current_chunk_size: int, event_found_count: int) -> int:
+        """How many blocks the next chunk should span."""
+
+
+class DoublingChunkSizeController(ChunkSizeController):
+    """The original heuristic of the web3.py scanner example.
+
+    Doubles the chunk size while no events are found and drops back to the minimum as soon as there are any.
+    Failures halve the range and wait a fixed delay.
+    """
+
+    def __init__(self, min_chunk_size: int = 10, max_chunk_size: int = 10000, chunk_size_increase: float = 2.0,
+                 retry_delay: float = 3.0):
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.chunk_size_increase = chunk_size_increase
+        self.retry_delay = retry_delay
+
+    def record_success(self, block_count: int, log_count: int, duration: float):
+        pass
+
+    def record_failure(self, start_block: int, end_block: int, attempt: int, error: Exception) -> Tuple[int, float]:
+        return start_block + ((end_block - start_block) // 2), self.retry_delay
+
+    def next_chunk_size(self, current_chunk_size: int, event_found_count: int) -> int:
+        if event_found_count > 0:
+            current_chunk_size = self.min_chunk_size
+        else:
+            current_chunk_size *= self.chunk_size_increase
+        return int(min(self.max_chunk_size, max(self.min_chunk_size, current_chunk_size)))
+
+
+class AdaptiveChunkSizeController(ChunkSizeController):
+    """Size chunks to a target response size and latency budget.
+
+    Keeps smoothed estimates of logs per block and seconds per block and aims the next chunk at whichever of
+    `target_logs_per_request` and `latency_budget` is hit first. Growth towards that target is additive-increase
+    /multiplicative-decrease: the size doubles while below the range that last failed, then grows by
+    `additive_increase` blocks. A failure cuts the range by `decrease_factor` and waits an exponentially growing,
+    jittered delay, so the scan settles on the largest range the node can serve.
+    """
+
+    def __init__(self, min_chunk_size: int = 10, max_chunk_size: int = 10000, target_logs_per_request: int = 5000,
+                 latency_budget: float = 5.0, additive_increase: int = 100, decrease_factor: float = 0.5,
+                 smoothing: float = 0.3, base_retry_delay: float = 0.5, max_retry_delay: float = 30.0):
+        """
+        :param target_logs_per_request: How many logs we want back from one `eth_getLogs`
+        :param latency_budget: How many seconds one `eth_getLogs` may take
+        :param additive_increase: Blocks added to the chunk size per chunk once above the last failed size
+        :param decrease_factor: Range multiplier applied on a failed request
+        :param smoothing: Weight of the latest request in the moving averages
+        :param base_retry_delay: Seconds to wait after the first failure, doubled on every further failure
+        :param max_retry_delay: Cap on the wait between retries
+        """
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.target_logs_per_request = target_logs_per_request
+        self.latency_budget = latency_budget
+        self.additive_increase = additive_increase
+        self.decrease_factor = decrease_factor
+        self.smoothing = smoothing
+        self.base_retry_delay = base_retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self.lock = threading.Lock()
+        self.logs_per_block = None
+        self.seconds_per_block = None
+        # Below this size we grow multiplicatively, above it additively
+        self.threshold = max_chunk_size
+        # Size of the last failed range, applied to the next chunk
+        self.failed_size = None
+
+    def _smooth(self, average, value):
+        if average is None:
+            return value
+        return (1 - self.smoothing) * average + self.smoothing * value
+
+    def record_success(self, block_count: int, log_count: int, duration: float):
+        block_count = max(1, block_count)
+        with self.lock:
+            self.logs_per_block = self._smooth(self.logs_per_block, log_count / block_count)
+            self.seconds_per_block = self._smooth(self.seconds_per_block, duration / block_count)
+
+    def record_failure(self, start_block: int, end_block: int, attempt: int, error: Exception) -> Tuple[int, float]:
+        block_count = end_block - start_block + 1
+        retry_size = max(1, int(block_count * self.decrease_factor))
+        with self.lock:
+            self.threshold = max(self.min_chunk_size, retry_size)
+            self.failed_size = retry_size if self.failed_size is None else min(self.failed_size, retry_size)
+        delay = min(self.max_retry_delay, self.base_retry_delay * 2 ** attempt)
+        # Jitter so concurrent workers do not retry in lockstep
+        delay *= random.uniform(0.5, 1.0)
+        return start_block + retry_size - 1, delay
+
+    def target_chunk_size(self) -> float:
+        """The largest chunk expected to stay within the response size and latency budget."""
+        target = float(self.max_chunk_size)
+        if self.logs_per_block:
+            target = min(target, self.target_logs_per_request / self.logs_per_block)
+        if self.seconds_per_block:
+            target = min(target, self.latency_budget / self.seconds_per_block)
+        return target
+
+    def next_chunk_size(self, current_chunk_size: int, event_found_count: int) -> int:
+        with self.lock:
+            if self.failed_size is not None:
+                current_chunk_size = min(current_chunk_size, self.failed_size)
+                self.failed_size = None
+            if current_chunk_size < self.threshold:
+                grown = current_chunk_size * 2
+            else:
+                grown = current_chunk_size + self.additive_increase
+            chunk_size = min(grown, self.target_chunk_size())
+        return int(min(self.max_chunk_size, max(self.min_chunk_size, chunk_size)))
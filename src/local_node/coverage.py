@@ -0,0 +1,84 @@
+"""Which blocks a state has scanned, as a set of block ranges.
+
+A single `last_scanned_block` only says everything up to it is done. Once ranges are scanned out of order, or a run
+stops part way through a range, the state needs to know exactly which blocks it has, so a later scan can fetch only
+the missing ones.
+"""
+
+import bisect
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
+
+
+class BlockCoverage:
+    """Scanned blocks as sorted, disjoint inclusive ranges, adjacent ranges are merged."""
+
+    def __init__(self, ranges: Optional[Iterable[Sequence[int]]] = None):
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+        # Changes on every update, so stores can tell whether there is anything to save
+        self.version = 0
+        for start, end in ranges or []:
+            self.add(int(start), int(end))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.starts, self.ends)
+
+    def __repr__(self):
+        return f"BlockCoverage({self.to_list()})"
+
+    def to_list(self) -> List[List[int]]:
+        return [[start, end] for start, end in self]
+
+    @property
+    def last_block(self) -> Optional[int]:
+        return self.ends[-1] if self.ends else None
+
+    def covered_blocks(self) -> int:
+        return sum(end - start + 1 for start, end in self)
+
+    def add(self, start: int, end: int):
+        """Mark blocks `start` to `end` as scanned."""
+        assert start <= end, f"Empty block range {start} - {end}"
+        # Ranges overlapping or touching [start, end] are those from i to j - 1
+        i = bisect.bisect_left(self.ends, start - 1)
+        j = bisect.bisect_right(self.starts, end + 1)
+        if i < j:
+            start = min(start, self.starts[i])
+            end = max(end, self.ends[j - 1])
+        self.starts[i:j] = [start]
+        self.ends[i:j] = [end]
+        self.version += 1
+
+    def contains(self, start: int, end: int) -> bool:
+        """Whether every block from `start` to `end` is scanned."""
+        i = bisect.bisect_right(self.starts, start) - 1
+        return i >= 0 and self.ends[i] >= end
+
+    def truncate(self, since_block: int):
+        """Forget `since_block` and later blocks, e.g. when their data is deleted after a reorg."""
+        i = bisect.bisect_left(self.ends, since_block)
+        if i == len(self.ends):
+            return
+        if self.starts[i] < since_block:
+            self.ends[i] = since_block - 1
+            i += 1
+        del self.starts[i:]
+        del self.ends[i:]
+        self.version += 1
+
+    def gaps(self, start: int, end: int) -> List[Tuple[int, int]]:
+        """Block ranges between `start` and `end` that are not scanned yet, in block order."""
+        gaps = []
+        current = start
+        i = bisect.bisect_left(self.ends, start)
+        while i < len(self.starts) and self.starts[i] <= end and current <= end:
+            if self.starts[i] > current:
+                gaps.append((current, self.starts[i] - 1))
+            current = max(current, self.ends[i] + 1)
+            i += 1
+        if current <= end:
+            gaps.append((current, end))
+        return gaps
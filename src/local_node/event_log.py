@@ -0,0 +1,371 @@
+"""Append-only binary log of decoded Sync and Swap events, memory-mapped for analysis.
+
+JSON state has to be parsed, flattened and paired in Python before a notebook can use it. `EventLogState` writes
+every event as one fixed-width row instead, and `EventLog` maps the file straight into a NumPy record array: opening
+a history costs a header read, pages are loaded on first access and shared by every process mapping the file.
+
+Layout of `<name>`, all little-endian:
+
+* a 64 byte `HEADER` with the committed row count and the last scanned block
+* `RECORD` rows sorted by (block, log index), amounts and reserves as exact uint64 high and low words
+
+Layout of `<name>.idx`: one `INDEX` entry (block, first row) per block with events, for block range lookups.
+Rows past the committed count in the header belong to a chunk that was never committed and are dropped on restore.
+"""
+
+import datetime
+import json
+import os
+from typing import BinaryIO, Optional
+
+import numpy as np
+from eth_utils import to_checksum_address
+from pandas import DataFrame
+from web3.datastructures import AttributeDict
+
+from src.local_node.block_hashes import BlockHashIndex
+from src.local_node.event_scanner import EventScannerState
+from src.local_node.process_state_to_df import ProcessStateToDF, UINT_COLUMNS
+from src.local_node.uint128 import UInt128Column
+
+MAGIC = b"ODAEVLOG"
+VERSION = 1
+
+SYNC = 1
+SWAP = 2
+
+HEADER = np.dtype([
+    ("magic", "S8"),
+    ("version", "<u4"),
+    ("record_size", "<u4"),
+    ("rows", "<u8"),
+    ("index_rows", "<u8"),
+    ("last_scanned_block", "<i8"),
+    ("reserved", "V24"),
+])
+RECORD = np.dtype([
+    ("block", "<i8"),
+    ("log_index", "<u4"),
+    ("kind", "u1"),
+    # Unix seconds, -1 when the scan did not resolve timestamps
+    ("timestamp", "<i8"),
+    ("txhash", "u1", (32,)),
+    ("sender", "u1", (20,)),
+    ("to", "u1", (20,)),
+] + [(name + suffix, "<u8") for name in UINT_COLUMNS for suffix in ("_hi", "_lo")])
+INDEX = np.dtype([("block", "<i8"), ("row", "<u8")])
+
+MASK64 = (1 << 64) - 1
+ZERO_ADDRESS = bytes(20)
+
+
+def read_header(path: str) -> np.void:
+    """The header of an event log, checked for a known format.
+
+    :raise ValueError: If the file is not an event log of this version
+    """
+    header = np.fromfile(path, dtype=HEADER, count=1)
+    if len(header) != 1 or header[0]["magic"] != MAGIC:
+        raise ValueError(f"{path} is not an event log")
+    header = header[0]
+    if header["version"] != VERSION or header["record_size"] != RECORD.itemsize:
+        raise ValueError(f"{path} has event log version {header['version']} with {header['record_size']} byte rows, "
+                         f"expected version {VERSION} with {RECORD.itemsize} byte rows")
+    return header
+
+
+def _map(path: str, dtype: np.dtype, offset: int, rows: int) -> np.ndarray:
+    # Zero length maps are not allowed
+    if rows == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(rows,))
+
+
+class EventLog:
+    """Read-only view of an event log, mapped into memory without parsing."""
+
+    def __init__(self, path: str):
+        header = read_header(path)
+        self.path = path
+        self.last_scanned_block = int(header["last_scanned_block"])
+        self.records = _map(path, RECORD, HEADER.itemsize, int(header["rows"]))
+        self.index = _map(path + ".idx", INDEX, 0, int(header["index_rows"]))
+
+    def __len__(self):
+        return len(self.records)
+
+    def block_range(self, from_block: int = 0, to_block: Optional[int] = None) -> np.ndarray:
+        """Rows of a block range, a view into the mapped file."""
+        blocks = self.index["block"]
+        start = np.searchsorted(blocks, from_block, side="left")
+        end = len(blocks) if to_block is None else np.searchsorted(blocks, to_block, side="right")
+        start_row = int(self.index["row"][start]) if start < len(blocks) else len(self.records)
+        end_row = int(self.index["row"][end]) if end < len(blocks) else len(self.records)
+        return self.records[start_row:end_row]
+
+    @staticmethod
+    def uint_column(records: np.ndarray, name: str) -> UInt128Column:
+        """Exact values of an amount or reserve column."""
+        return UInt128Column(records[name + "_hi"], records[name + "_lo"])
+
+    def swaps(self, from_block: int = 0, to_block: Optional[int] = None, compact: bool = True) -> DataFrame:
+        """The swap DataFrame of `ProcessStateToDF.process_state`, built with array operations on the rows.
+
+        Reserves before the first swap of a range are those of the last Sync in the range before it, so a range
+        should start at a block where the reserves are known, e.g. the first block of the pair.
+
+        :param compact: Native dtype columns as returned by `ProcessStateToDF.compact`, False for Python ints
+        """
+        return swaps_from_records(self.block_range(from_block, to_block), compact)
+
+
+def swaps_from_records(records: np.ndarray, compact: bool = True) -> DataFrame:
+    """Pair Syncs and Swaps of event log rows into the swap DataFrame."""
+    count = len(records)
+    kind = records["kind"]
+    txhash = records["txhash"]
+    new_tx = np.ones(count, dtype=bool)
+    new_tx[1:] = (txhash[1:] != txhash[:-1]).any(axis=1)
+
+    def describe(position: int) -> dict:
+        return {"block": int(records["block"][position]), "log_index": int(records["log_index"][position]),
+                "kind": int(kind[position])}
+
+    paired_sync, previous_sync = ProcessStateToDF.pair_positions(
+        kind == SYNC, kind == SWAP, np.cumsum(new_tx), describe)
+    sync_positions = np.flatnonzero(paired_sync)
+    swap_positions = sync_positions + 1
+    before = previous_sync[sync_positions]
+    has_previous = before >= 0
+
+    swaps = DataFrame({
+        "sender": _addresses(records["sender"][swap_positions]),
+        "to": _addresses(records["to"][swap_positions]),
+        "block": records["block"][swap_positions].astype(np.int64),
+    })
+    for name in UINT_COLUMNS:
+        if name.startswith("reserve"):
+            # Reserves before the swap, those of the Sync before its own
+            hi = np.where(has_previous, records[name + "_hi"][before], 0).astype(np.uint64)
+            lo = np.where(has_previous, records[name + "_lo"][before], 0).astype(np.uint64)
+            column = UInt128Column(hi, lo)
+        else:
+            column = EventLog.uint_column(records[swap_positions], name)
+        swaps[name] = column.to_float()
+        swaps[name + "_hi"] = column.hi
+        swaps[name + "_lo"] = column.lo
+    return swaps if compact else ProcessStateToDF.expand(swaps)
+
+
+def _addresses(column: np.ndarray) -> np.ndarray:
+    """Checksummed address strings of 20 byte rows, checksumming each distinct address once."""
+    if not len(column):
+        return np.empty(0, dtype=object)
+    unique, inverse = np.unique(np.ascontiguousarray(column).view("V20").ravel(), return_inverse=True)
+    names = np.array([to_checksum_address(bytes(address)) for address in unique], dtype=object)
+    return names[inverse]
+
+
+class EventLogState(EventScannerState):
+    """Store scanned events in an event log, see the module documentation for the format.
+
+    Events of a chunk are buffered and appended in `end_chunk`, the header is rewritten last so a crash leaves the
+    committed rows intact. Block hashes are kept in `<name>.hashes.json`.
+    """
+
+    def __init__(self, file_name: str, directory: str = "state"):
+        """
+        :param file_name: State file in `directory`, an absolute path is used as is
+        :param directory: Where the state is kept
+        """
+        self.path = os.path.join(directory, file_name)
+        self.file: Optional[BinaryIO] = None
+        self.index_file: Optional[BinaryIO] = None
+        self.rows = 0
+        self.index_rows = 0
+        self.last_scanned_block = 0
+        self.last_row_key = (-1, -1)
+        self.pending = []
+        self.block_hashes = BlockHashIndex()
+        self.saved_hashes = (self.block_hashes.version, None)
+
+    @property
+    def hashes_path(self) -> str:
+        return self.path + ".hashes.json"
+
+    def restore(self):
+        """Open the log, creating it if this is the first scan."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(self.path):
+            self.file = open(self.path, "w+b")
+            self.index_file = open(self.path + ".idx", "w+b")
+            self.reset()
+            print("State starting from scratch")
+            return
+
+        header = read_header(self.path)
+        self.file = open(self.path, "r+b")
+        self.index_file = open(self.path + ".idx", "r+b" if os.path.exists(self.path + ".idx") else "w+b")
+        self.rows = int(header["rows"])
+        self.index_rows = int(header["index_rows"])
+        self.last_scanned_block = int(header["last_scanned_block"])
+        # Drop whatever an uncommitted chunk appended
+        self.file.truncate(HEADER.itemsize + self.rows * RECORD.itemsize)
+        self.index_file.truncate(self.index_rows * INDEX.itemsize)
+        self.last_row_key = self._read_last_row_key()
+
+        self.block_hashes = BlockHashIndex()
+        if os.path.exists(self.hashes_path):
+            with open(self.hashes_path, "rt") as f:
+                self.block_hashes = BlockHashIndex(json.load(f))
+        self.saved_hashes = (self.block_hashes.version, self.block_hashes.last_block)
+        print(f"Restored the state, previously {self.last_scanned_block} blocks have been scanned")
+
+    def reset(self):
+        """Create initial state of nothing scanned."""
+        self.rows = 0
+        self.index_rows = 0
+        self.last_scanned_block = 0
+        self.last_row_key = (-1, -1)
+        self.pending = []
+        self.file.truncate(0)
+        self.index_file.truncate(0)
+        self._write_header()
+        self.block_hashes = BlockHashIndex()
+        self._save_block_hashes()
+
+    def save(self):
+        """Everything is written at the end of each chunk, nothing left to save."""
+
+    def close(self):
+        self.file.close()
+        self.index_file.close()
+
+    def _read_last_row_key(self) -> tuple:
+        if not self.rows:
+            return -1, -1
+        self.file.seek(HEADER.itemsize + (self.rows - 1) * RECORD.itemsize)
+        row = np.frombuffer(self.file.read(RECORD.itemsize), dtype=RECORD)[0]
+        return int(row["block"]), int(row["log_index"])
+
+    def _write_header(self):
+        header = np.zeros(1, dtype=HEADER)
+        header["magic"] = MAGIC
+        header["version"] = VERSION
+        header["record_size"] = RECORD.itemsize
+        header["rows"] = self.rows
+        header["index_rows"] = self.index_rows
+        header["last_scanned_block"] = self.last_scanned_block
+        self.file.seek(0)
+        self.file.write(header.tobytes())
+        self.file.flush()
+
+    def _save_block_hashes(self):
+        saved = (self.block_hashes.version, self.block_hashes.last_block)
+        if saved == self.saved_hashes:
+            return
+        with open(self.hashes_path + ".tmp", "wt") as f:
+            json.dump(self.block_hashes.to_dict(), f)
+        os.replace(self.hashes_path + ".tmp", self.hashes_path)
+        self.saved_hashes = saved
+
+    def _append(self, records: np.ndarray):
+        """Write rows of a chunk and index their blocks, without committing them in the header."""
+        blocks, first = np.unique(records["block"], return_index=True)
+        index = np.zeros(len(blocks), dtype=INDEX)
+        index["block"] = blocks
+        index["row"] = self.rows + first
+        self.file.seek(HEADER.itemsize + self.rows * RECORD.itemsize)
+        self.file.write(records.tobytes())
+        self.file.flush()
+        self.index_file.seek(self.index_rows * INDEX.itemsize)
+        self.index_file.write(index.tobytes())
+        self.index_file.flush()
+        self.rows += len(records)
+        self.index_rows += len(index)
+        self.last_row_key = (int(records["block"][-1]), int(records["log_index"][-1]))
+
+    def _records(self) -> np.ndarray:
+        """The buffered events of the chunk as rows sorted by (block, log index)."""
+        records = np.zeros(len(self.pending), dtype=RECORD)
+        for i, name in enumerate(("block", "log_index", "kind", "timestamp")):
+            records[name] = [event[i] for event in self.pending]
+        for i, (name, size) in enumerate((("txhash", 32), ("sender", 20), ("to", 20)), start=4):
+            joined = b"".join(event[i] for event in self.pending)
+            records[name] = np.frombuffer(joined, dtype=np.uint8).reshape(-1, size)
+        for i, name in enumerate(UINT_COLUMNS):
+            values = [event[7][i] for event in self.pending]
+            records[name + "_hi"] = [value >> 64 for value in values]
+            records[name + "_lo"] = [value & MASK64 for value in values]
+        records = records[np.lexsort((records["log_index"], records["block"]))]
+        first_key = (int(records["block"][0]), int(records["log_index"][0]))
+        if first_key <= self.last_row_key:
+            raise ValueError(f"Event {first_key} is not after the last stored event {self.last_row_key}, "
+                             f"delete the data from its block first")
+        return records
+
+    #
+    # EventScannerState methods implemented below
+    #
+
+    def get_last_scanned_block(self) -> int:
+        """The number of the last block we have stored."""
+        return self.last_scanned_block
+
+    def delete_data(self, since_block: int) -> int:
+        """Drop the rows from `since_block` on by truncating both files."""
+        self.pending = []
+        index = np.fromfile(self.path + ".idx", dtype=INDEX, count=self.index_rows)
+        cut = int(np.searchsorted(index["block"], since_block, side="left"))
+        row = int(index["row"][cut]) if cut < self.index_rows else self.rows
+        deleted = self.rows - row
+        self.rows, self.index_rows = row, cut
+        self.last_scanned_block = min(self.last_scanned_block, since_block - 1)
+        self._write_header()
+        self.file.truncate(HEADER.itemsize + self.rows * RECORD.itemsize)
+        self.index_file.truncate(self.index_rows * INDEX.itemsize)
+        self.last_row_key = self._read_last_row_key()
+        self.block_hashes.truncate(since_block)
+        self._save_block_hashes()
+        return deleted
+
+    def get_block_hash_index(self) -> BlockHashIndex:
+        return self.block_hashes
+
+    def start_chunk(self, block_number: int, chunk_size: int):
+        self.pending = []
+
+    def end_chunk(self, block_number: int):
+        """Append the chunk and commit it in the header, so we can resume in the case of a crash or CTRL+C"""
+        if self.pending:
+            self._append(self._records())
+            self.pending = []
+        self.last_scanned_block = block_number
+        self._write_header()
+        self._save_block_hashes()
+
+    def process_event(self, block_when: Optional[datetime.datetime], event: AttributeDict) -> str:
+        """Buffer a Sync or Swap event as a row of the current chunk."""
+        log_index = event.logIndex
+        txhash = bytes(event.transactionHash)
+        block_number = event.blockNumber
+        args = event["args"]
+        timestamp = int(block_when.replace(tzinfo=datetime.timezone.utc).timestamp()) if block_when else -1
+
+        # Values in the order of UINT_COLUMNS
+        if event["event"] == "Sync":
+            kind, sender, to = SYNC, ZERO_ADDRESS, ZERO_ADDRESS
+            values = (0, 0, 0, 0, args["reserve0"], args["reserve1"])
+        elif event["event"] == "Swap":
+            kind, sender, to = SWAP, bytes.fromhex(args["sender"][2:]), bytes.fromhex(args["to"][2:])
+            values = (args["amount0In"], args["amount1In"], args["amount0Out"], args["amount1Out"], 0, 0)
+        else:
+            raise ValueError(f"Event log only stores Sync and Swap events, not {event['event']}")
+        if any(value >> 128 for value in values):
+            raise OverflowError(f"Event in block {block_number} has a value that does not fit 128 bits")
+        self.pending.append((block_number, log_index, kind, timestamp, txhash, sender, to, values))
+
+        # Return a pointer that allows us to look up this event later if needed
+        return f"{block_number}-{event.transactionHash.hex()}-{log_index}"
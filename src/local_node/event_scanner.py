@@ -9,21 +9,32 @@ to scan for swaps and syncs from uniswap v2 pair.
 
 import datetime
 import json
+import os
+import threading
 import time
 import logging
 from abc import ABC, abstractmethod
-from typing import Tuple, Optional, Callable, List, Iterable
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Optional, Callable, List, Dict, Iterator, NamedTuple
 
 from web3 import Web3
 from web3.contract import Contract
 from web3.datastructures import AttributeDict
 from web3.exceptions import BlockNotFound
 from eth_abi.codec import ABICodec
+from eth_utils import event_abi_to_log_topic, encode_hex
 
 # Currently this method is not exposed over official web3 API,
 # but we need it to construct eth_getLogs parameters
-from web3._utils.filters import construct_event_filter_params
-from web3._utils.events import get_event_data
+
+from src.local_node.block_hashes import BlockHashIndex
+from src.local_node.block_timestamps import BlockTimestampResolver
+from src.local_node.chunk_size import AdaptiveChunkSizeController, ChunkSizeController
+from src.local_node.coverage import BlockCoverage
+from src.local_node.fast_decoder import decode_logs
+from src.local_node.rpc_transport import JsonRpcTransport
+from src.local_node.scan_metrics import ChunkMetrics, ScanHook
 
 
 logger = logging.getLogger(__name__)
@@ -75,6 +86,52 @@ class EventScannerState(ABC):
         Purges any potential minor reorg data.
         """
 
+    def get_block_hash_index(self) -> Optional[BlockHashIndex]:
+        """Hashes of scanned blocks the scanner records into and checks for reorgs, None if not kept."""
+        return None
+
+    def get_coverage(self) -> Optional[BlockCoverage]:
+        """Scanned block ranges the scanner adds every chunk to before `end_chunk`, None if not kept."""
+        return None
+
+
+class ScannedChunk(NamedTuple):
+    """One committed block range of a scan, as yielded by `EventScanner.scan_iter`."""
+    start_block: int
+    end_block: int
+    end_block_timestamp: Optional[datetime.datetime]
+    # Decoded events sorted by (blockNumber, logIndex)
+    events: list
+    # What the state returned for each event
+    processed: list
+
+
+class RequestRateLimiter:
+    """Throttle JSON-RPC calls made against a single node.
+
+    Shared by all worker threads of a scanner, so the limit holds for the node as a whole
+    and not for every thread separately.
+    """
+
+    def __init__(self, max_requests_per_second: Optional[float] = None):
+        """
+        :param max_requests_per_second: Requests allowed per second, None for no limit
+        """
+        self.min_interval = 1.0 / max_requests_per_second if max_requests_per_second else 0.0
+        self.next_request_time = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until the next request is allowed to go out."""
+        if not self.min_interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait = self.next_request_time - now
+            self.next_request_time = max(now, self.next_request_time) + self.min_interval
+        if wait > 0:
+            time.sleep(wait)
+
 
 class EventScanner:
     """Scan blockchain for events and try not to abuse JSON-RPC API too much.
@@ -87,15 +144,36 @@ class EventScanner:
     because it cannot correctly throttle and decrease the `eth_getLogs` block number range.
     """
 
+    # Blocks rescanned on restart by states that do not keep block hashes
+    NUM_BLOCKS_RESCAN_FOR_FORKS = 10
+
     def __init__(self, web3: Web3, contract: Contract, state: EventScannerState, events: List, filters: {},
-                 max_chunk_scan_size: int = 10000, max_request_retries: int = 30, request_retry_seconds: float = 3.0):
+                 max_chunk_scan_size: int = 10000, max_request_retries: int = 30, request_retry_seconds: float = 3.0,
+                 concurrency: int = 1, max_in_flight: Optional[int] = None,
+                 max_requests_per_second: Optional[float] = None,
+                 timestamp_resolver: Optional[BlockTimestampResolver] = None,
+                 chunk_size_controller: Optional[ChunkSizeController] = None,
+                 hooks: Optional[List[ScanHook]] = None,
+                 transport: Optional[JsonRpcTransport] = None):
         """
         :param contract: Contract
         :param events: List of web3 Event we scan
         :param filters: Filters passed to getLogs
         :param max_chunk_scan_size: JSON-RPC API limit in the number of blocks we query. (Recommendation: 10,000 for mainnet, 500,000 for testnets)
         :param max_request_retries: How many times we try to reattempt a failed JSON-RPC call
-        :param request_retry_seconds: Delay between failed requests to let JSON-RPC server to recover
+        :param request_retry_seconds: Delay after the first failed request to let JSON-RPC server to recover,
+            later retries back off exponentially
+        :param concurrency: Number of worker threads fetching chunks at once, 1 scans sequentially
+        :param max_in_flight: How many chunks may be requested ahead of the one being processed,
+            defaults to twice the concurrency
+        :param max_requests_per_second: Rate limit for all JSON-RPC calls to the node, None for no limit
+        :param timestamp_resolver: How block timestamps are looked up, defaults to exact timestamps batched per
+            chunk and cached in memory. Throttled by `max_requests_per_second` if it has no `before_request`
+        :param chunk_size_controller: Picks chunk sizes and retry back off, defaults to an
+            `AdaptiveChunkSizeController` bounded by the min and max chunk size
+        :param hooks: Receive the timings of every committed chunk, e.g. a `ScanMetrics`
+        :param transport: Sends logs, block and head requests instead of `web3.eth`, skipping web3's response
+            formatting
         """
 
         self.logger = logger
@@ -104,56 +182,164 @@ class EventScanner:
         self.state = state
         self.events = events
         self.filters = filters
+        self.transport = transport
+
+        # Lookup table from topic0 to event ABI so all event types come back from one `eth_getLogs`
+        self.event_abis_by_topic = build_event_abis_by_topic(events)
 
         # Our JSON-RPC throttling parameters
         self.min_scan_chunk_size = 10  # 12 s/block = 120 seconds period
         self.max_scan_chunk_size = max_chunk_scan_size
         self.max_request_retries = max_request_retries
         self.request_retry_seconds = request_retry_seconds
-
-        # Factor how fast we increase the chunk size if results are found
-        # # (slow down scan after starting to get hits)
-        self.chunk_size_decrease = 0.5
-
-        # Factor how was we increase chunk size if no results found
-        self.chunk_size_increase = 2.0
+        self.chunk_size_controller = chunk_size_controller or AdaptiveChunkSizeController(
+            min_chunk_size=self.min_scan_chunk_size, max_chunk_size=self.max_scan_chunk_size,
+            base_retry_delay=request_retry_seconds)
+
+        # Concurrent scan parameters
+        self.concurrency = max(1, concurrency)
+        self.max_in_flight = max(self.concurrency, max_in_flight or 2 * self.concurrency)
+        self.rate_limiter = RequestRateLimiter(max_requests_per_second)
+        self.timestamp_resolver = timestamp_resolver or BlockTimestampResolver(
+            web3, before_request=self.rate_limiter.acquire, transport=transport)
+        # A resolver built by the caller counts its batches against the same limit, unless it brings its own.
+        # The transport is not given the limiter, the scanner and the resolver acquire before each of its calls.
+        if self.timestamp_resolver.before_request is None:
+            self.timestamp_resolver.before_request = self.rate_limiter.acquire
+        self.hooks = list(hooks or [])
 
     @property
     def address(self):
         return self.token_address
 
-    def get_block_timestamp(self, block_num) -> datetime.datetime:
-        """Get Ethereum block timestamp"""
-        try:
-            block_info = self.web3.eth.getBlock(block_num)
-        except BlockNotFound:
-            # Block was not mined yet,
-            # minor chain reorganisation?
-            return None
-        last_time = block_info["timestamp"]
-        return datetime.datetime.utcfromtimestamp(last_time)
+    def get_block_timestamp(self, block_num) -> Optional[datetime.datetime]:
+        """Get Ethereum block timestamp, None if the block is not mined yet"""
+        return self.timestamp_resolver.resolve([block_num])[block_num]
 
     def get_suggested_scan_start_block(self):
         """Get where we should start to scan for new token events.
 
         If there are no prior scans, start from block 1.
-        Otherwise, start from the last end block minus ten blocks.
-        We rescan the last ten scanned blocks in the case there were forks to avoid
+        Otherwise, start after the last scanned block, or at the first block that is no longer on the chain.
+        States without block hashes rescan the last ten scanned blocks in the case there were forks to avoid
         misaccounting due to minor single block works (happens once in a hour in Ethereum).
-        These heurestics could be made more robust, but this is for the sake of simple reference implementation.
         """
 
         end_block = self.get_last_scanned_block()
-        if end_block:
+        if not end_block:
+            return 1
+        if self.state.get_block_hash_index() is None:
             return max(1, end_block - self.NUM_BLOCKS_RESCAN_FOR_FORKS)
-        return 1
+        fork_block = self.find_fork_block()
+        return max(1, fork_block) if fork_block is not None else end_block + 1
+
+    def get_block_hash(self, block_num) -> Optional[str]:
+        """Hash of a block on the chain the node follows, None if the node does not have the block."""
+        self.rate_limiter.acquire()
+        if self.transport is not None:
+            block = self.transport.get_block(block_num)
+            return block["hash"] if block is not None else None
+        try:
+            return self.web3.eth.get_block(block_num)["hash"].hex()
+        except BlockNotFound:
+            return None
+
+    def find_fork_block(self) -> Optional[int]:
+        """First scanned block whose data may be from an abandoned fork, None if everything scanned is intact.
+
+        Blocks scanned after the newest recorded hash, e.g. when a scan was interrupted, cannot be verified
+        and count as forked. A state without any recorded hash rescans its last blocks like before block hashes.
+        """
+        index = self.state.get_block_hash_index()
+        last_scanned_block = self.get_last_scanned_block()
+        if index is None or not last_scanned_block:
+            return None
+        if index.last_block is None:
+            # Saved before block hashes were recorded, nothing to verify against
+            return legacy_fork_block(last_scanned_block, self.NUM_BLOCKS_RESCAN_FOR_FORKS)
+        fork_block = index.find_fork_block(self.get_block_hash)
+        if fork_block is None and (index.last_block or 0) < last_scanned_block:
+            fork_block = (index.last_block or 0) + 1
+        return fork_block
+
+    def rewind_to_fork(self) -> int:
+        """Purge the data of blocks that may be forked, so the scan can resume right after the intact ones.
+
+        :return: First block to scan
+        """
+        start_block = self.get_suggested_scan_start_block()
+        if start_block <= self.get_last_scanned_block():
+            logger.info("Rescanning from block %d for chain reorganisations", start_block)
+            self.delete_potentially_forked_block_data(start_block)
+        return start_block
+
+    def record_block_hashes(self, events: list, end_block: int, end_of_scan: bool, timings: Optional[dict] = None):
+        """Remember the hashes of blocks with events, and of the last block of a scan.
+
+        Event hashes come with the logs for free, only the end of a scan costs an extra block lookup.
+
+        :param timings: Adds up the seconds of the block lookup as `rpc`
+        """
+        index = self.state.get_block_hash_index()
+        if index is None:
+            return
+        # A newer hash already vouches for the blocks of a gap filled behind it
+        last_block = index.last_block or 0
+        index.record_many({evt["blockNumber"]: evt["blockHash"].hex() for evt in events
+                           if evt["blockNumber"] > last_block})
+        if end_of_scan and end_block > last_block:
+            start = time.time()
+            block_hash = self.get_block_hash(end_block)
+            if timings is not None:
+                timings["rpc"] = timings.get("rpc", 0.0) + time.time() - start
+            if block_hash is not None:
+                index.record(end_block, block_hash)
+
+    def record_coverage(self, start_block: int, end_block: int):
+        """Mark a chunk as scanned in the state's coverage, if it keeps one."""
+        coverage = self.state.get_coverage()
+        if coverage is not None:
+            coverage.add(start_block, end_block)
+
+    def plan_gaps(self, start_block: int, end_block: int) -> List[Tuple[int, int]]:
+        """Block ranges between `start_block` and `end_block` the state does not have yet.
+
+        States without coverage only know their last scanned block, everything after it is missing.
+        """
+        coverage = self.state.get_coverage()
+        if coverage is not None:
+            return coverage.gaps(start_block, end_block)
+        start_block = max(start_block, self.get_last_scanned_block() + 1)
+        return [(start_block, end_block)] if start_block <= end_block else []
+
+    def scan_gaps(self, start_block, end_block, start_chunk_size=20,
+                  progress_callback: Optional[Callable] = None) -> Tuple[list, int]:
+        """Scan only the block ranges of `plan_gaps`, e.g. to finish a crashed or out of order run.
+
+        :return: [All processed events, number of chunks used]
+        """
+        all_processed = []
+        total_chunks_scanned = 0
+        for gap_start, gap_end in self.plan_gaps(start_block, end_block):
+            logger.info("Filling gap %d - %d", gap_start, gap_end)
+            processed, chunks = self.scan(gap_start, gap_end, start_chunk_size, progress_callback)
+            all_processed += processed
+            total_chunks_scanned += chunks
+        return all_processed, total_chunks_scanned
 
     def get_suggested_scan_end_block(self):
         """Get the last mined block on Ethereum chain we are following."""
 
         # Do not scan all the way to the final block, as this
         # block might not be mined yet
-        return self.web3.eth.blockNumber - 1
+        return self.get_block_number() - 1
+
+    def get_block_number(self) -> int:
+        """Number of the newest block the node has."""
+        self.rate_limiter.acquire()
+        if self.transport is not None:
+            return self.transport.block_number()
+        return self.web3.eth.block_number
 
     def get_last_scanned_block(self) -> int:
         return self.state.get_last_scanned_block()
@@ -162,64 +348,114 @@ class EventScanner:
         """Purge old data in the case of blockchain reorganisation."""
         self.state.delete_data(after_block)
 
-    def scan_chunk(self, start_block, end_block) -> Tuple[int, datetime.datetime, list]:
-        """Read and process events between to block numbers.
+    def fetch_chunk(self, start_block, end_block, timings: Optional[dict] = None) -> Tuple[int, list, dict]:
+        """Fetch the raw events and block timestamps between two block numbers.
 
+        Does not touch the state, so it can run in a worker thread.
         Dynamically decrease the size of the chunk if the case JSON-RPC server pukes out.
 
-        :return: tuple(actual end block number, when this block was mined, processed events)
+        :param timings: Adds up `requests`, `retries` and the `rpc`, `decode` and `timestamp` seconds of the fetch
+        :return: tuple(actual end block number, raw events, timestamps of blocks with events and the end block)
         """
+        timings = timings if timings is not None else {}
 
+        # Callable that takes care of the underlying web3 call
+        def _fetch_events(_start_block, _end_block):
+            self.rate_limiter.acquire()
+            timings["requests"] = timings.get("requests", 0) + 1
+            start = time.time()
+            events = _fetch_events_for_all_event_types(self.web3,
+                                                       self.event_abis_by_topic,
+                                                       self.filters,
+                                                       from_block=_start_block,
+                                                       to_block=_end_block,
+                                                       timings=timings,
+                                                       transport=self.transport)
+            self.chunk_size_controller.record_success(_end_block - _start_block + 1, len(events), time.time() - start)
+            return events
+
+        # Do `n` retries on `eth_getLogs`,
+        # throttle down block range if needed.
+        # All event types share the request, so they always cover the same range.
+        end_block, all_events = _retry_web3_call(
+            _fetch_events,
+            start_block=start_block,
+            end_block=end_block,
+            retries=self.max_request_retries,
+            controller=self.chunk_size_controller,
+            timings=timings)
+
+        # Resolve all timestamps of the chunk at once, one batch request at most
+        start = time.time()
+        block_timestamps = self.timestamp_resolver.resolve({evt["blockNumber"] for evt in all_events} | {end_block})
+        timings["timestamp"] = timings.get("timestamp", 0.0) + time.time() - start
+
+        return end_block, all_events, block_timestamps
+
+    def fetch_range(self, start_block, end_block, timings: Optional[dict] = None) -> Tuple[list, dict]:
+        """Fetch a whole block range, issuing follow up requests if the node made us throttle down.
+
+        :return: tuple(raw events, block timestamps)
+        """
+        all_events = []
         block_timestamps = {}
-        get_block_timestamp = self.get_block_timestamp
+        current_block = start_block
+        while current_block <= end_block:
+            actual_end_block, events, timestamps = self.fetch_chunk(current_block, end_block, timings)
+            all_events += events
+            block_timestamps.update(timestamps)
+            current_block = actual_end_block + 1
+        return all_events, block_timestamps
 
-        # Cache block timestamps to reduce some RPC overhead
-        # Real solution might include smarter models around block
-        def get_block_when(block_num):
-            if block_num not in block_timestamps:
-                block_timestamps[block_num] = get_block_timestamp(block_num)
-            return block_timestamps[block_num]
+    def process_chunk(self, events: list, block_timestamps: dict) -> list:
+        """Hand fetched events over to the state.
 
+        :return: processed events
+        """
         all_processed = []
+        for evt in events:
+            idx = evt["logIndex"]  # Integer of the log index position in the block, null when its pending
 
-        for event_type in self.events:
-
-            # Callable that takes care of the underlying web3 call
-            def _fetch_events(_start_block, _end_block):
-                return _fetch_events_for_all_contracts(self.web3,
-                                                       event_type,
-                                                       self.filters,
-                                                       from_block=_start_block,
-                                                       to_block=_end_block)
+            # We cannot avoid minor chain reorganisations, but
+            # at least we must avoid blocks that are not mined yet
+            assert idx is not None, "Somehow tried to scan a pending block"
 
-            # Do `n` retries on `eth_getLogs`,
-            # throttle down block range if needed
-            end_block, events = _retry_web3_call(
-                _fetch_events,
-                start_block=start_block,
-                end_block=end_block,
-                retries=self.max_request_retries,
-                delay=self.request_retry_seconds)
+            block_number = evt["blockNumber"]
 
-            for evt in events:
-                idx = evt["logIndex"]  # Integer of the log index position in the block, null when its pending
+            # Get UTC time when this event happened (block mined timestamp)
+            # from our in-memory cache
+            block_when = block_timestamps[block_number]
 
-                # We cannot avoid minor chain reorganisations, but
-                # at least we must avoid blocks that are not mined yet
-                assert idx is not None, "Somehow tried to scan a pending block"
+            logger.debug("Processing event %s, block:%d", evt["event"], evt["blockNumber"])
+            processed = self.state.process_event(block_when, evt)
+            all_processed.append(processed)
+        return all_processed
 
-                block_number = evt["blockNumber"]
+    def scan_chunk(self, start_block, end_block) -> Tuple[int, datetime.datetime, list]:
+        """Read and process events between to block numbers.
 
-                # Get UTC time when this event happened (block mined timestamp)
-                # from our in-memory cache
-                block_when = get_block_when(block_number)
+        Dynamically decrease the size of the chunk if the case JSON-RPC server pukes out.
 
-                logger.debug("Processing event %s, block:%d count:%d", evt["event"], evt["blockNumber"])
-                processed = self.state.process_event(block_when, evt)
-                all_processed.append(processed)
+        :return: tuple(actual end block number, when this block was mined, processed events)
+        """
 
-        end_block_timestamp = get_block_when(end_block)
-        return end_block, end_block_timestamp, all_processed
+        end_block, events, block_timestamps = self.fetch_chunk(start_block, end_block)
+        all_processed = self.process_chunk(events, block_timestamps)
+        return end_block, block_timestamps[end_block], all_processed
+
+    def report_chunk(self, start_block: int, end_block: int, requested_size: int, next_size: int, logs: int,
+                     timings: dict):
+        """Hand the timings of a committed chunk to the hooks."""
+        if not self.hooks:
+            return
+        metrics = ChunkMetrics(
+            start_block=start_block, end_block=end_block, requested_size=requested_size, next_size=next_size,
+            logs=logs, requests=timings.get("requests", 0), retries=timings.get("retries", 0),
+            rpc_seconds=timings.get("rpc", 0.0),
+            decode_seconds=timings.get("decode", 0.0), timestamp_seconds=timings.get("timestamp", 0.0),
+            process_seconds=timings.get("process", 0.0), commit_seconds=timings.get("commit", 0.0))
+        for hook in self.hooks:
+            hook.on_chunk(metrics)
 
     def estimate_next_chunk_size(self, current_chuck_size: int, event_found_count: int):
         """Try to figure out optimal chunk size
@@ -232,25 +468,12 @@ class EventScanner:
 
         * Do not overload node serving JSON-RPC API by asking data for too many events at a time
 
-        Currently Ethereum JSON-API does not have an API to tell when a first event occurred in a blockchain
-        and our heuristics try to accelerate block fetching (chunk size) until we see the first event.
-
-        These heurestics exponentially increase the scan chunk size depending on if we are seeing events or not.
-        When any transfers are encountered, we are back to scanning only a few blocks at a time.
-        It does not make sense to do a full chain scan starting from block 1, doing one JSON-RPC call per 20 blocks.
+        The decision is delegated to the chunk size controller, which sees the event density and latency of
+        every `eth_getLogs` request made so far.
         """
+        return self.chunk_size_controller.next_chunk_size(current_chuck_size, event_found_count)
 
-        if event_found_count > 0:
-            # When we encounter first events, reset the chunk size window
-            current_chuck_size = self.min_scan_chunk_size
-        else:
-            current_chuck_size *= self.chunk_size_increase
-
-        current_chuck_size = max(self.min_scan_chunk_size, current_chuck_size)
-        current_chuck_size = min(self.max_scan_chunk_size, current_chuck_size)
-        return int(current_chuck_size)
-
-    def scan(self, start_block, end_block, start_chunk_size=20, progress_callback=Optional[Callable]) -> Tuple[
+    def scan(self, start_block, end_block, start_chunk_size=20, progress_callback: Optional[Callable] = None) -> Tuple[
         list, int]:
         """Perform a token balances scan.
 
@@ -267,50 +490,171 @@ class EventScanner:
         :return: [All processed events, number of chunks used]
         """
 
+        # All processed entries we got on this scan cycle
+        all_processed = []
+        total_chunks_scanned = 0
+
+        for chunk in self.scan_iter(start_block, end_block, start_chunk_size, progress_callback):
+            all_processed += chunk.processed
+            total_chunks_scanned += 1
+
+        return all_processed, total_chunks_scanned
+
+    def scan_iter(self, start_block, end_block, start_chunk_size=20,
+                  progress_callback: Optional[Callable] = None) -> Iterator[ScannedChunk]:
+        """Scan like `scan`, but yield every chunk instead of collecting all processed events.
+
+        Chunks are yielded in block order after the state processed them and before `end_chunk` commits them,
+        so a consumer that persists the chunk when it receives it never falls behind the state.
+        Memory use depends on the chunk size, not on the length of the scanned history.
+        """
+
         assert start_block <= end_block
 
+        if self.concurrency > 1:
+            yield from self._scan_concurrent(start_block, end_block, start_chunk_size, progress_callback)
+            return
+
         current_block = start_block
 
         # Scan in chunks, commit between
         chunk_size = start_chunk_size
         last_scan_duration = last_logs_found = 0
-        total_chunks_scanned = 0
-
-        # All processed entries we got on this scan cycle
-        all_processed = []
 
         while current_block <= end_block:
             self.state.start_chunk(current_block, chunk_size)
 
             # Print some diagnostics to logs to try to fiddle with real world JSON-RPC API performance
-            estimated_end_block = current_block + chunk_size
+            estimated_end_block = min(current_block + chunk_size, end_block)
             logger.debug(
                 "Scanning token transfers for blocks: %d - %d, chunk size %d, last chunk scan took %f, last logs found %d",
                 current_block, estimated_end_block, chunk_size, last_scan_duration, last_logs_found)
 
             start = time.time()
-            actual_end_block, end_block_timestamp, new_entries = self.scan_chunk(current_block, estimated_end_block)
+            timings = {}
+            actual_end_block, events, block_timestamps = self.fetch_chunk(current_block, estimated_end_block, timings)
+            process_start = time.time()
+            new_entries = self.process_chunk(events, block_timestamps)
+            timings["process"] = time.time() - process_start
+            end_block_timestamp = block_timestamps[actual_end_block]
 
             # Where does our current chunk scan ends - are we out of chain yet?
             current_end = actual_end_block
 
             last_scan_duration = time.time() - start
-            all_processed += new_entries
+            last_logs_found = len(events)
 
             # Print progress bar
             if progress_callback:
                 progress_callback(start_block, end_block, current_block, end_block_timestamp, chunk_size, len(new_entries))
 
+            yield ScannedChunk(current_block, current_end, end_block_timestamp, events, new_entries)
+
             # Try to guess how many blocks to fetch over `eth_getLogs` API next time
+            requested_size = chunk_size
             chunk_size = self.estimate_next_chunk_size(chunk_size, len(new_entries))
 
+            # The end of scan block lookup counts as rpc time, not commit time
+            self.record_block_hashes(events, current_end, current_end >= end_block, timings)
+            commit_start = time.time()
+            self.record_coverage(current_block, current_end)
+            self.state.end_chunk(current_end)
+            timings["commit"] = time.time() - commit_start
+            self.report_chunk(current_block, current_end, requested_size, chunk_size, len(events), timings)
+
             # Set where the next chunk starts
             current_block = current_end + 1
-            total_chunks_scanned += 1
-            self.state.end_chunk(current_end)
 
+    def scan_concurrent(self, start_block, end_block, start_chunk_size=20,
+                        progress_callback: Optional[Callable] = None) -> Tuple[list, int]:
+        """Scan with up to `max_in_flight` disjoint block ranges requested at once.
+
+        :return: [All processed events, number of chunks used]
+        """
+        all_processed = []
+        total_chunks_scanned = 0
+        for chunk in self._scan_concurrent(start_block, end_block, start_chunk_size, progress_callback):
+            all_processed += chunk.processed
+            total_chunks_scanned += 1
         return all_processed, total_chunks_scanned
 
+    def _scan_concurrent(self, start_block, end_block, start_chunk_size=20,
+                         progress_callback: Optional[Callable] = None) -> Iterator[ScannedChunk]:
+        """Yield chunks fetched by up to `max_in_flight` concurrent requests.
+
+        Worker threads only fetch. Chunks are handed to the state in block order on the calling thread,
+        so `last_scanned_block` never moves past a block range that has not been processed yet.
+        """
+
+        assert start_block <= end_block
+
+        chunk_size = start_chunk_size
+
+        # (chunk start, chunk end, requested chunk size, future, timings) in block order
+        in_flight = deque()
+        next_block = start_block
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            try:
+                while next_block <= end_block or in_flight:
+                    # Keep the request window full, sized by the latest chunk size estimate
+                    while next_block <= end_block and len(in_flight) < self.max_in_flight:
+                        chunk_end = min(next_block + chunk_size, end_block)
+                        timings = {}
+                        future = executor.submit(self.fetch_range, next_block, chunk_end, timings)
+                        in_flight.append((next_block, chunk_end, chunk_size, future, timings))
+                        next_block = chunk_end + 1
+
+                    current_block, current_end, requested_size, future, timings = in_flight.popleft()
+                    events, block_timestamps = future.result()
+
+                    # The chunk size the range was requested with, like the sequential scan
+                    self.state.start_chunk(current_block, requested_size)
+                    process_start = time.time()
+                    new_entries = self.process_chunk(events, block_timestamps)
+                    timings["process"] = time.time() - process_start
+
+                    if progress_callback:
+                        progress_callback(start_block, end_block, current_block, block_timestamps[current_end],
+                                          current_end - current_block + 1, len(new_entries))
+
+                    yield ScannedChunk(current_block, current_end, block_timestamps[current_end], events, new_entries)
+
+                    chunk_size = self.estimate_next_chunk_size(chunk_size, len(new_entries))
+                    # The end of scan block lookup counts as rpc time, not commit time
+                    self.record_block_hashes(events, current_end, current_end >= end_block, timings)
+                    commit_start = time.time()
+                    self.record_coverage(current_block, current_end)
+                    self.state.end_chunk(current_end)
+                    timings["commit"] = time.time() - commit_start
+                    self.report_chunk(current_block, current_end, requested_size, chunk_size, len(events), timings)
+            finally:
+                # Failed or abandoned by the consumer, do not wait for requests nobody will process
+                for _, _, _, pending, _ in in_flight:
+                    pending.cancel()
+
+
+class WatermarkState(EventScannerState):
+    """Remember only the last scanned block, for streaming scans where the consumer of `scan_iter` stores events."""
+
+    def __init__(self, last_scanned_block: int = 0):
+        self.last_scanned_block = last_scanned_block
+
+    def get_last_scanned_block(self) -> int:
+        return self.last_scanned_block
+
+    def start_chunk(self, block_number: int, chunk_size: int):
+        pass
+
+    def end_chunk(self, block_number: int):
+        self.last_scanned_block = block_number
+
+    def process_event(self, block_when: datetime.datetime, event: AttributeDict) -> str:
+        return f"{event.blockNumber}-{event.transactionHash.hex()}-{event.logIndex}"
+
+    def delete_data(self, since_block: int) -> int:
+        return 0
+
 
 class JSONifiedState(EventScannerState):
     """Store the state of scanned blocks and all events.
@@ -319,23 +663,35 @@ class JSONifiedState(EventScannerState):
     Simple load/store massive JSON on start up.
     """
 
-    def __init__(self, file_name):
+    def __init__(self, file_name: str, directory: str = "state"):
+        """
+        :param file_name: State file in `directory`, an absolute path is used as is
+        :param directory: Where the state is kept
+        """
         self.state = None
-        self.path = "state/" + file_name
+        self.path = os.path.join(directory, file_name)
         # How many second ago we saved the JSON file
         self.last_save = 0
+        self.block_hashes = BlockHashIndex()
+        self.coverage = BlockCoverage()
 
     def reset(self):
         """Create initial state of nothing scanned."""
         self.state = {
             "last_scanned_block": 0,
             "blocks": {},
+            "block_hashes": {},
+            "coverage": [],
         }
+        self.block_hashes = BlockHashIndex()
+        self.coverage = BlockCoverage()
 
     def restore(self):
         """Restore the last scan state from a file."""
         try:
             self.state = json.load(open(self.path, "rt"))
+            self.block_hashes = BlockHashIndex(self.state.get("block_hashes"))
+            self.coverage = BlockCoverage(self.state.get("coverage", legacy_coverage(self.state["last_scanned_block"])))
             print(f"Restored the state, previously {self.state['last_scanned_block']} blocks have been scanned")
         except (IOError, json.decoder.JSONDecodeError):
             print("State starting from scratch")
@@ -343,6 +699,8 @@ class JSONifiedState(EventScannerState):
 
     def save(self):
         """Save everything we have scanned so far in a file."""
+        self.state["block_hashes"] = self.block_hashes.to_dict()
+        self.state["coverage"] = self.coverage.to_list()
         with open(self.path, "wt") as f:
             json.dump(self.state, f)
         self.last_save = time.time()
@@ -357,17 +715,29 @@ class JSONifiedState(EventScannerState):
 
     def delete_data(self, since_block):
         """Remove potentially reorganised blocks from the scan data."""
-        for block_num in range(since_block, self.get_last_scanned_block()):
-            if block_num in self.state["blocks"]:
-                del self.state["blocks"][block_num]
+        # Block keys are ints when scanned in this process and strings once restored from JSON
+        forked = [block for block in self.state["blocks"] if int(block) >= since_block]
+        for block in forked:
+            del self.state["blocks"][block]
+        self.state["last_scanned_block"] = min(self.state["last_scanned_block"], since_block - 1)
+        self.block_hashes.truncate(since_block)
+        self.coverage.truncate(since_block)
+        return len(forked)
+
+    def get_block_hash_index(self) -> BlockHashIndex:
+        return self.block_hashes
+
+    def get_coverage(self) -> BlockCoverage:
+        return self.coverage
 
     def start_chunk(self, block_number, chunk_size):
         pass
 
     def end_chunk(self, block_number):
         """Save at the end of each block, so we can resume in the case of a crash or CTRL+C"""
-        # Next time the scanner is started we will resume from this block
-        self.state["last_scanned_block"] = block_number
+        # Next time the scanner is started we will resume from this block,
+        # filling a gap behind it does not move it back
+        self.state["last_scanned_block"] = max(self.state["last_scanned_block"], block_number)
 
         # Save the database file for every minute
         if time.time() - self.last_save > 60:
@@ -424,7 +794,18 @@ class JSONifiedState(EventScannerState):
         return f"{block_number}-{txhash}-{log_index}"
 
 
-def _retry_web3_call(func, start_block, end_block, retries, delay) -> Tuple[int, list]:
+def legacy_coverage(last_scanned_block: int) -> List[List[int]]:
+    """Coverage of a state saved before coverage was kept, which scanned up to its last scanned block."""
+    return [[1, last_scanned_block]] if last_scanned_block > 0 else []
+
+
+def legacy_fork_block(last_scanned_block: int, rescan_blocks: int) -> int:
+    """First block to rescan of a state saved before block hashes, its last `rescan_blocks` blocks may be forked."""
+    return max(1, last_scanned_block - rescan_blocks)
+
+
+def _retry_web3_call(func, start_block, end_block, retries, controller: ChunkSizeController,
+                     timings: Optional[dict] = None) -> Tuple[int, list]:
     """A custom retry loop to throttle down block range.
 
     If our JSON-RPC server cannot serve all incoming `eth_getLogs` in a single request,
@@ -437,7 +818,8 @@ def _retry_web3_call(func, start_block, end_block, retries, delay) -> Tuple[int,
     :param start_block: The initial start block of the block range
     :param end_block: The initial start block of the block range
     :param retries: How many times we retry
-    :param delay: Time to sleep between retries
+    :param controller: Decides the reduced block range and how long to wait before each retry
+    :param timings: Counts the failed calls that were retried as `retries`
     """
     for i in range(retries):
         try:
@@ -447,16 +829,19 @@ def _retry_web3_call(func, start_block, end_block, retries, delay) -> Tuple[int,
             # from Go Ethereum. This translates to the error "context was cancelled" on the server side:
             # https://github.com/ethereum/go-ethereum/issues/20426
             if i < retries - 1:
+                if timings is not None:
+                    timings["retries"] = timings.get("retries", 0) + 1
+                # Decrease the `eth_getBlocks` range
+                new_end_block, delay = controller.record_failure(start_block, end_block, i, e)
                 # Give some more verbose info than the default middleware
                 logger.warning(
-                    "Retrying events for block range %d - %d (%d) failed with %s, retrying in %s seconds",
+                    "Retrying events for block range %d - %d (%d) failed with %s, retrying in %.2f seconds",
                     start_block,
                     end_block,
                     end_block-start_block,
                     e,
                     delay)
-                # Decrease the `eth_getBlocks` range
-                end_block = start_block + ((end_block - start_block) // 2)
+                end_block = new_end_block
                 # Let the JSON-RPC to recover e.g. from restart
                 time.sleep(delay)
                 continue
@@ -465,63 +850,55 @@ def _retry_web3_call(func, start_block, end_block, retries, delay) -> Tuple[int,
                 raise
 
 
-def _fetch_events_for_all_contracts(
+def build_event_abis_by_topic(events: List) -> Dict[bytes, dict]:
+    """Map the topic0 (keccak of the event signature) of each web3 Event to its ABI."""
+    return {event_abi_to_log_topic(abi): abi for abi in (event._get_event_abi() for event in events)}
+
+
+def _fetch_events_for_all_event_types(
         web3,
-        event,
+        event_abis_by_topic: Dict[bytes, dict],
         argument_filters: dict,
         from_block: int,
-        to_block: int) -> Iterable:
-    """Get events using eth_getLogs API.
-
-    This method is detached from any contract instance.
-
-    This is a stateless method, as opposed to createFilter.
-    It can be safely called against nodes which do not provide `eth_newFilter` API, like Infura.
+        to_block: int,
+        timings: Optional[dict] = None,
+        transport: Optional[JsonRpcTransport] = None) -> List:
+    """Get events of several types using a single eth_getLogs call.
+
+    The request ORs all event signatures in topic0. Sync and Swap logs are sliced by the fast decoder,
+    any other log is decoded with the ABI found by its topic0.
+    Only the `address` filter is honoured, as indexed argument filters differ between event types.
+
+    :param timings: Adds up the seconds spent in the request as `rpc` and in decoding as `decode`
+    :param transport: Fetches the logs instead of `web3.eth.get_logs`
+    :return: Decoded events sorted by (blockNumber, logIndex)
     """
 
     if from_block is None:
         raise TypeError("Missing mandatory keyword argument to getLogs: fromBlock")
 
-    # Currently no way to poke this using a public Web3.py API.
-    # This will return raw underlying ABI JSON object for the event
-    abi = event._get_event_abi()
-
-    # Depending on the Solidity version used to compile
-    # the contract that uses the ABI,
-    # it might have Solidity ABI encoding v1 or v2.
-    # We just assume the default that you set on Web3 object here.
-    # More information here https://eth-abi.readthedocs.io/en/latest/index.html
-    codec: ABICodec = web3.codec
-
-    # Here we need to poke a bit into Web3 internals, as this
-    # functionality is not exposed by default.
-    # Construct JSON-RPC raw filter presentation based on human readable Python descriptions
-    # Namely, convert event names to their keccak signatures
-    # More information here:
-    # https://github.com/ethereum/web3.py/blob/e176ce0793dafdd0573acc8d4b76425b6eb604ca/web3/_utils/filters.py#L71
-    data_filter_set, event_filter_params = construct_event_filter_params(
-        abi,
-        codec,
-        address=argument_filters.get("address"),
-        argument_filters=argument_filters,
-        fromBlock=from_block,
-        toBlock=to_block
-    )
+    event_filter_params = {
+        "fromBlock": from_block,
+        "toBlock": to_block,
+        "topics": [[encode_hex(topic) for topic in event_abis_by_topic]],
+    }
+    if argument_filters.get("address") is not None:
+        event_filter_params["address"] = argument_filters["address"]
 
     logger.debug("Querying eth_getLogs with the following parameters: %s", event_filter_params)
 
-    # Call JSON-RPC API on your Ethereum node.
-    # get_logs() returns raw AttributedDict entries
-    logs = web3.eth.get_logs(event_filter_params)
-
-    # Convert raw binary data to Python proxy objects as described by ABI
-    all_events = []
-    for log in logs:
-        # Convert raw JSON-RPC log result to human readable event by using ABI data
-        # More information how processLog works here
-        # https://github.com/ethereum/web3.py/blob/fbaf1ad11b0c7fac09ba34baff2c256cffe0a148/web3/_utils/events.py#L200
-        evt = get_event_data(codec, abi, log)
-        # Note: This was originally yield,
-        # but deferring the timeout exception caused the throttle logic not to work
-        all_events.append(evt)
-    return all_events
+    timings = timings if timings is not None else {}
+    start = time.time()
+    try:
+        if transport is not None:
+            logs = transport.get_logs(event_filter_params)
+        else:
+            logs = web3.eth.get_logs(event_filter_params)
+    finally:
+        timings["rpc"] = timings.get("rpc", 0.0) + time.time() - start
+
+    start = time.time()
+    codec: ABICodec = web3.codec
+    events = decode_logs(codec, event_abis_by_topic, logs).to_events()
+    timings["decode"] = timings.get("decode", 0.0) + time.time() - start
+    return events
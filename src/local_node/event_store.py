@@ -0,0 +1,350 @@
+"""Scanned events held as flat columns instead of nested dicts.
+
+`JSONifiedState` keeps every event as `blocks[block][txhash hex][log_index] = {field: value}`: three dicts deep, a
+66 character string per transaction and a dict per event repeating its field names. `EventStore` appends each event
+to typed `array.array` columns instead, about fifty bytes per event:
+
+* block and log index of every event, plus one byte for its kind, which of its values are not zero and whether it
+  starts a new transaction
+* each transaction hash once, as 32 bytes, shared by the consecutive events of the transaction
+* a pool of the integers of all events, each in as few little endian bytes as it needs, with its length in a byte
+  of its own: a Swap's interned sender and recipient ids, then every value that is not zero, as a Swap rarely has
+  more than two
+
+Events are appended in (block, log index) order, so a reorg truncates the columns from a block found by bisection.
+Like `JSONifiedState`, block timestamps are not kept.
+"""
+
+import bisect
+import datetime
+import io
+import json
+import os
+import time
+from array import array
+from typing import Dict, List, Optional
+
+import numpy as np
+from pandas import DataFrame
+from web3.datastructures import AttributeDict
+
+from src.local_node.block_hashes import BlockHashIndex
+from src.local_node.event_log import SWAP, SYNC
+from src.local_node.event_scanner import EventScannerState
+from src.local_node.process_state_to_df import ProcessStateToDF, SWAP_COLUMNS
+from src.local_node.uint128 import UInt128Column
+
+# Values by event kind, in the order they are passed to `EventStore.append`
+VALUE_FIELDS = {
+    SYNC: ('reserve0', 'reserve1'),
+    SWAP: ('amount0In', 'amount1In', 'amount0Out', 'amount1Out'),
+}
+VALUE_SLOTS = max(len(fields) for fields in VALUE_FIELDS.values())
+# Low bits of the flags byte hold the kind, then a bit per value that is not zero, the top bit a new transaction
+KIND_BITS = 2
+KIND_MASK = (1 << KIND_BITS) - 1
+NEW_TX = 1 << (KIND_BITS + VALUE_SLOTS)
+# Integers in the pool are at most 128 bits
+MAX_INT_BYTES = 16
+
+
+class EventStore:
+    """Append-only struct of arrays of Sync and Swap events."""
+
+    # Column name to `array` type code, one entry per event. Log indexes stay far below 2 ** 16 within a block.
+    COLUMNS = {'block': 'I', 'log_index': 'H', 'flags': 'B'}
+
+    def __init__(self):
+        self.columns: Dict[str, array] = {name: array(code) for name, code in self.COLUMNS.items()}
+        # Integers of all events one after the other, see `int_counts`, and the byte length of each
+        self.pool = bytearray()
+        self.lengths = array('B')
+        # Hash of transaction i at bytes [32 * i, 32 * i + 32)
+        self.txhashes = bytearray()
+        self.addresses: List[str] = []
+        self.address_ids: Dict[str, int] = {}
+
+    def __len__(self):
+        return len(self.columns['block'])
+
+    @property
+    def last_block(self) -> Optional[int]:
+        return self.columns['block'][-1] if len(self) else None
+
+    def nbytes(self) -> int:
+        """Bytes held by the columns, the integer pool and the transaction hashes."""
+        columns = sum(column.itemsize * len(column) for column in self.columns.values())
+        return columns + len(self.pool) + len(self.lengths) + len(self.txhashes)
+
+    def _address_id(self, address: str) -> int:
+        address_id = self.address_ids.get(address)
+        if address_id is None:
+            address_id = self.address_ids[address] = len(self.addresses)
+            self.addresses.append(address)
+        return address_id
+
+    def _push(self, value: int):
+        length = (value.bit_length() + 7) // 8
+        self.pool += value.to_bytes(length, 'little')
+        self.lengths.append(length)
+
+    def append(self, block: int, log_index: int, txhash: bytes, kind: int, values: tuple,
+               sender: Optional[str] = None, to: Optional[str] = None):
+        """Add an event after all stored ones.
+
+        :param values: Reserves of a Sync or amounts of a Swap, in the order of `VALUE_FIELDS`
+        :raise ValueError: If the event is not after the last stored one
+        :raise OverflowError: If a value does not fit 128 bits, or the log index 16 bits
+        """
+        columns = self.columns
+        if len(self) and (block, log_index) <= (columns['block'][-1], columns['log_index'][-1]):
+            raise ValueError(f"Event {block}-{log_index} is not after the last stored event, "
+                             f"truncate from its block first")
+        if any(value >> 128 for value in values):
+            raise OverflowError(f"Event in block {block} has a value that does not fit 128 bits")
+        if log_index >> 16:
+            raise OverflowError(f"Event {block}-{log_index} has a log index that does not fit 16 bits")
+        flags = kind
+        # Events of one transaction are consecutive, a hash equal to the last one is the same transaction
+        if not self.txhashes or self.txhashes[-32:] != txhash:
+            self.txhashes += txhash
+            flags |= NEW_TX
+
+        columns['block'].append(block)
+        columns['log_index'].append(log_index)
+        if kind == SWAP:
+            self._push(self._address_id(sender))
+            self._push(self._address_id(to))
+        for slot, value in enumerate(values):
+            if value:
+                flags |= 1 << (KIND_BITS + slot)
+                self._push(value)
+        columns['flags'].append(flags)
+
+    def truncate(self, since_block: int) -> int:
+        """Drop all events from `since_block` on.
+
+        :return: Number of dropped events
+        """
+        cut = bisect.bisect_left(self.columns['block'], since_block)
+        dropped = len(self) - cut
+        if dropped:
+            flags = self.array('flags')[cut:].copy()
+            dropped_txs = int(np.count_nonzero(flags & NEW_TX))
+            dropped_ints = int(self.int_counts(flags).sum())
+            kept_ints = len(self.lengths) - dropped_ints
+            del self.pool[len(self.pool) - int(self.array('lengths')[kept_ints:].sum()):]
+            del self.lengths[kept_ints:]
+            del self.txhashes[len(self.txhashes) - 32 * dropped_txs:]
+            for column in self.columns.values():
+                del column[cut:]
+        return dropped
+
+    @staticmethod
+    def int_counts(flags: np.ndarray) -> np.ndarray:
+        """Pool integers of each event, the two address ids of a Swap and one per value that is not zero."""
+        counts = 2 * ((flags & KIND_MASK) == SWAP).astype(np.int64)
+        for slot in range(VALUE_SLOTS):
+            counts += flags >> (KIND_BITS + slot) & 1
+        return counts
+
+    def first_ints(self) -> np.ndarray:
+        """Index of the first pool integer of each event."""
+        counts = self.int_counts(self.array('flags'))
+        return np.concatenate(([0], np.cumsum(counts)[:-1])) if len(counts) else counts
+
+    def tx_ids(self) -> np.ndarray:
+        """Transaction of each event, as an index into `txhashes`."""
+        return np.cumsum(self.array('flags') & NEW_TX != 0) - 1
+
+    def decode_ints(self) -> UInt128Column:
+        """All integers of the pool, in pool order."""
+        lengths = self.array('lengths').astype(np.int64)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1])) if len(lengths) else lengths
+        raw = np.zeros((len(lengths), MAX_INT_BYTES), dtype=np.uint8)
+        present = np.arange(MAX_INT_BYTES) < lengths[:, None]
+        pool = np.frombuffer(self.pool, dtype=np.uint8) if self.pool else np.empty(0, dtype=np.uint8)
+        raw[present] = pool[(starts[:, None] + np.arange(MAX_INT_BYTES))[present]]
+        words = raw.view('<u8').astype(np.uint64)
+        return UInt128Column(words[:, 1], words[:, 0])
+
+    def array(self, name: str) -> np.ndarray:
+        """A column or `lengths` as a NumPy array sharing its memory, only valid until the next append or truncate."""
+        column = self.lengths if name == 'lengths' else self.columns[name]
+        return np.frombuffer(column, dtype=column.typecode) if len(column) else np.empty(0, dtype=column.typecode)
+
+    def to_blocks(self, from_block: int = 0) -> dict:
+        """Events in the nested format of `JSONifiedState`, as expected by `ProcessStateToDF.process_state`."""
+        blocks = {}
+        first = bisect.bisect_left(self.columns['block'], from_block)
+        ints = iter(self.decode_ints().to_ints()[int(self.first_ints()[first]) if first < len(self) else 0:])
+        tx_ids = self.tx_ids()
+        for position in range(first, len(self)):
+            flags = self.columns['flags'][position]
+            fields = {}
+            if flags & KIND_MASK == SWAP:
+                fields['sender'] = self.addresses[next(ints)]
+                fields['to'] = self.addresses[next(ints)]
+            for slot, field in enumerate(VALUE_FIELDS[flags & KIND_MASK]):
+                fields[field] = next(ints) if flags >> (KIND_BITS + slot) & 1 else 0
+            tx = int(tx_ids[position])
+            block = blocks.setdefault(self.columns['block'][position], {})
+            block.setdefault('0x' + self.txhashes[32 * tx:32 * tx + 32].hex(), {})[
+                self.columns['log_index'][position]] = fields
+        return blocks
+
+    def to_columns(self) -> dict:
+        """Sorted columns like `ProcessStateToDF.flatten_state`, without building per event dicts."""
+        count = len(self)
+        flags = self.array('flags')
+        kind = flags & KIND_MASK
+        block = self.array('block').astype(np.int64)
+        columns = {
+            'block': block,
+            'block_number': block,
+            'tx': self.tx_ids(),
+            'log_index': self.array('log_index').astype(np.int64),
+            'is_sync': kind == SYNC,
+            'is_swap': kind == SWAP,
+        }
+        for key in ['reserve0', 'reserve1'] + SWAP_COLUMNS:
+            columns[key] = np.full(count, None, dtype=object)
+
+        ints = self.decode_ints()
+        first_ints = self.first_ints()
+        for event_kind, fields in VALUE_FIELDS.items():
+            rows = np.flatnonzero(kind == event_kind)
+            index = first_ints[rows]
+            if event_kind == SWAP:
+                addresses = np.array(self.addresses, dtype=object)
+                columns['sender'][rows] = addresses[ints.lo[index].astype(np.int64)]
+                columns['to'][rows] = addresses[ints.lo[index + 1].astype(np.int64)]
+                index = index + 2
+            for slot, field in enumerate(fields):
+                present = (flags[rows] >> (KIND_BITS + slot) & 1).astype(bool)
+                hi = np.zeros(len(rows), dtype=np.uint64)
+                lo = np.zeros(len(rows), dtype=np.uint64)
+                hi[present] = ints.hi[index[present]]
+                lo[present] = ints.lo[index[present]]
+                columns[field][rows] = UInt128Column(hi, lo).to_ints()
+                index = index + present
+        return columns
+
+    def swaps(self) -> DataFrame:
+        """The swap DataFrame of `ProcessStateToDF.process_state`."""
+        return ProcessStateToDF.pair_swaps(self.to_columns())
+
+    def to_npz(self, f, **extra):
+        """Write the columns, integer pool, hashes and address table as an uncompressed `.npz` archive."""
+        arrays = {name: self.array(name) for name in list(self.columns) + ['lengths']}
+        np.savez(f, txhashes=np.frombuffer(bytes(self.txhashes), dtype=np.uint8),
+                 pool=np.frombuffer(bytes(self.pool), dtype=np.uint8),
+                 addresses=np.array(json.dumps(self.addresses)), **arrays, **extra)
+
+    @classmethod
+    def from_npz(cls, archive) -> 'EventStore':
+        store = cls()
+        for name, code in dict(cls.COLUMNS, lengths='B').items():
+            column = array(code, archive[name].astype(np.dtype(code)).tobytes())
+            if name == 'lengths':
+                store.lengths = column
+            else:
+                store.columns[name] = column
+        store.pool = bytearray(archive['pool'].tobytes())
+        store.txhashes = bytearray(archive['txhashes'].tobytes())
+        store.addresses = json.loads(str(archive['addresses']))
+        store.address_ids = {address: i for i, address in enumerate(store.addresses)}
+        return store
+
+
+class CompactState(EventScannerState):
+    """Like `JSONifiedState`, but with the events in an `EventStore` saved as a `.npz` archive."""
+
+    def __init__(self, file_name: str, directory: str = "state"):
+        """
+        :param file_name: State file in `directory`, an absolute path is used as is
+        :param directory: Where the state is kept
+        """
+        self.path = os.path.join(directory, file_name)
+        self.store = EventStore()
+        self.last_scanned_block = 0
+        # How many second ago we saved the archive
+        self.last_save = 0
+        self.block_hashes = BlockHashIndex()
+
+    def reset(self):
+        """Create initial state of nothing scanned."""
+        self.store = EventStore()
+        self.last_scanned_block = 0
+        self.block_hashes = BlockHashIndex()
+
+    def restore(self):
+        """Restore the last scan state from a file."""
+        try:
+            with np.load(self.path) as archive:
+                self.store = EventStore.from_npz(archive)
+                self.last_scanned_block = int(archive['last_scanned_block'])
+                self.block_hashes = BlockHashIndex(json.loads(str(archive['block_hashes'])))
+            print(f"Restored the state, previously {self.last_scanned_block} blocks have been scanned")
+        except (IOError, ValueError, KeyError):
+            print("State starting from scratch")
+            self.reset()
+
+    def save(self):
+        """Save everything we have scanned so far in a file."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        buffer = io.BytesIO()
+        self.store.to_npz(buffer, last_scanned_block=np.array(self.last_scanned_block),
+                          block_hashes=np.array(json.dumps(self.block_hashes.to_dict())))
+        with open(self.path + ".tmp", "wb") as f:
+            f.write(buffer.getbuffer())
+        os.replace(self.path + ".tmp", self.path)
+        self.last_save = time.time()
+
+    #
+    # EventScannerState methods implemented below
+    #
+
+    def get_last_scanned_block(self) -> int:
+        """The number of the last block we have stored."""
+        return self.last_scanned_block
+
+    def delete_data(self, since_block: int) -> int:
+        """Remove potentially reorganised blocks from the scan data."""
+        deleted = self.store.truncate(since_block)
+        self.last_scanned_block = min(self.last_scanned_block, since_block - 1)
+        self.block_hashes.truncate(since_block)
+        return deleted
+
+    def get_block_hash_index(self) -> BlockHashIndex:
+        return self.block_hashes
+
+    def start_chunk(self, block_number, chunk_size):
+        pass
+
+    def end_chunk(self, block_number):
+        """Save at the end of each block, so we can resume in the case of a crash or CTRL+C"""
+        self.last_scanned_block = block_number
+
+        # Save the database file for every minute
+        if time.time() - self.last_save > 60:
+            self.save()
+
+    def process_event(self, block_when: Optional[datetime.datetime], event: AttributeDict) -> str:
+        """Append a Sync or Swap event to the store."""
+        log_index = event.logIndex
+        block_number = event.blockNumber
+        args = event["args"]
+
+        if event["event"] == "Sync":
+            self.store.append(block_number, log_index, bytes(event.transactionHash), SYNC,
+                              (args["reserve0"], args["reserve1"]))
+        elif event["event"] == "Swap":
+            self.store.append(block_number, log_index, bytes(event.transactionHash), SWAP,
+                              (args["amount0In"], args["amount1In"], args["amount0Out"], args["amount1Out"]),
+                              args["sender"], args["to"])
+
+        # Return a pointer that allows us to look up this event later if needed
+        return f"{block_number}-{event.transactionHash.hex()}-{log_index}"
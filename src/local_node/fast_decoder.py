@@ -0,0 +1,147 @@
+"""Decode Uniswap V2 Sync and Swap logs without going through the ABI machinery of web3.py.
+
+Both events have a fixed layout, so their fields are sliced straight out of the 32 byte words of the
+log `data` and `topics`:
+
+* Sync: data = reserve0 (uint112) | reserve1 (uint112)
+* Swap: data = amount0In | amount1In | amount0Out | amount1Out (uint256), topics[1] = sender, topics[2] = to
+
+A whole `eth_getLogs` batch is decoded into column lists. Any other event, or a Sync or Swap log without the
+expected topics and data, falls back to web3's `get_event_data`.
+"""
+
+import heapq
+from typing import Dict, Iterator, List, Union
+
+from eth_abi.codec import ABICodec
+from eth_utils import event_signature_to_log_topic, to_checksum_address
+from hexbytes import HexBytes
+from web3._utils.events import get_event_data
+
+SYNC_TOPIC = event_signature_to_log_topic("Sync(uint112,uint112)")
+SWAP_TOPIC = event_signature_to_log_topic("Swap(address,uint256,uint256,uint256,uint256,address)")
+
+SYNC_FIELDS = ('reserve0', 'reserve1')
+SWAP_AMOUNT_FIELDS = ('amount0In', 'amount1In', 'amount0Out', 'amount1Out')
+SWAP_FIELDS = ('sender', 'to') + SWAP_AMOUNT_FIELDS
+
+LOG_FIELDS = ('blockNumber', 'logIndex', 'transactionIndex', 'transactionHash', 'blockHash', 'address')
+
+# Distinct senders and receivers remembered before the address cache starts over
+MAX_CACHED_ADDRESSES = 4096
+
+
+class EventRecord(dict):
+    """A dict with attribute access, a cheap stand-in for web3's AttributeDict."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class EventColumns:
+    """Decoded logs of one event type as one list per field."""
+
+    def __init__(self, event: str, fields: tuple):
+        self.event = event
+        self.fields = fields
+        self.columns: Dict[str, list] = {name: [] for name in LOG_FIELDS + fields}
+
+    def __len__(self):
+        return len(self.columns['blockNumber'])
+
+    def __getitem__(self, name) -> list:
+        return self.columns[name]
+
+    def append_log(self, log: dict):
+        for name in LOG_FIELDS:
+            self.columns[name].append(log[name])
+
+    def records(self) -> Iterator[EventRecord]:
+        """Rebuild per event records in the shape `get_event_data` returns, in log order."""
+        event = self.event
+        log_fields = LOG_FIELDS + ('event', 'args')
+        log_columns = [self.columns[name] for name in LOG_FIELDS] + [[event] * len(self)]
+        args = (EventRecord(zip(self.fields, values)) for values in zip(*(self.columns[name] for name in self.fields)))
+        for values in zip(*log_columns, args):
+            yield EventRecord(zip(log_fields, values))
+
+
+class DecodedLogBatch:
+    """Sync and Swap columns of one `eth_getLogs` response, plus generically decoded events of other types."""
+
+    def __init__(self):
+        self.sync = EventColumns('Sync', SYNC_FIELDS)
+        self.swap = EventColumns('Swap', SWAP_FIELDS)
+        self.other: List[dict] = []
+
+    def __len__(self):
+        return len(self.sync) + len(self.swap) + len(self.other)
+
+    def to_events(self) -> List[dict]:
+        """All events as records sorted by (blockNumber, logIndex), ready for `EventScannerState.process_event`.
+
+        Each kind of event is already in log order, so they are merged rather than sorted.
+        """
+        return list(heapq.merge(self.sync.records(), self.swap.records(), self.other,
+                                key=lambda evt: (evt['blockNumber'], evt['logIndex'])))
+
+
+def _words(data: Union[str, bytes]) -> bytes:
+    if isinstance(data, str):
+        return bytes.fromhex(data[2:] if data.startswith('0x') else data)
+    return data
+
+
+def _word(data: bytes, i: int) -> int:
+    return int.from_bytes(data[32 * i:32 * (i + 1)], 'big')
+
+
+class _AddressCache(dict):
+    """Checksumming hashes the address, remember the few distinct senders and receivers we see.
+
+    Starts over once it holds `MAX_CACHED_ADDRESSES`, so a long scan over many traders stays bounded.
+    """
+
+    def __missing__(self, topic: bytes) -> str:
+        if len(self) >= MAX_CACHED_ADDRESSES:
+            self.clear()
+        address = to_checksum_address(topic[12:])
+        self[topic] = address
+        return address
+
+
+_addresses = _AddressCache()
+
+
+def decode_logs(codec: ABICodec, event_abis_by_topic: Dict[bytes, dict], logs: List[dict]) -> DecodedLogBatch:
+    """Decode a batch of raw logs into columns.
+
+    :param event_abis_by_topic: ABIs of the events we scan, by topic0, used for logs of other events than Sync and Swap
+    :param logs: Logs as returned by `web3.eth.get_logs` or `JsonRpcTransport.get_logs`, whose topics stay hex strings
+    """
+    batch = DecodedLogBatch()
+    sync, swap = batch.sync, batch.swap
+    for log in logs:
+        topics = log['topics']
+        topic0 = bytes(HexBytes(topics[0]))
+
+        data = _words(log['data']) if topic0 in (SYNC_TOPIC, SWAP_TOPIC) else None
+
+        if topic0 == SYNC_TOPIC and len(topics) == 1 and len(data) == 64:
+            sync.append_log(log)
+            sync['reserve0'].append(_word(data, 0))
+            sync['reserve1'].append(_word(data, 1))
+        elif topic0 == SWAP_TOPIC and len(topics) == 3 and len(data) == 128:
+            swap.append_log(log)
+            swap['sender'].append(_addresses[bytes(HexBytes(topics[1]))])
+            swap['to'].append(_addresses[bytes(HexBytes(topics[2]))])
+            for i, name in enumerate(SWAP_AMOUNT_FIELDS):
+                swap[name].append(_word(data, i))
+        else:
+            if isinstance(topics[0], str):
+                log = dict(log, topics=[HexBytes(topic) for topic in topics])
+            batch.other.append(get_event_data(codec, event_abis_by_topic[topic0], log))
+    return batch
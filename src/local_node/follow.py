@@ -0,0 +1,164 @@
+"""Follow the chain head, scanning and committing new blocks as soon as the node has them.
+
+Polls `eth_blockNumber` over plain HTTP, no websocket subscription needed. Polls are timed around when the next
+block is expected, from the block time seen so far, and back off while a block is late. Every commit records how
+long it took from first seeing the block at the head until its events were committed.
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Callable, Deque, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from src.local_node.event_scanner import EventScanner, ScannedChunk
+
+logger = logging.getLogger(__name__)
+
+
+class PolledRange(NamedTuple):
+    """Blocks committed by one poll, the events themselves are in the state."""
+    start_block: int
+    end_block: int
+    chunks: int
+    events: int
+
+
+class AdaptivePollInterval:
+    """Time head polls to the block time of the chain.
+
+    The block time is a moving average of the time between new heads. Until the next block is due the poller
+    sleeps, once it is overdue it polls at `min_interval` and backs off exponentially up to `max_interval`.
+    """
+
+    def __init__(self, block_time: float = 12.0, min_interval: float = 0.25, max_interval: Optional[float] = None,
+                 smoothing: float = 0.2):
+        """
+        :param block_time: Initial block time estimate in seconds
+        :param smoothing: Weight of the latest observation in the block time average
+        """
+        self.block_time = block_time
+        self.min_interval = min_interval
+        self.max_interval = max_interval if max_interval is not None else block_time / 2
+        self.smoothing = smoothing
+        self.last_head: Optional[int] = None
+        self.last_head_time: Optional[float] = None
+        self.late_polls = 0
+
+    def record_head(self, head: int, now: float):
+        """Take note of the head returned by a poll."""
+        if self.last_head is not None and head <= self.last_head:
+            return
+        if self.last_head is not None:
+            observed = (now - self.last_head_time) / (head - self.last_head)
+            self.block_time += self.smoothing * (observed - self.block_time)
+        self.last_head = head
+        self.last_head_time = now
+        self.late_polls = 0
+
+    def next_delay(self, now: float) -> float:
+        """Seconds to wait before the next poll."""
+        if self.last_head_time is None:
+            return self.min_interval
+        due_in = self.last_head_time + self.block_time - now
+        if due_in > self.min_interval:
+            return due_in
+        delay = min(self.max_interval, self.min_interval * 2 ** self.late_polls)
+        self.late_polls += 1
+        return delay
+
+
+class ChainFollower:
+    """Keep a scanner's state up to date with the chain head.
+
+    Each poll that finds new blocks first checks the stored block hashes for a reorg, then scans the new range.
+    The scanner commits every chunk through `EventScannerState.end_chunk`, at the head a chunk is usually one block.
+    """
+
+    def __init__(self, scanner: EventScanner, confirmations: int = 1,
+                 poll_interval: Optional[AdaptivePollInterval] = None, max_latencies: int = 10000,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        """
+        :param confirmations: Blocks to stay behind the head, 1 skips a head block that may not be complete yet
+        :param max_latencies: How many head-to-commit latencies to keep for `latency_summary`
+        """
+        self.scanner = scanner
+        self.confirmations = confirmations
+        self.poll_interval = poll_interval or AdaptivePollInterval()
+        self.clock = clock
+        self.sleep = sleep
+        self.latencies: Deque[float] = deque(maxlen=max_latencies)
+        # (head, when a poll first saw it) of heads not committed yet
+        self.seen_heads: Deque[Tuple[int, float]] = deque()
+        self.caught_up = False
+
+    def get_head(self) -> int:
+        return self.scanner.get_block_number() - self.confirmations
+
+    def poll(self, first_block: int) -> Optional[PolledRange]:
+        """Scan whatever became available since the last poll.
+
+        Chunks are dropped as soon as they are committed, so catching up with a long backlog does not hold its
+        events in memory.
+
+        :param first_block: Block to start from if nothing has been scanned yet
+        :return: The committed block range, None if there were no new blocks
+        """
+        head = self.get_head()
+        now = self.clock()
+        self.poll_interval.record_head(head, now)
+        last_scanned_block = self.scanner.get_last_scanned_block()
+        if head <= last_scanned_block:
+            return None
+        if not self.seen_heads or head > self.seen_heads[-1][0]:
+            self.seen_heads.append((head, now))
+
+        start_block = max(self.scanner.rewind_to_fork() if last_scanned_block else first_block, first_block)
+        if start_block > head:
+            return None
+
+        last_chunk = None
+        chunks = events = 0
+        # A chunk is committed when the scan resumes after yielding it
+        for chunk in self.scanner.scan_iter(start_block, head, start_chunk_size=1):
+            if last_chunk is not None:
+                self._record_commit(last_chunk)
+            last_chunk = chunk
+            chunks += 1
+            events += len(chunk.events)
+        if last_chunk is None:
+            return None
+        self._record_commit(last_chunk)
+        self.caught_up = True
+        return PolledRange(start_block, last_chunk.end_block, chunks, events)
+
+    def _record_commit(self, chunk: ScannedChunk):
+        now = self.clock()
+        while self.seen_heads and self.seen_heads[0][0] <= chunk.end_block:
+            head, seen_at = self.seen_heads.popleft()
+            # Blocks of the backlog scanned on start were never waited for at the head
+            if self.caught_up:
+                self.latencies.append(now - seen_at)
+                logger.debug("Committed head %d %.3f seconds after it was seen", head, now - seen_at)
+
+    def follow(self, first_block: int, stop: Callable[[], bool] = lambda: False,
+               on_commit: Optional[Callable[[PolledRange], None]] = None):
+        """Poll and scan until `stop` returns True.
+
+        :param on_commit: Called with the range committed by each poll that found new blocks
+        """
+        while not stop():
+            polled = self.poll(first_block)
+            if polled and on_commit:
+                on_commit(polled)
+            self.sleep(self.poll_interval.next_delay(self.clock()))
+
+    def latency_summary(self) -> dict:
+        """Head-to-commit latency percentiles in seconds over the recent commits."""
+        if not self.latencies:
+            return {"count": 0}
+        latencies = np.fromiter(self.latencies, dtype=float)
+        return {"count": len(latencies), "p50": float(np.percentile(latencies, 50)),
+                "p95": float(np.percentile(latencies, 95)), "max": float(latencies.max()),
+                "block_time": self.poll_interval.block_time}
@@ -0,0 +1,241 @@
+"""Scan many pairs in one pass, keeping the events of every pair in its own state.
+
+`eth_getLogs` accepts a list of addresses, so a single scan serves all pairs from the same block range
+requests and block timestamp lookups. Pairs are added to the address filter once the scan reaches the block
+they need to start from, so a newly added pair only backfills its own range.
+"""
+
+import datetime
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+from eth_utils import to_checksum_address
+from web3.datastructures import AttributeDict
+
+from src.local_node.block_hashes import BlockHashIndex
+from src.local_node.coverage import BlockCoverage
+from src.local_node.event_scanner import EventScannerState, EventScanner, legacy_fork_block
+
+logger = logging.getLogger(__name__)
+
+
+class PairBlockHashes:
+    """Block hashes of a `PairPartitionedState`, kept in each pair's own index.
+
+    A block hash is the same for every pair, so each pair records the hashes of the chunks it takes part in and
+    checks its own blocks for reorgs. Pairs whose state keeps no hashes are skipped.
+    """
+
+    def __init__(self, state: 'PairPartitionedState'):
+        self.state = state
+
+    def _indexes(self, addresses) -> List[BlockHashIndex]:
+        indexes = (self.state.states[address].get_block_hash_index() for address in addresses)
+        return [index for index in indexes if index is not None]
+
+    @property
+    def last_block(self) -> Optional[int]:
+        """Newest hash every pair of the current chunk has, or outside of a chunk every pair with scanned blocks."""
+        if self.state.active_pairs:
+            blocks = [index.last_block or 0 for index in self._indexes(self.state.active_pairs)]
+            return min(blocks) if blocks else None
+        blocks = [index.last_block or 0 for index in self._indexes(self.state.scanned_pairs())]
+        # Blocks before the first block of every pair need no hash
+        return min(blocks) if blocks else self.state.get_last_scanned_block()
+
+    def record(self, block_number: int, block_hash: str):
+        for index in self._indexes(self.state.active_pairs):
+            if block_number > (index.last_block or 0):
+                index.record(block_number, block_hash)
+
+    def record_many(self, hashes: Dict[int, str]):
+        for index in self._indexes(self.state.active_pairs):
+            last_block = index.last_block or 0
+            index.record_many({block: block_hash for block, block_hash in hashes.items() if block > last_block})
+
+    def find_fork_block(self, get_hash: Callable[[int], Optional[str]]) -> Optional[int]:
+        """Earliest block any pair may have from an abandoned fork, None if every pair is intact."""
+        fork_blocks = self.state.find_fork_blocks(get_hash)
+        return min(fork_blocks.values()) if fork_blocks else None
+
+
+class PairCoverage:
+    """Scanned block ranges of a `PairPartitionedState`, kept by each pair's own state.
+
+    A block counts as scanned once every pair that starts at or before it has it. Pairs whose state keeps no
+    coverage have everything up to their last scanned block.
+    """
+
+    def __init__(self, state: 'PairPartitionedState'):
+        self.state = state
+
+    def pair_gaps(self, address: str, start: int, end: int) -> List[Tuple[int, int]]:
+        """Block ranges between `start` and `end` one pair is missing."""
+        start = max(start, self.state.first_blocks[address])
+        coverage = self.state.states[address].get_coverage()
+        if coverage is not None:
+            return coverage.gaps(start, end) if start <= end else []
+        start = max(start, self.state.get_resume_block(address))
+        return [(start, end)] if start <= end else []
+
+    def add(self, start: int, end: int):
+        """Mark a chunk as scanned for the pairs that took part in it."""
+        for address in self.state.active_pairs:
+            coverage = self.state.states[address].get_coverage()
+            if coverage is not None and end >= self.state.first_blocks[address]:
+                coverage.add(max(start, self.state.first_blocks[address]), end)
+
+    def gaps(self, start: int, end: int) -> List[Tuple[int, int]]:
+        """Block ranges between `start` and `end` at least one pair is missing, in block order."""
+        missing = BlockCoverage()
+        for address in self.state.states:
+            for gap_start, gap_end in self.pair_gaps(address, start, end):
+                missing.add(gap_start, gap_end)
+        return list(missing)
+
+    def contains(self, start: int, end: int) -> bool:
+        return not self.gaps(start, end)
+
+
+class PairPartitionedState(EventScannerState):
+    """Route the events of each pair to a state of its own.
+
+    A pair takes part in a chunk only if it is still missing the chunk's first block, every pair keeps its own
+    last scanned block and coverage. Events of pairs that do not take part, e.g. when filling a gap another pair
+    is missing, are skipped.
+    """
+
+    def __init__(self, first_blocks: Dict[str, int], state_factory: Callable[[str], EventScannerState]):
+        """
+        :param first_blocks: First block to scan for each pair address, usually the block the pair was created
+        :param state_factory: Creates the state of one pair from its address, e.g. a `JSONifiedState` per pair file
+        """
+        self.first_blocks = {to_checksum_address(address): block for address, block in first_blocks.items()}
+        self.states: Dict[str, EventScannerState] = {
+            address: state_factory(address) for address in self.first_blocks}
+        self.chunk_start = None
+        self.active_pairs: List[str] = []
+        self.coverage = PairCoverage(self)
+        self.block_hashes = PairBlockHashes(self)
+
+    def restore(self):
+        for state in self.states.values():
+            state.restore()
+
+    def save(self):
+        for state in self.states.values():
+            state.save()
+
+    def get_pair_state(self, address: str) -> EventScannerState:
+        return self.states[to_checksum_address(address)]
+
+    def get_resume_block(self, address: str) -> int:
+        """First block this pair still needs scanned."""
+        address = to_checksum_address(address)
+        return max(self.first_blocks[address], self.states[address].get_last_scanned_block() + 1)
+
+    def scanned_pairs(self) -> List[str]:
+        """Pairs with at least one scanned block."""
+        return [address for address, state in self.states.items()
+                if state.get_last_scanned_block() >= self.first_blocks[address]]
+
+    def find_fork_blocks(self, get_hash: Callable[[int], Optional[str]]) -> Dict[str, int]:
+        """First block of each pair whose data may be from an abandoned fork, for the pairs that have one.
+
+        Like `EventScanner.find_fork_block`, blocks scanned after a pair's newest recorded hash count as forked.
+        """
+        fork_blocks = {}
+        for address in self.scanned_pairs():
+            state = self.states[address]
+            index = state.get_block_hash_index()
+            if index is None:
+                continue
+            if index.last_block is None:
+                fork_block = legacy_fork_block(state.get_last_scanned_block(), EventScanner.NUM_BLOCKS_RESCAN_FOR_FORKS)
+            else:
+                fork_block = index.find_fork_block(get_hash)
+            if fork_block is None and (index.last_block or 0) < state.get_last_scanned_block():
+                fork_block = (index.last_block or 0) + 1
+            if fork_block is not None:
+                fork_blocks[address] = max(fork_block, self.first_blocks[address])
+        return fork_blocks
+
+    def rewind_to_fork(self, get_hash: Callable[[int], Optional[str]]) -> int:
+        """Purge the data of every pair from its first possibly forked block on, so the scan resumes from there.
+
+        :return: Number of deleted events
+        """
+        deleted = 0
+        for address, fork_block in self.find_fork_blocks(get_hash).items():
+            logger.info("Rescanning pair %s from block %d for chain reorganisations", address, fork_block)
+            deleted += self.states[address].delete_data(fork_block) or 0
+        return deleted
+
+    def plan_segments(self, end_block: int) -> List[Tuple[int, int, List[str]]]:
+        """Split the scan up to `end_block` into ranges with a fixed set of pairs.
+
+        :return: [(start block, end block, pair addresses)] in block order
+        """
+        resume_blocks = sorted((self.get_resume_block(address), address) for address in self.states)
+        segments = []
+        for i, (start_block, _) in enumerate(resume_blocks):
+            if start_block > end_block:
+                break
+            segment_end = resume_blocks[i + 1][0] - 1 if i + 1 < len(resume_blocks) else end_block
+            segment_end = min(segment_end, end_block)
+            if segment_end < start_block:
+                # The next pair starts at the same block
+                continue
+            segments.append((start_block, segment_end, [address for _, address in resume_blocks[:i + 1]]))
+        return segments
+
+    #
+    # EventScannerState methods implemented below
+    #
+
+    def get_last_scanned_block(self) -> int:
+        """The last block every pair has been scanned up to."""
+        return min(self.get_resume_block(address) for address in self.states) - 1
+
+    def delete_data(self, since_block: int) -> int:
+        return sum(state.delete_data(since_block) or 0 for state in self.states.values())
+
+    def get_block_hash_index(self) -> PairBlockHashes:
+        return self.block_hashes
+
+    def get_coverage(self) -> PairCoverage:
+        return self.coverage
+
+    def start_chunk(self, block_number: int, chunk_size: int):
+        self.chunk_start = block_number
+        self.active_pairs = [address for address in self.states
+                             if self.coverage.pair_gaps(address, block_number, block_number)]
+        for address in self.active_pairs:
+            self.states[address].start_chunk(block_number, chunk_size)
+
+    def end_chunk(self, block_number: int):
+        for address in self.active_pairs:
+            self.states[address].end_chunk(block_number)
+        self.active_pairs = []
+
+    def process_event(self, block_when: datetime.datetime, event: AttributeDict) -> Optional[object]:
+        address = to_checksum_address(event["address"])
+        if address not in self.active_pairs:
+            return None
+        return self.states[address].process_event(block_when, event)
+
+
+def scan_pairs(scanner: EventScanner, state: PairPartitionedState, end_block: int, **scan_kwargs) -> Tuple[list, int]:
+    """Scan all pairs of a partitioned state up to `end_block`, one segment of pairs at a time.
+
+    :return: [All processed events, number of chunks used]
+    """
+    scanner.state = state
+    all_processed = []
+    total_chunks_scanned = 0
+    for start_block, segment_end, addresses in state.plan_segments(end_block):
+        scanner.filters = dict(scanner.filters, address=addresses)
+        processed, chunks = scanner.scan(start_block, segment_end, **scan_kwargs)
+        all_processed += processed
+        total_chunks_scanned += chunks
+    return all_processed, total_chunks_scanned
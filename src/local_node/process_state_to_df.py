@@ -1,12 +1,21 @@
+import json
+import os
 import time
+from concurrent.futures import ProcessPoolExecutor
 from logging import error, info
-from typing import Callable
+from typing import Callable, Dict, Iterable, Optional, Tuple
 from unittest import TestCase
 
+import numpy as np
 import pandas as pd
 from pandas import DataFrame
 from tqdm import tqdm
 
+from src.local_node.uint128 import UInt128Column
+
+SWAP_COLUMNS = ['sender', 'to', 'amount0In', 'amount1In', 'amount0Out', 'amount1Out']
+UINT_COLUMNS = ['amount0In', 'amount1In', 'amount0Out', 'amount1Out', 'reserve0', 'reserve1']
+
 
 class ProcessStateToDF:
     RESERVE_KEYS = {'reserve0', 'reserve1'}
@@ -20,17 +29,229 @@ class ProcessStateToDF:
                 progress_bar.update(chunk_size)
         return update_callback
 
+    @classmethod
+    def process_state(cls, data: dict, test_self: Optional[TestCase] = None, compact: bool = False) -> DataFrame:
+        """Build the swap DataFrame from scanned state with array operations.
+
+        The nested {block: {txhash: {log_index: event}}} state is flattened into columns sorted in the order
+        `process_state_by_block` walks it. A swap is a Sync directly followed by a Swap in the same transaction,
+        its reserves are those of the last Sync before the pair.
+
+        :param compact: Return native dtype columns, see `compact`
+        :return: One row per swap with the swap fields, its block and the reserves before the swap
+        """
+        start = time.time()
+        events = cls.flatten_state(data)
+        swaps = cls.pair_swaps(events, test_self)
+        if compact:
+            swaps = cls.compact(swaps)
+        duration = time.time() - start
+        info(f"Scanned blocks in {duration} seconds")
+        return swaps
+
+    @staticmethod
+    def compact(swaps: DataFrame) -> DataFrame:
+        """Replace the Python int columns of a swap DataFrame by native dtypes.
+
+        `block` becomes int64 and each amount and reserve a float64 column for analysis, plus exact uint64
+        `<name>_hi` and `<name>_lo` words, see `exact_column`.
+        """
+        compacted = swaps.drop(columns=UINT_COLUMNS)
+        compacted['block'] = compacted['block'].astype(np.int64)
+        for name in UINT_COLUMNS:
+            column = UInt128Column.from_ints(swaps[name].to_numpy(dtype=object))
+            compacted[name] = column.to_float()
+            compacted[name + '_hi'] = column.hi
+            compacted[name + '_lo'] = column.lo
+        return compacted
+
+    @staticmethod
+    def exact_column(swaps: DataFrame, name: str) -> UInt128Column:
+        """The exact values of an amount or reserve column of a compacted swap DataFrame."""
+        return UInt128Column(swaps[name + '_hi'].to_numpy(), swaps[name + '_lo'].to_numpy())
+
+    @classmethod
+    def expand(cls, swaps: DataFrame) -> DataFrame:
+        """Undo `compact`, amounts and reserves become Python ints again."""
+        expanded = swaps.drop(columns=[name + suffix for name in UINT_COLUMNS for suffix in ('', '_hi', '_lo')])
+        for name in UINT_COLUMNS:
+            expanded[name] = pd.Series(cls.exact_column(swaps, name).to_ints(), index=swaps.index, dtype=object)
+        return expanded[SWAP_COLUMNS + ['block', 'reserve0', 'reserve1']]
+
+    @classmethod
+    def process_partitions(cls, partitions: Dict[str, dict], max_workers: Optional[int] = None) -> Dict[str, DataFrame]:
+        """Build the swap DataFrame of several pairs independently, each in its own process.
+
+        :param partitions: Scanned blocks by pair address, e.g. the `blocks` of each state in a `PairPartitionedState`
+        :return: Swap DataFrame by pair address
+        """
+        addresses = list(partitions)
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            frames = executor.map(cls.process_state, (partitions[address] for address in addresses))
+            return dict(zip(addresses, frames))
+
+    @classmethod
+    def flatten_state(cls, data: dict) -> dict:
+        """Flatten scanned state into columns sorted by (block, transaction, log index).
+
+        Transactions keep the order they have in a block's dict, log indexes are sorted numerically.
+        Amounts and reserves stay Python ints in object arrays, as they do not fit 64 bits.
+        """
+        block_keys, tx_ids, log_indexes, entries = [], [], [], []
+        tx_id = 0
+        for block in data:
+            for txn_dict in data[block].values():
+                for log_index, entry in txn_dict.items():
+                    block_keys.append(block)
+                    tx_ids.append(tx_id)
+                    log_indexes.append(int(log_index))
+                    entries.append(entry)
+                tx_id += 1
+
+        block_numbers = np.fromiter((int(block) for block in block_keys), dtype=np.int64, count=len(block_keys))
+        tx_ids = np.array(tx_ids, dtype=np.int64)
+        log_indexes = np.array(log_indexes, dtype=np.int64)
+        order = np.lexsort((log_indexes, tx_ids, block_numbers))
+
+        entries = [entries[i] for i in order]
+        columns = {
+            'block': np.array(block_keys, dtype=object)[order] if len(block_keys) else np.empty(0, dtype=object),
+            'block_number': block_numbers[order],
+            'tx': tx_ids[order],
+            'log_index': log_indexes[order],
+            'is_sync': np.fromiter((entry.keys() == cls.RESERVE_KEYS for entry in entries), dtype=bool,
+                                   count=len(entries)),
+            'is_swap': np.fromiter((entry.keys() == cls.SWAP_KEYS for entry in entries), dtype=bool,
+                                   count=len(entries)),
+        }
+        for key in ['reserve0', 'reserve1'] + SWAP_COLUMNS:
+            column = np.empty(len(entries), dtype=object)
+            column[:] = [entry.get(key) for entry in entries]
+            columns[key] = column
+        return columns
 
     @classmethod
-    def process_state(cls, data: dict, test_self: TestCase) -> DataFrame:
+    def flatten_events(cls, events: list) -> dict:
+        """Columns like `flatten_state` built from decoded events already sorted by (blockNumber, logIndex)."""
+        count = len(events)
+        txhashes = [evt['transactionHash'] for evt in events]
+        new_tx = np.ones(count, dtype=bool)
+        new_tx[1:] = [txhash != previous for txhash, previous in zip(txhashes[1:], txhashes)]
+        kinds = [evt['event'] for evt in events]
+        columns = {
+            'block': np.fromiter((evt['blockNumber'] for evt in events), dtype=np.int64, count=count),
+            'tx': np.cumsum(new_tx),
+            'log_index': np.fromiter((evt['logIndex'] for evt in events), dtype=np.int64, count=count),
+            'is_sync': np.array([kind == 'Sync' for kind in kinds], dtype=bool),
+            'is_swap': np.array([kind == 'Swap' for kind in kinds], dtype=bool),
+        }
+        columns['block_number'] = columns['block']
+        for key in ['reserve0', 'reserve1'] + SWAP_COLUMNS:
+            column = np.empty(count, dtype=object)
+            column[:] = [evt['args'].get(key) for evt in events]
+            columns[key] = column
+        return columns
+
+    @classmethod
+    def pair_swaps(cls, events: dict, test_self: Optional[TestCase] = None, reserve0=0, reserve1=0) -> DataFrame:
+        """Pair each Sync with the Swap following it and attach the reserves before the swap.
+
+        :param events: Sorted columns from `flatten_state`
+        :param reserve0: Reserve before the first event, for processing state in consecutive pieces
+        :param reserve1: Reserve before the first event, for processing state in consecutive pieces
+        """
+        count = len(events['is_sync'])
+        paired_sync, previous_sync = cls.pair_positions(
+            events['is_sync'], events['is_swap'], events['tx'], lambda position: events_entry(events, position),
+            test_self)
+
+        # Reserves before each event are those of the last Sync strictly before it
+        has_previous = previous_sync >= 0
+        reserves_before = {}
+        for key, initial in (('reserve0', reserve0), ('reserve1', reserve1)):
+            before = np.empty(count, dtype=object)
+            before[:] = initial
+            before[has_previous] = events[key][previous_sync[has_previous]]
+            reserves_before[key] = before
+
+        cls._log_reserve_changes(events, reserves_before, paired_sync)
+
+        sync_positions = np.flatnonzero(paired_sync)
+        swap_positions = sync_positions + 1
+        swaps = {key: events[key][swap_positions].tolist() for key in SWAP_COLUMNS}
+        swaps['block'] = events['block'][swap_positions].tolist()
+        swaps['reserve0'] = reserves_before['reserve0'][sync_positions].tolist()
+        swaps['reserve1'] = reserves_before['reserve1'][sync_positions].tolist()
+        return pd.DataFrame(swaps, columns=SWAP_COLUMNS + ['block', 'reserve0', 'reserve1'])
+
+    @classmethod
+    def pair_positions(cls, is_sync: np.ndarray, is_swap: np.ndarray, tx: np.ndarray, describe: Callable[[int], dict],
+                       test_self: Optional[TestCase] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Find the Syncs that pair with the Swap following them, and the last Sync before each event.
+
+        :param describe: Event fields at a position, for error messages
+        :return: tuple(mask of paired Syncs, position of the last Sync strictly before each event or -1)
+        """
+        count = len(is_sync)
+        unknown = ~(is_sync | is_swap)
+        if unknown.any():
+            cls._fail(f'Unknown txns {describe(int(np.argmax(unknown)))}', test_self)
+
+        # A Sync at i pairs with a Swap at i + 1 of the same transaction
+        paired_sync = np.zeros(count, dtype=bool)
+        paired_sync[:-1] = is_sync[:-1] & is_swap[1:] & (tx[:-1] == tx[1:])
+        paired_swap = np.zeros(count, dtype=bool)
+        paired_swap[1:] = paired_sync[:-1]
+        unpaired = is_swap & ~paired_swap
+        if unpaired.any():
+            cls._fail(f'Unknown txns {describe(int(np.argmax(unpaired)))}', test_self)
+
+        last_sync = np.maximum.accumulate(np.where(is_sync, np.arange(count), -1))
+        previous_sync = np.concatenate(([-1], last_sync[:-1])) if count else last_sync
+        return paired_sync, previous_sync
+
+    @classmethod
+    def _log_reserve_changes(cls, events: dict, reserves_before: dict, paired_sync: np.ndarray):
+        """Summarise mints, burns and unexplained reserve changes instead of logging each of them."""
+        is_sync = events['is_sync']
+        if not is_sync.any():
+            return
+        expected0 = reserves_before['reserve0'][is_sync]
+        expected1 = reserves_before['reserve1'][is_sync]
+        # A swap moves the reserves by its amounts before the Sync reports them
+        swap_positions = np.flatnonzero(paired_sync[is_sync])
+        swaps = np.flatnonzero(paired_sync) + 1
+        expected0[swap_positions] = expected0[swap_positions] + events['amount0In'][swaps] - events['amount0Out'][swaps]
+        expected1[swap_positions] = expected1[swap_positions] + events['amount1In'][swaps] - events['amount1Out'][swaps]
+
+        reserve0 = events['reserve0'][is_sync]
+        reserve1 = events['reserve1'][is_sync]
+        mints = (reserve0 > expected0) & (reserve1 > expected1)
+        burns = (reserve0 < expected0) & (reserve1 < expected1)
+        unknown = ((reserve0 != expected0) | (reserve1 != expected1)) & ~mints & ~burns
+        info(f"Reserve changes: {int(mints.sum())} mints, {int(burns.sum())} burns")
+        if unknown.any():
+            blocks = events['block_number'][is_sync][unknown]
+            error(f"Not sure what {int(unknown.sum())} reserve changes are, first in block {blocks[0]}")
+
+    @staticmethod
+    def _fail(msg, test_self: Optional[TestCase]):
+        error(msg)
+        if test_self is not None:
+            test_self.fail(msg)
+        raise ValueError(msg)
+
+    @classmethod
+    def process_state_by_block(cls, data: dict, test_self: TestCase) -> DataFrame:
+        """Reference implementation of `process_state` walking the state one block at a time."""
         swaps = []
         reserve0 = 0
         reserve1 = 0
         start = time.time()
-        blocks = sorted(data.keys())
+        blocks = sorted(data.keys(), key=int)
         progress_callback = cls.get_progress_callback(len(blocks))
 
-        for block in sorted(data.keys()):
+        for block in blocks:
             current_block = block
             progress_callback(current_block, 1)
             txns_list = [data[block][hash_key] for hash_key in data[block]]
@@ -74,7 +295,7 @@ class ProcessStateToDF:
     @classmethod
     def process_swap(cls, block, reserve0, reserve1, swaps, txn_dict, txn1, txn2):
         reserve = txn_dict[txn1]
-        swap = txn_dict[txn2]
+        swap = dict(txn_dict[txn2])
         swap['block'] = block
         swap['reserve0'] = reserve0
         swap['reserve1'] = reserve1
@@ -98,3 +319,107 @@ class ProcessStateToDF:
                   f"\n\treserve1: {reserve1} -> {_reserve1}")
         return _reserve0, _reserve1
 
+
+class StreamingSwapWriter:
+    """Build the swap DataFrame chunk by chunk from `EventScanner.scan_iter` and write it to disk in batches.
+
+    Reserves are carried across chunks, so only the buffered batch is ever held in memory. Progress (last block
+    written and the reserves at that point) is saved next to the batches each time one is written, and a restarted
+    writer picks up from there. Unwritten rows are lost on a crash, but their blocks are rescanned on resume.
+    """
+
+    PROGRESS_FILE = "progress.json"
+
+    def __init__(self, output_dir: str, rows_per_batch: int = 100000, test_self: Optional[TestCase] = None):
+        self.output_dir = output_dir
+        self.rows_per_batch = rows_per_batch
+        self.test_self = test_self
+        os.makedirs(output_dir, exist_ok=True)
+
+        self.last_block = 0
+        self.reserve0 = 0
+        self.reserve1 = 0
+        self.batches = 0
+        self.restore()
+
+        self.buffer = []
+        self.buffered_rows = 0
+        self.buffered_to_block = self.last_block
+
+    def restore(self):
+        path = os.path.join(self.output_dir, self.PROGRESS_FILE)
+        if os.path.exists(path):
+            with open(path, "rt") as f:
+                progress = json.load(f)
+            self.last_block = progress["last_block"]
+            self.reserve0 = progress["reserve0"]
+            self.reserve1 = progress["reserve1"]
+            self.batches = progress["batches"]
+
+    def resume_block(self, first_block: int) -> int:
+        """Where the scan feeding this writer should start."""
+        return max(first_block, self.last_block + 1)
+
+    def consume(self, chunks: Iterable) -> int:
+        """Process every chunk of a scan, writing batches as they fill up.
+
+        :param chunks: `ScannedChunk`s, e.g. from `EventScanner.scan_iter`
+        :return: Number of swaps written
+        """
+        rows = 0
+        for chunk in chunks:
+            rows += len(self.process_events(chunk.events, chunk.end_block))
+            if self.buffered_rows >= self.rows_per_batch:
+                self.flush()
+        self.flush()
+        return rows
+
+    def process_events(self, events: list, end_block: int) -> DataFrame:
+        """Add the swaps of one chunk to the buffer.
+
+        :param events: Decoded events of the chunk sorted by (blockNumber, logIndex)
+        :param end_block: Last block of the chunk
+        """
+        columns = ProcessStateToDF.flatten_events(events)
+        swaps = ProcessStateToDF.pair_swaps(columns, self.test_self, self.reserve0, self.reserve1)
+        syncs = np.flatnonzero(columns['is_sync'])
+        if len(syncs):
+            self.reserve0 = columns['reserve0'][syncs[-1]]
+            self.reserve1 = columns['reserve1'][syncs[-1]]
+        if len(swaps):
+            self.buffer.append(swaps)
+            self.buffered_rows += len(swaps)
+        self.buffered_to_block = end_block
+        return swaps
+
+    def flush(self):
+        """Write buffered swaps as one batch and record the progress."""
+        if self.buffer:
+            batch = pd.concat(self.buffer, ignore_index=True)
+            batch.to_pickle(os.path.join(self.output_dir, f"batch-{self.batches:06d}.pkl"))
+            self.batches += 1
+            self.buffer = []
+            self.buffered_rows = 0
+        self.last_block = self.buffered_to_block
+
+        path = os.path.join(self.output_dir, self.PROGRESS_FILE)
+        with open(path + ".tmp", "wt") as f:
+            json.dump({"last_block": self.last_block, "reserve0": self.reserve0, "reserve1": self.reserve1,
+                       "batches": self.batches}, f)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def read_swaps(cls, output_dir: str) -> DataFrame:
+        """Concatenate all written batches into the swap DataFrame."""
+        with open(os.path.join(output_dir, cls.PROGRESS_FILE), "rt") as f:
+            batches = json.load(f)["batches"]
+        frames = [pd.read_pickle(os.path.join(output_dir, f"batch-{i:06d}.pkl")) for i in range(batches)]
+        if not frames:
+            return pd.DataFrame(columns=SWAP_COLUMNS + ['block', 'reserve0', 'reserve1'])
+        return pd.concat(frames, ignore_index=True)
+
+
+def events_entry(events: dict, position: int) -> dict:
+    """The event fields at one position of flattened state, for error messages."""
+    keys = ['reserve0', 'reserve1'] if events['is_sync'][position] else SWAP_COLUMNS
+    return {key: events[key][position] for key in keys if events[key][position] is not None}
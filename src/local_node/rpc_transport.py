@@ -0,0 +1,145 @@
+"""A JSON-RPC client for the few calls the scanner makes, without web3.py's per request overhead.
+
+`Web3.HTTPProvider` opens a request per call and runs every response through generic JSON parsing, middlewares and
+`AttributeDict` formatting. `JsonRpcTransport` keeps a pool of connections open, asks for compressed responses,
+sends JSON-RPC batch arrays and parses with orjson when it is installed. Logs come back as plain dicts in the shape
+`fast_decoder.decode_logs` and the scanner states expect, converting only the fields they use.
+"""
+
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import requests
+from eth_utils import to_checksum_address
+from hexbytes import HexBytes
+from requests.adapters import HTTPAdapter
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def loads(body: bytes) -> Any:
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+def dumps(payload: Any) -> bytes:
+    return orjson.dumps(payload) if orjson is not None else json.dumps(payload).encode()
+
+
+class JsonRpcError(ValueError):
+    """The node answered with a JSON-RPC error, e.g. too many results for `eth_getLogs`."""
+
+    def __init__(self, error: dict):
+        super().__init__(error)
+        self.error = error
+
+
+class _ChecksumCache(dict):
+    """Logs of a scan come from a handful of contracts, checksum each address once."""
+
+    def __missing__(self, address: str) -> str:
+        checksummed = to_checksum_address(address)
+        self[address] = checksummed
+        return checksummed
+
+
+_checksums = _ChecksumCache()
+
+
+class JsonRpcTransport:
+    """Pooled HTTP JSON-RPC client, thread-safe for the scanner's worker threads."""
+
+    def __init__(self, endpoint_uri: str, timeout: float = 60, pool_size: int = 10,
+                 before_request: Optional[Callable[[], None]] = None):
+        """
+        :param pool_size: Connections kept open, at least the scanner's concurrency
+        :param before_request: Called before every HTTP request, e.g. a rate limiter
+        """
+        self.endpoint_uri = endpoint_uri
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.before_request = before_request
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json", "Accept-Encoding": "gzip, deflate"})
+        self.request_id = 0
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+        # Sessions do not pickle, a transport sent to a worker process opens its own connections
+        state = dict(self.__dict__)
+        del state["session"], state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__init__(state["endpoint_uri"], state["timeout"], state["pool_size"], state["before_request"])
+
+    def _next_id(self) -> int:
+        with self.lock:
+            self.request_id += 1
+            return self.request_id
+
+    def post(self, payload: Any) -> Any:
+        if self.before_request:
+            self.before_request()
+        response = self.session.post(self.endpoint_uri, data=dumps(payload), timeout=self.timeout)
+        response.raise_for_status()
+        return loads(response.content)
+
+    def call(self, method: str, params: list) -> Any:
+        """Make one call and return its result.
+
+        :raise JsonRpcError: If the node answered with an error
+        """
+        body = self.post({"jsonrpc": "2.0", "id": self._next_id(), "method": method, "params": params})
+        if "error" in body:
+            raise JsonRpcError(body["error"])
+        return body.get("result")
+
+    def make_batch_request(self, calls: List[Tuple[str, list]]) -> List[dict]:
+        """Send (method, params) pairs as one batch array, return the raw responses in call order."""
+        first_id = self._next_id()
+        payload = [{"jsonrpc": "2.0", "id": first_id + i, "method": method, "params": params}
+                   for i, (method, params) in enumerate(calls)]
+        with self.lock:
+            # Ids of this batch must not be handed out again
+            self.request_id = max(self.request_id, first_id + len(calls))
+        body = self.post(payload)
+        if isinstance(body, dict):
+            # Some nodes answer a whole batch with a single error object
+            raise JsonRpcError(body.get("error", body))
+        by_id = {item.get("id"): item for item in body}
+        return [by_id.get(first_id + i, {}) for i in range(len(calls))]
+
+    def block_number(self) -> int:
+        return int(self.call("eth_blockNumber", []), 16)
+
+    def get_block(self, block_number: int) -> Optional[Dict[str, Any]]:
+        """Block header without transactions, None if the node does not have the block."""
+        return self.call("eth_getBlockByNumber", [hex(block_number), False])
+
+    def get_logs(self, filter_params: dict) -> List[dict]:
+        """`eth_getLogs` with the filter in web3's format, e.g. int block numbers.
+
+        :return: Logs with int numbers, HexBytes hashes and checksummed addresses, topics and data left as hex
+        """
+        params = dict(filter_params)
+        for key in ("fromBlock", "toBlock"):
+            if isinstance(params.get(key), int):
+                params[key] = hex(params[key])
+        return [{
+            "address": _checksums[log["address"]],
+            "blockHash": HexBytes(log["blockHash"]),
+            "blockNumber": int(log["blockNumber"], 16),
+            "data": log["data"],
+            "logIndex": int(log["logIndex"], 16),
+            "removed": log.get("removed", False),
+            "topics": log["topics"],
+            "transactionHash": HexBytes(log["transactionHash"]),
+            "transactionIndex": int(log["transactionIndex"], 16),
+        } for log in self.call("eth_getLogs", [params])]
@@ -0,0 +1,176 @@
+"""Where a scan spends its time, chunk by chunk.
+
+`EventScanner` hands a `ChunkMetrics` to each of its hooks after every committed chunk. `ScanMetrics` aggregates
+them into Prometheus style histograms and counters, `PrometheusTextFileSink` writes those for the node exporter's
+text file collector and `JsonLinesSink` keeps the raw record of every chunk.
+"""
+
+import bisect
+import json
+import os
+import time
+from typing import Dict, NamedTuple, Optional, Sequence, TextIO
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 10, 100, 1000, 2500, 5000, 10000, 25000, 100000)
+
+
+class ChunkMetrics(NamedTuple):
+    start_block: int
+    end_block: int
+    # Chunk size the scanner asked for and the one it picked for the next chunk
+    requested_size: int
+    next_size: int
+    logs: int
+    # `eth_getLogs` requests, more than one if the node made the scanner retry or split the range
+    requests: int
+    # Failed `eth_getLogs` requests the scanner retried, the follow-up requests of a split range do not count
+    retries: int
+    rpc_seconds: float
+    decode_seconds: float
+    timestamp_seconds: float
+    # Time spent in `EventScannerState.process_event` and in `end_chunk`, which includes any save
+    process_seconds: float
+    commit_seconds: float
+
+
+class ScanHook:
+    """Receives the metrics of every committed chunk."""
+
+    def on_chunk(self, metrics: ChunkMetrics):
+        pass
+
+    def close(self):
+        pass
+
+
+class Histogram:
+    """Cumulative histogram with fixed upper bounds, like a Prometheus histogram."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> list:
+        counts, total = [], 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+
+class ScanMetrics(ScanHook):
+    """Histograms and counters over all chunks of a scan."""
+
+    HISTOGRAMS = {
+        "rpc_seconds": ("Time spent in eth_getLogs requests per chunk", SECONDS_BUCKETS),
+        "decode_seconds": ("Time spent decoding logs per chunk", SECONDS_BUCKETS),
+        "timestamp_seconds": ("Time spent resolving block timestamps per chunk", SECONDS_BUCKETS),
+        "process_seconds": ("Time spent in process_event per chunk", SECONDS_BUCKETS),
+        "commit_seconds": ("Time spent committing and saving the state per chunk", SECONDS_BUCKETS),
+        "logs_per_chunk": ("Logs returned per chunk", COUNT_BUCKETS),
+        "chunk_size_blocks": ("Blocks per chunk", COUNT_BUCKETS),
+    }
+    COUNTERS = {
+        "chunks_total": "Committed chunks",
+        "blocks_total": "Scanned blocks",
+        "logs_total": "Processed logs",
+        "requests_total": "eth_getLogs requests",
+        "retries_total": "eth_getLogs requests retried after a failure",
+    }
+
+    def __init__(self, prefix: str = "event_scanner"):
+        self.prefix = prefix
+        self.histograms: Dict[str, Histogram] = {
+            name: Histogram(buckets) for name, (_, buckets) in self.HISTOGRAMS.items()}
+        self.counters: Dict[str, float] = {name: 0 for name in self.COUNTERS}
+        self.last_chunk: Optional[ChunkMetrics] = None
+
+    def on_chunk(self, metrics: ChunkMetrics):
+        for name in ("rpc_seconds", "decode_seconds", "timestamp_seconds", "process_seconds", "commit_seconds"):
+            self.histograms[name].observe(getattr(metrics, name))
+        self.histograms["logs_per_chunk"].observe(metrics.logs)
+        self.histograms["chunk_size_blocks"].observe(metrics.end_block - metrics.start_block + 1)
+        self.counters["chunks_total"] += 1
+        self.counters["blocks_total"] += metrics.end_block - metrics.start_block + 1
+        self.counters["logs_total"] += metrics.logs
+        self.counters["requests_total"] += metrics.requests
+        self.counters["retries_total"] += metrics.retries
+        self.last_chunk = metrics
+
+    def to_prometheus(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, (description, _) in self.HISTOGRAMS.items():
+            histogram = self.histograms[name]
+            metric = f"{self.prefix}_{name}"
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} histogram"]
+            bounds = [_format_number(bound) for bound in histogram.buckets] + ["+Inf"]
+            for bound, count in zip(bounds, histogram.cumulative_counts()):
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+            lines += [f"{metric}_sum {_format_number(histogram.sum)}", f"{metric}_count {histogram.count}"]
+        for name, description in self.COUNTERS.items():
+            metric = f"{self.prefix}_{name}"
+            lines += [f"# HELP {metric} {description}", f"# TYPE {metric} counter",
+                      f"{metric} {_format_number(self.counters[name])}"]
+        if self.last_chunk is not None:
+            metric = f"{self.prefix}_last_scanned_block"
+            lines += [f"# HELP {metric} Last committed block", f"# TYPE {metric} gauge",
+                      f"{metric} {self.last_chunk.end_block}"]
+        return "\n".join(lines) + "\n"
+
+
+class PrometheusTextFileSink(ScanMetrics):
+    """Rewrite a `.prom` file for the node exporter's text file collector at most every `write_every` seconds."""
+
+    def __init__(self, path: str, write_every: float = 10.0, prefix: str = "event_scanner"):
+        super().__init__(prefix)
+        self.path = path
+        self.write_every = write_every
+        self.last_write = 0.0
+
+    def on_chunk(self, metrics: ChunkMetrics):
+        super().on_chunk(metrics)
+        if time.monotonic() - self.last_write >= self.write_every:
+            self.write()
+
+    def write(self):
+        # The collector must never read a half written file
+        with open(self.path + ".tmp", "wt") as f:
+            f.write(self.to_prometheus())
+        os.replace(self.path + ".tmp", self.path)
+        self.last_write = time.monotonic()
+
+    def close(self):
+        self.write()
+
+
+class JsonLinesSink(ScanHook):
+    """Append one JSON object per chunk to a file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.file: Optional[TextIO] = None
+
+    def on_chunk(self, metrics: ChunkMetrics):
+        if self.file is None:
+            self.file = open(self.path, "at")
+        record = dict(metrics._asdict(), time=time.time())
+        self.file.write(json.dumps(record) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+def _format_number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not float(value).is_integer() else str(int(value))
@@ -1,3 +1,4 @@
+import functools
 import json
 import time
 from typing import Union, Type
@@ -6,45 +7,208 @@ from tqdm import tqdm
 from web3 import Web3
 from web3.contract import Contract
 
-from src.local_node.event_scanner import JSONifiedState, EventScanner
+from src.local_node.backfill import BackfillCoordinator
+from src.local_node.block_timestamps import BlockTimestampCache, BlockTimestampResolver
+from src.local_node.event_scanner import JSONifiedState, EventScanner, EventScannerState, WatermarkState
+from src.local_node.follow import ChainFollower
+from src.local_node.multi_pair import PairPartitionedState, scan_pairs
+from src.local_node.process_state_to_df import StreamingSwapWriter
+from src.local_node.rpc_transport import JsonRpcTransport
+from src.local_node.scan_metrics import JsonLinesSink, PrometheusTextFileSink, ScanHook
+from src.local_node.sqlite_state import SQLiteState
 
 
 class ScannerRunner:
     @staticmethod
-    def run_scanner(file_name, first_block, node_url, abi, uni_pair_contract_address):
+    def make_scanner(node_url, abi, uni_pair_contract_address, state: EventScannerState, concurrency=1,
+                     max_requests_per_second=None, timestamp_mode=BlockTimestampResolver.EXACT,
+                     hooks=None, use_transport=True) -> EventScanner:
+        """
+        :param use_transport: Talk to the node through a pooled `JsonRpcTransport`, False goes through web3.py only
+        """
         provider = Web3.HTTPProvider(node_url, request_kwargs={'timeout': 60})
         provider.middlewares.clear()
         web3 = Web3(provider)
+        transport = None
+        if use_transport:
+            transport = JsonRpcTransport(node_url, timeout=60, pool_size=max(10, 2 * concurrency))
         abi = json.loads(abi)
         pair_contact: Union[Type[Contract], Contract] = web3.eth.contract(abi=abi)
-        state = JSONifiedState(file_name)
-        state.restore()
-        scanner = EventScanner(
+        timestamp_resolver = BlockTimestampResolver(web3, cache=BlockTimestampCache(), mode=timestamp_mode,
+                                                    transport=transport)
+        return EventScanner(
             web3=web3, contract=pair_contact, state=state, events=[pair_contact.events.Sync, pair_contact.events.Swap],
-            filters={"address": uni_pair_contract_address}, max_chunk_scan_size=10000)
-        chain_reorg_safety_blocks = 10
-        scanner.delete_potentially_forked_block_data(state.get_last_scanned_block() - chain_reorg_safety_blocks)
-        start_block = max(state.get_last_scanned_block() - chain_reorg_safety_blocks, first_block)
+            filters={"address": uni_pair_contract_address}, max_chunk_scan_size=10000, concurrency=concurrency,
+            max_requests_per_second=max_requests_per_second, timestamp_resolver=timestamp_resolver, hooks=hooks,
+            transport=transport)
+
+    @staticmethod
+    def make_metrics_sink(metrics_path) -> ScanHook:
+        """Prometheus text file for a `.prom` path, one JSON line per chunk otherwise."""
+        if metrics_path.endswith(".prom"):
+            return PrometheusTextFileSink(metrics_path)
+        return JsonLinesSink(metrics_path)
+
+    @staticmethod
+    def get_progress_callback(progress_bar: tqdm):
+        def _update_progress(start, end, current, current_block_timestamp, chunk_size, events_count):
+            if current_block_timestamp:
+                formatted_time = current_block_timestamp.strftime("%d-%m-%Y")
+            else:
+                formatted_time = "no block time available"
+            progress_bar.set_description(
+                f"Current block: {current} ({formatted_time}), blocks in a scan batch: {chunk_size}, events "
+                f"processed in a batch {events_count}")
+            progress_bar.update(chunk_size)
+        return _update_progress
+
+    @staticmethod
+    def run_scanner(file_name, first_block, node_url, abi, uni_pair_contract_address, concurrency=1,
+                    max_requests_per_second=None, timestamp_mode=BlockTimestampResolver.EXACT,
+                    state_cls=JSONifiedState, metrics_path=None, fill_gaps=False):
+        """
+        :param metrics_path: Where to export per chunk timings, see `make_metrics_sink`
+        :param fill_gaps: Scan every block from `first_block` on the state does not have, not only those after
+            its last scanned block
+        """
+        state = state_cls(file_name)
+        state.restore()
+        hooks = [ScannerRunner.make_metrics_sink(metrics_path)] if metrics_path else []
+        scanner = ScannerRunner.make_scanner(
+            node_url, abi, uni_pair_contract_address, state, concurrency=concurrency,
+            max_requests_per_second=max_requests_per_second, timestamp_mode=timestamp_mode, hooks=hooks)
+        # Only blocks no longer on the chain are purged and rescanned
+        start_block = max(scanner.rewind_to_fork(), first_block)
         # TODO(WF): add arg to overwrite
         end_block = scanner.get_suggested_scan_end_block()
-        blocks_to_scan = end_block - start_block
-        print(f"Scanning events from blocks {start_block} - {end_block}")
+        if fill_gaps:
+            start_block = first_block
+            gaps = scanner.plan_gaps(start_block, end_block)
+            blocks_to_scan = sum(gap_end - gap_start + 1 for gap_start, gap_end in gaps)
+            print(f"Filling {len(gaps)} gaps of {blocks_to_scan} blocks in total between {start_block} - {end_block}")
+        else:
+            blocks_to_scan = end_block - start_block
+            print(f"Scanning events from blocks {start_block} - {end_block}")
+        scan = scanner.scan_gaps if fill_gaps else scanner.scan
         start = time.time()
         with tqdm(total=blocks_to_scan) as progress_bar:
-            def _update_progress(start, end, current, current_block_timestamp, chunk_size, events_count):
-                if current_block_timestamp:
-                    formatted_time = current_block_timestamp.strftime("%d-%m-%Y")
-                else:
-                    formatted_time = "no block time available"
-                progress_bar.set_description(
-                    f"Current block: {current} ({formatted_time}), blocks in a scan batch: {chunk_size}, events "
-                    f"processed in a batch {events_count}")
-                progress_bar.update(chunk_size)
-
             # Run the scan
-            result, total_chunks_scanned = scanner.scan(start_block, end_block, progress_callback=_update_progress)
+            result, total_chunks_scanned = scan(
+                start_block, end_block, progress_callback=ScannerRunner.get_progress_callback(progress_bar))
         state.save()
+        for hook in hooks:
+            hook.close()
         duration = time.time() - start
         print(
             f"Scanned total {len(result)} Transfer events, in {duration} seconds, total {total_chunks_scanned} chunk "
             f"scans performed")
+
+    @staticmethod
+    def run_streaming_scanner(output_dir, first_block, node_url, abi, uni_pair_contract_address, concurrency=1,
+                              max_requests_per_second=None, timestamp_mode=BlockTimestampResolver.NONE,
+                              rows_per_batch=100000):
+        """Scan straight into swap DataFrame batches in `output_dir`, holding only one batch in memory.
+
+        Read the result with `StreamingSwapWriter.read_swaps(output_dir)`.
+        """
+        writer = StreamingSwapWriter(output_dir, rows_per_batch=rows_per_batch)
+        start_block = writer.resume_block(first_block)
+        scanner = ScannerRunner.make_scanner(
+            node_url, abi, uni_pair_contract_address, WatermarkState(start_block - 1), concurrency=concurrency,
+            max_requests_per_second=max_requests_per_second, timestamp_mode=timestamp_mode)
+        end_block = scanner.get_suggested_scan_end_block()
+        print(f"Streaming events from blocks {start_block} - {end_block}")
+        start = time.time()
+        with tqdm(total=end_block - start_block) as progress_bar:
+            swaps = writer.consume(scanner.scan_iter(
+                start_block, end_block, progress_callback=ScannerRunner.get_progress_callback(progress_bar)))
+        duration = time.time() - start
+        print(f"Wrote {swaps} swaps in {duration} seconds")
+
+    @staticmethod
+    def run_multi_pair_scanner(first_blocks, node_url, abi, concurrency=1, max_requests_per_second=None,
+                               timestamp_mode=BlockTimestampResolver.EXACT, state_cls=JSONifiedState):
+        """Scan several pairs in one pass, each pair is stored in its own `<pair address>.json` state.
+
+        :param first_blocks: First block to scan by pair address
+        """
+        state = PairPartitionedState(first_blocks, lambda address: state_cls(f"{address}.json"))
+        state.restore()
+        scanner = ScannerRunner.make_scanner(
+            node_url, abi, list(state.states), state, concurrency=concurrency,
+            max_requests_per_second=max_requests_per_second, timestamp_mode=timestamp_mode)
+        # Only the blocks of each pair that are no longer on the chain are purged and rescanned
+        state.rewind_to_fork(scanner.get_block_hash)
+        end_block = scanner.get_suggested_scan_end_block()
+        start_block = min(state.get_resume_block(address) for address in state.states)
+        print(f"Scanning events of {len(state.states)} pairs from blocks {start_block} - {end_block}")
+        start = time.time()
+        with tqdm(total=end_block - start_block) as progress_bar:
+            result, total_chunks_scanned = scan_pairs(
+                scanner, state, end_block, progress_callback=ScannerRunner.get_progress_callback(progress_bar))
+        state.save()
+        duration = time.time() - start
+        print(
+            f"Scanned total {len(result)} events, in {duration} seconds, total {total_chunks_scanned} chunk "
+            f"scans performed")
+
+    @staticmethod
+    def run_follower(file_name, first_block, node_url, abi, uni_pair_contract_address, confirmations=1,
+                     max_requests_per_second=None, timestamp_mode=BlockTimestampResolver.EXACT,
+                     state_cls=JSONifiedState, report_every=60.0):
+        """Catch up with the chain and keep following its head until interrupted with CTRL+C.
+
+        Every new block is committed as soon as it is scanned, and the state is saved after every poll that found
+        new blocks so the commit survives a crash. Latency is reported every `report_every` seconds.
+        """
+        state = state_cls(file_name)
+        state.restore()
+        scanner = ScannerRunner.make_scanner(
+            node_url, abi, uni_pair_contract_address, state, max_requests_per_second=max_requests_per_second,
+            timestamp_mode=timestamp_mode)
+        follower = ChainFollower(scanner, confirmations=confirmations)
+        last_report = time.time()
+
+        def _on_commit(polled):
+            nonlocal last_report
+            # States like JSONifiedState only write to disk every minute in `end_chunk`
+            state.save()
+            if time.time() - last_report >= report_every:
+                print(f"Following at block {polled.end_block}, head to commit latency {follower.latency_summary()}")
+                last_report = time.time()
+
+        print(f"Following the chain from block {max(first_block, state.get_last_scanned_block() + 1)}")
+        try:
+            follower.follow(first_block, on_commit=_on_commit)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            state.save()
+        print(f"Stopped at block {state.get_last_scanned_block()}, head to commit latency "
+              f"{follower.latency_summary()}")
+
+    @staticmethod
+    def run_backfill(output_dir, first_block, last_block, node_url, abi, uni_pair_contract_address, shards=8,
+                     max_workers=None, max_requests_per_second=None, timestamp_mode=BlockTimestampResolver.EXACT,
+                     retries=2):
+        """Backfill a historical block range with one process per shard, then merge into `merged.sqlite`.
+
+        Rerunning after a failure only rescans what the failed shards are missing.
+
+        :param max_requests_per_second: Rate limit of each worker, not of the whole backfill
+        """
+        scanner_factory = functools.partial(
+            ScannerRunner.make_scanner, node_url, abi, uni_pair_contract_address,
+            max_requests_per_second=max_requests_per_second, timestamp_mode=timestamp_mode)
+        coordinator = BackfillCoordinator(output_dir, scanner_factory, first_block, last_block, shards=shards,
+                                          max_workers=max_workers)
+        print(f"Backfilling blocks {first_block} - {last_block} in {len(coordinator.shards)} shards")
+        start = time.time()
+        results = coordinator.run(retries=retries)
+        state = SQLiteState("merged.sqlite", output_dir)
+        state.restore()
+        merged = coordinator.merge(state)
+        state.close()
+        duration = time.time() - start
+        print(f"Scanned {sum(result.events for result in results.values())} events, merged {merged} events "
+              f"into {state.path} in {duration} seconds")
@@ -0,0 +1,222 @@
+"""Scanner state kept in an embedded SQLite database.
+
+Unlike `JSONifiedState`, nothing but the current chunk is held in memory and every checkpoint only writes
+the events of one chunk, so the cost of a checkpoint does not grow with the scanned history.
+"""
+
+import bisect
+import datetime
+import os
+import sqlite3
+from typing import Optional
+
+from web3.datastructures import AttributeDict
+
+from src.local_node.block_hashes import BlockHashIndex
+from src.local_node.coverage import BlockCoverage
+from src.local_node.event_scanner import EventScannerState, legacy_coverage
+
+SWAP_FIELDS = ('sender', 'to', 'amount0In', 'amount1In', 'amount0Out', 'amount1Out')
+SYNC_FIELDS = ('reserve0', 'reserve1')
+
+# uint112 and uint256 values do not fit SQLite's 64 bit integers, amounts and reserves are stored as decimal text
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scan_state (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS events (
+    pair TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    txhash TEXT NOT NULL,
+    event TEXT NOT NULL,
+    timestamp INTEGER,
+    reserve0 TEXT,
+    reserve1 TEXT,
+    sender TEXT,
+    "to" TEXT,
+    amount0In TEXT,
+    amount1In TEXT,
+    amount0Out TEXT,
+    amount1Out TEXT,
+    PRIMARY KEY (pair, block, log_index)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS events_by_block ON events (block);
+CREATE TABLE IF NOT EXISTS block_hashes (
+    block INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS coverage (
+    start_block INTEGER PRIMARY KEY,
+    end_block INTEGER NOT NULL
+);
+"""
+
+
+class SQLiteState(EventScannerState):
+    """Store the state of scanned blocks and all events in SQLite.
+
+    Each chunk is written in one transaction opened in `start_chunk` and committed in `end_chunk`,
+    together with the new last scanned block, so a crash never leaves half a chunk behind.
+    """
+
+    def __init__(self, file_name: str, directory: str = "state"):
+        """
+        :param file_name: State file in `directory`, an absolute path is used as is
+        :param directory: Where the state is kept
+        """
+        self.path = os.path.join(directory, file_name)
+        self.connection: Optional[sqlite3.Connection] = None
+        self.block_hashes = BlockHashIndex()
+        # What of the hash index is in the database already
+        self.saved_hashes_version = 0
+        self.saved_hashes_to_block = 0
+        self.coverage = BlockCoverage()
+        self.saved_coverage_version = self.coverage.version
+
+    def restore(self):
+        """Open the database, creating it if this is the first scan."""
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Transactions are managed explicitly around chunks
+        self.connection = sqlite3.connect(self.path, isolation_level=None)
+        self.connection.executescript(SCHEMA)
+        self.block_hashes = BlockHashIndex(dict(self.connection.execute("SELECT block, hash FROM block_hashes")))
+        self.saved_hashes_version = self.block_hashes.version
+        self.saved_hashes_to_block = self.block_hashes.last_block or 0
+        ranges = self.connection.execute("SELECT start_block, end_block FROM coverage").fetchall()
+        self.coverage = BlockCoverage(ranges or legacy_coverage(self.get_last_scanned_block()))
+        self.saved_coverage_version = self.coverage.version if ranges else -1
+        print(f"Restored the state, previously {self.get_last_scanned_block()} blocks have been scanned")
+
+    def reset(self):
+        """Create initial state of nothing scanned."""
+        self.connection.execute("DELETE FROM events")
+        self.connection.execute("DELETE FROM scan_state")
+        self.connection.execute("DELETE FROM block_hashes")
+        self.connection.execute("DELETE FROM coverage")
+        self.block_hashes = BlockHashIndex()
+        self.saved_hashes_version = self.block_hashes.version
+        self.saved_hashes_to_block = 0
+        self.coverage = BlockCoverage()
+        self.saved_coverage_version = self.coverage.version
+
+    def save(self):
+        """Everything is committed at the end of each chunk, nothing left to save."""
+
+    def close(self):
+        self.connection.close()
+
+    def get_blocks(self, from_block: int = 0, to_block: Optional[int] = None, pair: Optional[str] = None) -> dict:
+        """Events of a block range in the nested format of `JSONifiedState`.
+
+        :return: {block: {txhash: {log_index: event fields}}}, as expected by `ProcessStateToDF.process_state`
+        """
+        query = "SELECT * FROM events WHERE block >= ?"
+        params = [from_block]
+        if to_block is not None:
+            query += " AND block <= ?"
+            params.append(to_block)
+        if pair is not None:
+            query += " AND pair = ?"
+            params.append(pair)
+        query += " ORDER BY block, log_index"
+
+        cursor = self.connection.execute(query, params)
+        columns = [description[0] for description in cursor.description]
+        blocks = {}
+        for row in cursor:
+            row = dict(zip(columns, row))
+            if row["event"] == "Sync":
+                entry = {field: int(row[field]) for field in SYNC_FIELDS}
+            else:
+                entry = {field: row[field] if field in ('sender', 'to') else int(row[field]) for field in SWAP_FIELDS}
+            blocks.setdefault(row["block"], {}).setdefault(row["txhash"], {})[row["log_index"]] = entry
+        return blocks
+
+    def _save_block_hashes(self):
+        """Append new hashes, or rewrite the table if the index dropped entries since the last save."""
+        if self.block_hashes.version != self.saved_hashes_version:
+            self.connection.execute("DELETE FROM block_hashes")
+            self.saved_hashes_to_block = 0
+        start = bisect.bisect_right(self.block_hashes.blocks, self.saved_hashes_to_block)
+        new_hashes = list(zip(self.block_hashes.blocks[start:], self.block_hashes.hashes[start:]))
+        self.connection.executemany("INSERT OR REPLACE INTO block_hashes (block, hash) VALUES (?, ?)", new_hashes)
+        self.saved_hashes_version = self.block_hashes.version
+        self.saved_hashes_to_block = self.block_hashes.last_block or 0
+
+    def _save_coverage(self):
+        """Rewrite the coverage table if it changed, it holds a handful of ranges."""
+        if self.coverage.version == self.saved_coverage_version:
+            return
+        self.connection.execute("DELETE FROM coverage")
+        self.connection.executemany("INSERT INTO coverage (start_block, end_block) VALUES (?, ?)", list(self.coverage))
+        self.saved_coverage_version = self.coverage.version
+
+    #
+    # EventScannerState methods implemented below
+    #
+
+    def get_last_scanned_block(self) -> int:
+        """The number of the last block we have stored."""
+        row = self.connection.execute("SELECT value FROM scan_state WHERE key = 'last_scanned_block'").fetchone()
+        return row[0] if row else 0
+
+    def delete_data(self, since_block: int) -> int:
+        """Remove potentially reorganised blocks from the scan data with a single range delete."""
+        deleted = self.connection.execute("DELETE FROM events WHERE block >= ?", (since_block,)).rowcount
+        self.connection.execute(
+            "UPDATE scan_state SET value = ? WHERE key = 'last_scanned_block' AND value >= ?",
+            (since_block - 1, since_block))
+        self.block_hashes.truncate(since_block)
+        self._save_block_hashes()
+        self.coverage.truncate(since_block)
+        self._save_coverage()
+        return deleted
+
+    def get_block_hash_index(self) -> BlockHashIndex:
+        return self.block_hashes
+
+    def get_coverage(self) -> BlockCoverage:
+        return self.coverage
+
+    def start_chunk(self, block_number: int, chunk_size: int):
+        # A chunk that failed in process_event left its transaction open, drop its half written events
+        if self.connection.in_transaction:
+            self.connection.execute("ROLLBACK")
+        self.connection.execute("BEGIN")
+
+    def end_chunk(self, block_number: int):
+        """Commit the chunk, so we can resume in the case of a crash or CTRL+C"""
+        # Filling a gap behind the last scanned block does not move it back
+        self.connection.execute(
+            "INSERT INTO scan_state (key, value) VALUES ('last_scanned_block', ?) "
+            "ON CONFLICT (key) DO UPDATE SET value = max(value, excluded.value)", (block_number,))
+        self._save_block_hashes()
+        self._save_coverage()
+        self.connection.execute("COMMIT")
+
+    def process_event(self, block_when: Optional[datetime.datetime], event: AttributeDict) -> str:
+        """Record a Sync or Swap event in the current chunk transaction."""
+        log_index = event.logIndex
+        txhash = event.transactionHash.hex()
+        block_number = event.blockNumber
+        args = event["args"]
+        timestamp = int(block_when.replace(tzinfo=datetime.timezone.utc).timestamp()) if block_when else None
+
+        row = {"pair": event["address"], "block": block_number, "log_index": log_index, "txhash": txhash,
+               "event": event["event"], "timestamp": timestamp}
+        if event["event"] == "Sync":
+            row.update({field: str(args[field]) for field in SYNC_FIELDS})
+        elif event["event"] == "Swap":
+            row.update({field: args[field] if field in ('sender', 'to') else str(args[field])
+                        for field in SWAP_FIELDS})
+
+        columns = ", ".join(f'"{column}"' for column in row)
+        self.connection.execute(
+            f"INSERT OR REPLACE INTO events ({columns}) VALUES ({', '.join('?' * len(row))})", list(row.values()))
+
+        # Return a pointer that allows us to look up this event later if needed
+        return f"{block_number}-{txhash}-{log_index}"
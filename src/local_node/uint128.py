@@ -0,0 +1,108 @@
+"""Exact fixed-width columns for the uint112 reserves and uint256 amounts of a pair.
+
+Reserves and amounts do not fit 64 bits, so pandas keeps them as Python ints in object columns and every
+operation on them runs one element at a time. `UInt128Column` stores each value as two uint64 words, high and low,
+which holds any reserve or amount of a Uniswap V2 pair exactly: the pair reverts when a balance exceeds uint112,
+and no swap moves more than a balance. Larger values raise `OverflowError` instead of losing precision.
+
+Sums and differences are exact. Ratios and logarithms are float64, from a conversion with a relative error below
+2 ** -52.
+"""
+
+from typing import Sequence
+
+import numpy as np
+
+MASK32 = np.uint64(0xFFFFFFFF)
+MASK64 = (1 << 64) - 1
+MAX_UINT64 = np.uint64(MASK64)
+TWO_POW_64 = float(1 << 64)
+
+
+class UInt128Column:
+    """Unsigned 128 bit integers as a pair of uint64 arrays."""
+
+    def __init__(self, hi: np.ndarray, lo: np.ndarray):
+        self.hi = np.asarray(hi, dtype=np.uint64)
+        self.lo = np.asarray(lo, dtype=np.uint64)
+
+    @staticmethod
+    def from_ints(values: Sequence[int]) -> 'UInt128Column':
+        """Encode Python ints, e.g. an object column of reserves."""
+        values = np.asarray(values, dtype=object)
+        if len(values) and (min(values) < 0 or max(values) >> 128):
+            raise OverflowError("Values must be in [0, 2 ** 128)")
+        # Shifts and masks on object arrays still run per element, but only once per column
+        hi = (values >> 64).astype(np.uint64) if len(values) else np.empty(0, dtype=np.uint64)
+        lo = (values & MASK64).astype(np.uint64) if len(values) else np.empty(0, dtype=np.uint64)
+        return UInt128Column(hi, lo)
+
+    def __len__(self):
+        return len(self.lo)
+
+    def __getitem__(self, item) -> 'UInt128Column':
+        return UInt128Column(self.hi[item], self.lo[item])
+
+    def to_ints(self) -> np.ndarray:
+        """Decode into an object array of Python ints."""
+        hi = self.hi.astype(object)
+        lo = self.lo.astype(object)
+        return (hi << 64) | lo
+
+    def to_float(self) -> np.ndarray:
+        return self.hi.astype(np.float64) * TWO_POW_64 + self.lo.astype(np.float64)
+
+    def limbs(self) -> list:
+        """The value as four 32 bit limbs in uint64, lowest first."""
+        return [self.lo & MASK32, self.lo >> np.uint64(32), self.hi & MASK32, self.hi >> np.uint64(32)]
+
+    @staticmethod
+    def from_limbs(limbs: list) -> 'UInt128Column':
+        """Normalise limbs holding more than 32 bits by carrying into the next one."""
+        carry = np.uint64(0)
+        normalised = []
+        for limb in limbs:
+            limb = limb + carry
+            normalised.append(limb & MASK32)
+            carry = limb >> np.uint64(32)
+        if np.any(carry):
+            raise OverflowError("Result does not fit 128 bits")
+        return UInt128Column(normalised[2] | (normalised[3] << np.uint64(32)),
+                             normalised[0] | (normalised[1] << np.uint64(32)))
+
+
+def add(a: UInt128Column, b: UInt128Column) -> UInt128Column:
+    lo = a.lo + b.lo
+    carry = (lo < a.lo).astype(np.uint64)
+    room = MAX_UINT64 - a.hi
+    if np.any((b.hi > room) | ((b.hi == room) & (carry > 0))):
+        raise OverflowError("Result does not fit 128 bits")
+    return UInt128Column(a.hi + b.hi + carry, lo)
+
+
+def sub(a: UInt128Column, b: UInt128Column) -> UInt128Column:
+    if np.any(less(a, b)):
+        raise OverflowError("Result is negative")
+    borrow = (a.lo < b.lo).astype(np.uint64)
+    return UInt128Column(a.hi - b.hi - borrow, a.lo - b.lo)
+
+
+def less(a: UInt128Column, b: UInt128Column) -> np.ndarray:
+    return (a.hi < b.hi) | ((a.hi == b.hi) & (a.lo < b.lo))
+
+
+def cumsum(a: UInt128Column) -> UInt128Column:
+    """Exact running sum, for up to 2 ** 32 rows."""
+    return UInt128Column.from_limbs([np.cumsum(limb, dtype=np.uint64) for limb in a.limbs()])
+
+
+def ratio(a: UInt128Column, b: UInt128Column) -> np.ndarray:
+    """a / b as float64, inf or NaN where b is zero."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return a.to_float() / b.to_float()
+
+
+def log(a: UInt128Column) -> np.ndarray:
+    """Natural logarithm as float64, -inf for zero."""
+    with np.errstate(divide='ignore'):
+        return np.log(a.to_float())
@@ -0,0 +1,90 @@
+from unittest import TestCase
+
+import numpy as np
+from pandas import DataFrame
+
+from src.analysis.downsample import LevelOfDetail, lttb, min_max
+
+
+def make_oracle_frame(count=200_000, seed=2) -> DataFrame:
+    """Block frame shaped like the notebook's `oracle_df`, NaN until the first window is full."""
+    rng = np.random.default_rng(seed)
+    price = np.exp(np.cumsum(rng.normal(0, 0.001, size=count)))
+    twap = np.convolve(price, np.ones(150) / 150)[:count]
+    twap[:149] = np.nan
+    return DataFrame({"block": np.arange(16_000_000, 16_000_000 + count), "current_price": price,
+                      "twap_30_x_per_y": twap})
+
+
+class TestLevelOfDetail(TestCase):
+
+    def setUp(self):
+        self.df = make_oracle_frame()
+        self.lod = LevelOfDetail(self.df)
+
+    def assert_keeps_extremes(self, picked: np.ndarray, rows: slice, bucket: int):
+        """Every bucket of the level, cut to the range, has its minimum and maximum among the picked rows."""
+        edges = [rows.start] + list(range(-(-rows.start // bucket) * bucket, rows.stop, bucket)) + [rows.stop]
+        for name in ["current_price", "twap_30_x_per_y"]:
+            values = self.df[name].to_numpy()
+            for start, end in zip(edges, edges[1:]):
+                if start == end or np.isnan(values[start:end]).all():
+                    continue
+                inside = picked[(start <= picked) & (picked < end)]
+                self.assertEqual(np.nanmin(values[inside]), np.nanmin(values[start:end]))
+                self.assertEqual(np.nanmax(values[inside]), np.nanmax(values[start:end]))
+
+    def test_query_keeps_extremes_of_every_bucket(self):
+        width = 300
+        for start, end in [(None, None), (16_000_100, 16_123_456), (16_050_001, 16_090_000)]:
+            rows = self.lod.rows(start, end)
+            picked = self.lod.query_rows(start, end, width)
+            self.assertTrue(np.all(np.diff(picked) > 0))
+            # At least a bucket per pixel, at most two, with a minimum and a maximum of each column per bucket
+            level = self.lod.level_for(rows.stop - rows.start, width)
+            bucket = self.lod.bucket_sizes[level]
+            self.assertGreaterEqual((rows.stop - rows.start) // bucket, width)
+            self.assertLessEqual(len(picked), 2 * 2 * 2 * width + 10)
+            self.assert_keeps_extremes(picked, rows, bucket)
+
+    def test_zoomed_range_is_full_resolution(self):
+        df = self.df
+        view = self.lod.query(16_100_000, 16_100_400, width=1000)
+        expected = df[(16_100_000 <= df.block) & (df.block <= 16_100_400)].reset_index(drop=True)
+        self.assertEqual(list(view.columns), list(expected.columns))
+        np.testing.assert_array_equal(view.to_numpy(), expected.to_numpy())
+
+    def test_pyramid_levels_match_direct_reduction(self):
+        values = self.df["twap_30_x_per_y"].to_numpy()
+        for bucket, extrema in zip(self.lod.bucket_sizes, self.lod.levels["twap_30_x_per_y"]):
+            padded = np.concatenate((values, np.full(-len(values) % bucket, np.nan))).reshape(-1, bucket)
+            with np.errstate(all="ignore"), np.testing.suppress_warnings() as warnings:
+                warnings.filter(RuntimeWarning)
+                lows, highs = np.nanmin(padded, axis=1), np.nanmax(padded, axis=1)
+            np.testing.assert_array_equal(values[extrema[0]], lows)
+            np.testing.assert_array_equal(values[extrema[1]], highs)
+        # About the size of the columns themselves
+        self.assertLess(self.lod.nbytes, 1.01 * sum(values.nbytes for values in self.lod.columns.values()))
+
+    def test_lttb(self):
+        view = self.lod.query(width=500, columns=["current_price"], method="lttb")
+        self.assertEqual(len(view), 500)
+        self.assertEqual(view.block.iloc[0], self.df.block.iloc[0])
+        self.assertEqual(view.block.iloc[-1], self.df.block.iloc[-1])
+        with self.assertRaises(ValueError):
+            self.lod.query(method="lttb")
+
+        y = np.zeros(10_000)
+        y[4321] = 5.0
+        y[:10] = np.nan
+        picked = lttb(np.arange(len(y)), y, 100)
+        self.assertEqual(len(picked), 100)
+        self.assertIn(4321, picked)
+        self.assertFalse(np.isnan(y[picked]).any())
+
+    def test_min_max(self):
+        values = self.df["current_price"].to_numpy()
+        picked = min_max(values, 100)
+        self.assertLessEqual(len(picked), 200)
+        self.assertIn(values.argmax(), picked)
+        self.assertIn(values.argmin(), picked)
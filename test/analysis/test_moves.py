@@ -0,0 +1,75 @@
+import time
+from unittest import TestCase
+
+import numpy as np
+from pandas import DataFrame
+
+from src.analysis.moves import MAX_IN, MAX_NET, MoveIndex
+from test.analysis.test_sparse_block_series import dense_block_frame, make_swaps
+
+
+def big_moves_frame(block_df: DataFrame) -> DataFrame:
+    """`big_moves_df` of the analysis notebook."""
+    big_moves_df = DataFrame({
+        "block": block_df["block"],
+        "amount0In_per_reserve0": block_df["amount0In"] / block_df["reserve0"],
+        "amount1In_per_reserve1": block_df["amount1In"] / block_df["reserve1"],
+        "amount0Net_per_reserve0": (block_df["amount0In"] - block_df["amount0Out"]) / block_df["reserve0"],
+        "amount1Net_per_reserve1": (block_df["amount1In"] - block_df["amount1Out"]) / block_df["reserve1"],
+    })
+    big_moves_df["max_amountIn_per_reserve"] = big_moves_df[[
+        "amount0In_per_reserve0", "amount1In_per_reserve1"]].max(axis=1)
+    big_moves_df["max_amountNet_per_reserve"] = big_moves_df[[
+        "amount0Net_per_reserve0", "amount1Net_per_reserve1"]].max(axis=1)
+    return big_moves_df
+
+
+class TestMoveIndex(TestCase):
+
+    def setUp(self):
+        self.swaps = make_swaps(count=3000)
+        self.big_moves = big_moves_frame(dense_block_frame(self.swaps))
+        self.index = MoveIndex.from_swaps(self.swaps, segment_size=64)
+
+    def test_block_range_matches_mask(self):
+        for start, end in [(5000, 5400), (0, 1500), (19990, 30000), (7000, 6000)]:
+            moves = self.big_moves
+            expected = moves[(start <= moves.block) & (moves.block <= end) & (moves[MAX_NET] != 0)]
+            result = self.index.block_range(start, end)
+            np.testing.assert_array_equal(result.block.to_numpy(), expected.block.to_numpy())
+            np.testing.assert_allclose(result[MAX_NET].to_numpy(), expected[MAX_NET].to_numpy())
+
+    def test_top_moves_match_sort(self):
+        for by in [MAX_NET, MAX_IN, "amount1In_per_reserve1"]:
+            for start, end in [(None, None), (3000, 15000), (4000, 4100), (7200, None)]:
+                for k in [1, 10, 200]:
+                    moves = self.big_moves
+                    in_range = moves[((start or 0) <= moves.block) & (moves.block <= (end or np.inf))]
+                    expected = in_range.sort_values(by, ascending=False).head(k)
+                    expected = expected[expected[by] > 0]
+                    result = self.index.top_moves(k, start, end, by=by)
+                    result = result[result[by] > 0]
+                    np.testing.assert_array_equal(result.block.to_numpy(), expected.block.to_numpy())
+                    np.testing.assert_allclose(result[by].to_numpy(), expected[by].to_numpy())
+                    rows = self.index.rows(start, end)
+                    self.assertEqual(self.index.range_max(by, rows), in_range[by].max())
+
+    def test_time_range(self):
+        timestamps = 1_600_000_000 + (self.index.blocks - self.index.blocks[0]) * 12
+        index = MoveIndex(self.index.blocks, self.index.columns, timestamps)
+        result = index.time_range(timestamps[10], timestamps[20])
+        self.assertEqual(list(result.block), list(self.index.blocks[10:21]))
+        with self.assertRaises(ValueError):
+            self.index.time_rows(0, 1)
+
+    def test_large_history(self):
+        rng = np.random.default_rng(3)
+        count = 2_000_000
+        blocks = np.cumsum(rng.integers(1, 4, size=count))
+        index = MoveIndex(blocks, {MAX_NET: rng.random(count)})
+        index.segment_maxima(MAX_NET)
+        start = time.perf_counter()
+        top = index.top_moves(10, int(blocks[1000]), int(blocks[-1000]))
+        self.assertLess(time.perf_counter() - start, 0.5)
+        values = index.columns[MAX_NET][1000:count - 999]
+        np.testing.assert_array_equal(top[MAX_NET].to_numpy(), np.sort(values)[::-1][:10])
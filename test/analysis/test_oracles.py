@@ -0,0 +1,75 @@
+import math
+from unittest import TestCase
+
+import numpy as np
+from pandas import DataFrame
+
+from src.analysis.oracles import OracleEngine, TWAP, GEOM_TWAP, VWAP
+from src.analysis.sparse_block_series import SparseBlockSeries
+from test.analysis.test_sparse_block_series import dense_block_frame, make_swaps
+
+
+class NotebookOracleBuilder:
+    """The `OracleBuilder` of the analysis notebook, one window per call."""
+    tick_log = math.log(1.0001)
+
+    def __init__(self, block_df: DataFrame):
+        self.block_df = block_df
+        self.df = DataFrame(block_df.loc[:, ("block")])
+
+    def add_twap(self, minutes):
+        blocks = minutes * 5
+        cumsum_x_per_y = self.block_df.loc[:, ('reserve0')].divide(self.block_df['reserve1']).cumsum()
+        self.df[f"twap_{minutes}_x_per_y"] = (cumsum_x_per_y - cumsum_x_per_y.shift(blocks)).divide(blocks)
+        return self
+
+    def add_geom_twap(self, minutes):
+        blocks = minutes * 5
+        tick_sum = (np.log((self.block_df['reserve0'] / self.block_df['reserve1']).astype(float)) / self.tick_log).cumsum()
+        self.df[F"geom_twap_{minutes}_x_per_y"] = np.power(1.0001, (tick_sum - tick_sum.shift(blocks)) / blocks)
+        return self
+
+    def add_vwap(self, minutes):
+        blocks = minutes * 5
+        cumsum_x_in = self.block_df["amount0In"].cumsum()
+        cumsum_y_out = self.block_df["amount1Out"].cumsum()
+        cumsum_y_in = self.block_df["amount1In"].cumsum()
+        cumsum_x_out = self.block_df["amount0Out"].cumsum()
+        self.df[f"vwap_{minutes}_x_per_y"] = (
+            cumsum_x_in + cumsum_x_out - (cumsum_x_in + cumsum_x_out).shift(blocks)).divide(
+            (cumsum_y_in + cumsum_y_out - (cumsum_y_in + cumsum_y_out).shift(blocks)).replace({0: np.nan}))
+        return self
+
+    def add_proposed(self, minutes):
+        blocks = minutes * 5
+        geom_0In_1Out = (np.log((self.block_df["amount0In"] / self.block_df["amount1Out"].replace({0: np.nan})).fillna(method='ffill')) / self.tick_log).cumsum()
+        geom_1In_0Out = (np.log((self.block_df["amount0Out"] / self.block_df["amount1In"].replace({0: np.nan})).fillna(method='ffill')) / self.tick_log).cumsum()
+        self.df[f'proposed_0In_1Out_oracle_{minutes}'] = np.power(1.0001, (geom_0In_1Out - geom_0In_1Out.shift(blocks)) / blocks)
+        self.df[f'proposed_1In_0Out_oracle_{minutes}'] = np.power(1.0001, (geom_1In_0Out - geom_1In_0Out.shift(blocks)) / blocks)
+        return self
+
+
+class TestOracleEngine(TestCase):
+    MINUTES = [1, 5, 30]
+
+    def setUp(self):
+        self.swaps = make_swaps()
+        self.block_df = dense_block_frame(self.swaps)
+
+    def test_matches_notebook_oracle_builder(self):
+        builder = NotebookOracleBuilder(self.block_df)
+        for minutes in self.MINUTES:
+            builder.add_twap(minutes).add_geom_twap(minutes).add_vwap(minutes).add_proposed(minutes)
+        expected = builder.df
+
+        actual = OracleEngine(self.block_df).evaluate(self.MINUTES)
+        self.assertEqual(set(actual.columns), set(expected.columns))
+        for column in expected.columns:
+            np.testing.assert_allclose(actual[column].to_numpy(dtype=float), expected[column].to_numpy(dtype=float),
+                                       rtol=1e-7, err_msg=column)
+
+    def test_sparse_matches_dense_at_event_blocks(self):
+        dense = OracleEngine(self.block_df).evaluate(self.MINUTES, kinds=(TWAP, GEOM_TWAP, VWAP)).set_index('block')
+        sparse = OracleEngine(SparseBlockSeries.from_swaps(self.swaps)).evaluate(
+            self.MINUTES, kinds=(TWAP, GEOM_TWAP, VWAP)).set_index('block')
+        np.testing.assert_allclose(sparse.to_numpy(), dense.loc[sparse.index].to_numpy(), rtol=1e-9)
@@ -0,0 +1,65 @@
+import time
+from unittest import TestCase
+
+import numpy as np
+from pandas import DataFrame
+import pandas as pd
+
+from src.analysis.payouts import EXAMPLES, Portfolio, daily_rate, heat_frame, payout_surface, portfolio_grid, \
+    principal_change, summarize
+
+percent = np.linspace(-0.5, 0.5, num=100)
+
+
+def get_princ_perc(dl=0, bl=0, dx=0, bx=0, dy=0, by=0):
+    """`get_princ_perc` of the payout charts notebook."""
+    principal = dl - bl + dx - bx + dy - by
+    return ((dl - bl) * np.sqrt(1 + percent) + (dx - bx) + (dy - by) * (1 + percent)) / principal - 1
+
+
+def make_heat_df(percent, first_array, apy, days):
+    """`make_heat_df` of the payout charts notebook."""
+    apd = (apy + 1) ** (1 / 365) - 1
+    data = {d: first_array + apd * d for d in range(days)}
+    return DataFrame(data=data, index=percent)
+
+
+class TestPayouts(TestCase):
+
+    def test_principal_change_matches_notebook(self):
+        changes = principal_change(list(EXAMPLES.values()), percent)
+        for row, portfolio in zip(changes, EXAMPLES.values()):
+            np.testing.assert_allclose(row, get_princ_perc(**portfolio._asdict()), rtol=1e-12)
+
+    def test_heat_frame_matches_notebook(self):
+        for portfolio in EXAMPLES.values():
+            expected = make_heat_df(percent, get_princ_perc(**portfolio._asdict()), 0.35, 95)
+            pd.testing.assert_frame_equal(heat_frame(portfolio, percent, 0.35, 95), expected, rtol=1e-12)
+
+    def test_surface_axes_and_chunks(self):
+        apys = np.array([0.0, 0.1, 0.35])
+        days = np.array([0, 30, 365])
+        surface = payout_surface(list(EXAMPLES.values()), percent, apys, days)
+        self.assertEqual(surface.shape, (len(EXAMPLES), len(percent), len(apys), len(days)))
+        i = list(EXAMPLES).index("Delta Nuetral Market Making")
+        expected = get_princ_perc(**EXAMPLES["Delta Nuetral Market Making"]._asdict()) + daily_rate(0.1) * 365
+        np.testing.assert_allclose(surface[i, :, 1, 2], expected, rtol=1e-12)
+
+        chunked = payout_surface(list(EXAMPLES.values()), percent, apys, days, max_bytes=percent.size * 8 * 9 * 2)
+        np.testing.assert_array_equal(chunked, surface)
+
+    def test_sweep(self):
+        portfolios = portfolio_grid(dl=np.linspace(1, 10, 20), bx=np.linspace(0, 4, 20), by=np.linspace(0, 4, 20))
+        self.assertEqual(len(portfolios), 8000)
+        self.assertEqual(tuple(portfolios.iloc[1]), Portfolio(dl=1, by=4 / 19))
+
+        start = time.perf_counter()
+        summary = summarize(portfolios, percent, [0.1, 0.35], 365, max_bytes=2 ** 24)
+        self.assertLess(time.perf_counter() - start, 10)
+        row = 1234
+        expected = payout_surface(portfolios.iloc[[row]], percent, [0.1, 0.35], 365)
+        self.assertAlmostEqual(summary.loc[row, "min"], expected.min())
+        self.assertAlmostEqual(summary.loc[row, "max"], expected.max())
+        self.assertAlmostEqual(summary.loc[row, "mean"], expected.mean())
+        with self.assertRaises(ValueError):
+            portfolio_grid(dz=[1])
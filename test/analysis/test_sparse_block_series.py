@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+from unittest import TestCase
+
+from src.analysis.sparse_block_series import SparseBlockSeries
+
+
+def make_swaps(count=500, seed=1) -> DataFrame:
+    """Swap frame shaped like the output of ProcessStateToDF."""
+    rng = np.random.default_rng(seed)
+    blocks = np.sort(rng.choice(np.arange(1000, 20000), size=count, replace=True))
+    amount_in = rng.integers(1, 10 ** 6, size=count)
+    zero_for_one = rng.random(count) < 0.5
+    return DataFrame({
+        'block': blocks,
+        'amount0In': np.where(zero_for_one, amount_in, 0),
+        'amount1In': np.where(zero_for_one, 0, amount_in),
+        'amount0Out': np.where(zero_for_one, 0, amount_in // 3),
+        'amount1Out': np.where(zero_for_one, amount_in * 2, 0),
+        'reserve0': rng.integers(10 ** 8, 10 ** 9, size=count),
+        'reserve1': rng.integers(10 ** 8, 10 ** 9, size=count),
+    })
+
+
+def dense_block_frame(state_df: DataFrame) -> DataFrame:
+    """`index_by_block_and_cache` of the analysis notebook, without the caching."""
+    block_df = state_df.groupby(state_df.block, as_index=False).agg({
+        'block': 'first', 'amount0In': sum, 'amount1In': sum, 'amount0Out': sum, 'amount1Out': sum,
+        'reserve0': 'first', 'reserve1': 'first'})
+    block_df = block_df.set_index('block').reindex(
+        np.arange(block_df.block.min(), block_df.block.max() + 1)).reset_index()
+    block_df.reserve0 = block_df.reserve0.fillna(method='bfill')
+    block_df.reserve1 = block_df.reserve1.fillna(method='bfill')
+    return block_df.fillna(value=0)
+
+
+class TestSparseBlockSeries(TestCase):
+
+    def setUp(self):
+        self.swaps = make_swaps()
+        self.dense = dense_block_frame(self.swaps)
+        self.series = SparseBlockSeries.from_swaps(self.swaps).with_prices()
+
+    def test_densify_matches_dense_frame(self):
+        dense = self.series.densify()
+        for column in ['amount0In', 'amount1In', 'amount0Out', 'amount1Out', 'reserve0', 'reserve1']:
+            np.testing.assert_allclose(dense[column].to_numpy(), self.dense[column].to_numpy().astype(float))
+        self.assertLess(self.series.nbytes, dense.memory_usage().sum() / 10)
+
+        sub_range = self.series.densify(5000, 5100)
+        self.assertEqual(list(sub_range.block), list(range(5000, 5101)))
+
+    def test_oracles_match_dense_computation(self):
+        dense = self.dense
+        blocks = self.series.blocks
+        rows = blocks - dense.block.min()
+        for window in [1, 25, 150]:
+            x_per_y = (dense.reserve0 / dense.reserve1).cumsum()
+            twap = ((x_per_y - x_per_y.shift(window)) / window).to_numpy()[rows]
+            np.testing.assert_allclose(self.series.twap(window), twap, rtol=1e-9)
+
+            tick_sum = (np.log(dense.reserve0 / dense.reserve1) / np.log(1.0001)).cumsum()
+            geom = np.power(1.0001, (tick_sum - tick_sum.shift(window)) / window).to_numpy()[rows]
+            np.testing.assert_allclose(self.series.geom_twap(window), geom, rtol=1e-9)
+
+            volume0 = (dense.amount0In + dense.amount0Out).cumsum()
+            volume1 = (dense.amount1In + dense.amount1Out).cumsum()
+            vwap = ((volume0 - volume0.shift(window)) / (volume1 - volume1.shift(window)).replace({0: np.nan}))
+            np.testing.assert_allclose(self.series.vwap(window), vwap.to_numpy()[rows], rtol=1e-9)
+
+    def test_as_of_between_events(self):
+        between = np.arange(self.series.first_block, self.series.last_block + 1, 7)
+        np.testing.assert_allclose(self.series.as_of('reserve0', between),
+                                   self.dense.set_index('block').reserve0.loc[between].to_numpy().astype(float))
+        self.assertTrue(np.isnan(self.series.as_of('reserve0', [self.series.last_block + 1])[0]))
@@ -0,0 +1,113 @@
+import math
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from src.analysis.sparse_block_series import SparseBlockSeries
+from src.analysis.streaming_oracles import StreamingOracle, StreamingOracleState, TWAP, GEOM_TWAP, VWAP
+from src.local_node.event_scanner import JSONifiedState
+from src.local_node.process_state_to_df import ProcessStateToDF
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, PAIR_ADDRESS, make_pair_scanner
+
+WINDOWS = [5, 25, 150]
+
+
+def scan_with_oracle(provider: FakePairProvider, start_block: int, end_block: int, state=None):
+    state = state or StreamingOracleState(InMemoryState(), {PAIR_ADDRESS: StreamingOracle(WINDOWS)})
+    make_pair_scanner(provider, state).scan(start_block, end_block)
+    return state
+
+
+class TestStreamingOracle(TestCase):
+
+    def test_matches_sparse_block_series(self):
+        state = scan_with_oracle(FakePairProvider(100, 1100), 100, 1100)
+        oracle = state.oracles[PAIR_ADDRESS]
+        swaps = ProcessStateToDF.process_state(state.state.state["blocks"])
+        # The first swap has no earlier Sync to take its reserves from
+        series = SparseBlockSeries.from_swaps(swaps.iloc[1:]).with_prices()
+
+        blocks = np.arange(300, series.last_block + 1)
+        for window in WINDOWS:
+            for kind, expected in ((TWAP, series.twap(window, blocks)), (GEOM_TWAP, series.geom_twap(window, blocks)),
+                                   (VWAP, series.vwap(window, blocks))):
+                actual = [oracle.value(kind, window, block) for block in blocks]
+                np.testing.assert_allclose(actual, expected, rtol=1e-9, err_msg=f"{kind} {window}")
+
+    def test_window_before_first_price_is_nan(self):
+        oracle = scan_with_oracle(FakePairProvider(100, 400), 100, 400).oracles[PAIR_ADDRESS]
+        self.assertTrue(math.isnan(oracle.value(TWAP, 150, 249)))
+        self.assertFalse(math.isnan(oracle.value(TWAP, 150, 250)))
+
+    def test_rollback_on_reorg(self):
+        provider = FakePairProvider(100, 1100)
+        expected = scan_with_oracle(provider, 100, 1100).oracles[PAIR_ADDRESS].values()
+
+        state = scan_with_oracle(provider, 100, 1100)
+        state.delete_data(900)
+        self.assertEqual(state.oracles[PAIR_ADDRESS].head_block, 898)
+        scan_with_oracle(provider, 900, 1100, state)
+        self.assertEqual(state.oracles[PAIR_ADDRESS].values(), expected)
+
+    def test_pruned_history(self):
+        pruned = StreamingOracle([10], max_reorg_depth=5)
+        full = StreamingOracle([10], max_reorg_depth=10 ** 6)
+        for block in range(5000):
+            for oracle in (pruned, full):
+                oracle.add_block(block, block % 7, 1 + block % 3, (10 ** 18 + block, 10 ** 18))
+        self.assertLess(len(pruned.checkpoints), 2100)
+        self.assertEqual(pruned.values(), full.values())
+
+        pruned.rollback(4990)
+        self.assertEqual(pruned.head_block, 4989)
+        with self.assertRaises(ValueError):
+            pruned.rollback(10)
+
+    def test_coverage_round_trip(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        inner = JSONifiedState("state.json", tmp_dir.name)
+        inner.restore()
+        provider = FakePairProvider(100, 1100)
+        scan_with_oracle(provider, 100, 1100, StreamingOracleState(inner, {PAIR_ADDRESS: StreamingOracle([5])}))
+        inner.save()
+
+        restored = JSONifiedState("state.json", tmp_dir.name)
+        restored.restore()
+        self.assertEqual(restored.get_coverage().to_list(), [[100, 1100]])
+        state = StreamingOracleState(restored, {PAIR_ADDRESS: StreamingOracle([5])})
+        self.assertEqual(make_pair_scanner(provider, state).plan_gaps(100, 1100), [])
+
+    def open_state(self, directory: str) -> StreamingOracleState:
+        state = StreamingOracleState(JSONifiedState("state.json", directory), {PAIR_ADDRESS: StreamingOracle(WINDOWS)})
+        state.restore()
+        return state
+
+    def test_resumed_scan_keeps_windows(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        provider = FakePairProvider(100, 1100)
+        expected = scan_with_oracle(provider, 100, 1100).oracles[PAIR_ADDRESS]
+
+        scan_with_oracle(provider, 100, 600, self.open_state(tmp_dir.name)).save()
+        state = scan_with_oracle(provider, 601, 1100, self.open_state(tmp_dir.name))
+        oracle = state.oracles[PAIR_ADDRESS]
+        for block in (650, 800, 1100):
+            self.assertEqual(oracle.values(block), expected.values(block))
+
+    def test_state_saved_after_the_oracles_is_rescanned(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        provider = FakePairProvider(100, 1100)
+        expected = scan_with_oracle(provider, 100, 1100).oracles[PAIR_ADDRESS]
+
+        state = scan_with_oracle(provider, 100, 600, self.open_state(tmp_dir.name))
+        state.save()
+        # Like the periodic save of JSONifiedState in `end_chunk`, without the oracles
+        scan_with_oracle(provider, 601, 800, state).state.save()
+
+        state = self.open_state(tmp_dir.name)
+        self.assertEqual(state.get_last_scanned_block(), 600)
+        scan_with_oracle(provider, 601, 1100, state)
+        self.assertEqual(state.oracles[PAIR_ADDRESS].values(1100), expected.values(1100))
@@ -0,0 +1,53 @@
+"""Log decoding throughput of `eth_getLogs` batches.
+
+Run with `python -m test.local_node.benchmark_decoder`. Compares web3's `get_event_data` per log with the fast
+decoder's columns alone and with the per event records the scanner hands to states.
+"""
+
+import argparse
+import json
+import time
+
+from web3 import Web3
+from web3._utils.events import get_event_data
+
+from src.local_node.event_scanner import build_event_abis_by_topic
+from src.local_node.fast_decoder import decode_logs
+from src.uniswap_v2_pair_abi import UNISWAP_V2_PAIR_ABI
+from test.local_node.fake_provider import FakePairProvider, PAIR_ADDRESS
+
+
+def run_benchmark(blocks: int = 20000, swap_every: int = 3, repeat: int = 3) -> dict:
+    """Decode the logs of a synthetic history of `blocks` blocks, best of `repeat` runs per decoder."""
+    web3 = Web3(FakePairProvider(100, 100 + blocks - 1, swap_every=swap_every))
+    contract = web3.eth.contract(abi=json.loads(UNISWAP_V2_PAIR_ABI))
+    abis = build_event_abis_by_topic([contract.events.Sync, contract.events.Swap])
+    logs = web3.eth.get_logs({"fromBlock": 100, "toBlock": 100 + blocks - 1, "address": PAIR_ADDRESS})
+
+    decoders = {
+        "get_event_data": lambda: [get_event_data(web3.codec, abis[bytes(log["topics"][0])], log) for log in logs],
+        "columns": lambda: decode_logs(web3.codec, abis, logs),
+        "columns to events": lambda: decode_logs(web3.codec, abis, logs).to_events(),
+    }
+    result = {}
+    for name, decode in decoders.items():
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            decode()
+            seconds.append(time.perf_counter() - start)
+        result[f"{name} logs_per_second"] = len(logs) / min(seconds)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--blocks", type=int, default=20000)
+    parser.add_argument("--swap-every", type=int, default=3)
+    args = parser.parse_args()
+    for key, value in run_benchmark(args.blocks, args.swap_every).items():
+        print(f"{key:>36}: {value:,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Scanner and DataFrame throughput against the local stand-in node.
+
+Run with `python -m test.local_node.benchmark_scanner`. Reports blocks and logs per second, JSON-RPC calls per
+10k blocks and peak Python memory of `EventScanner.scan` over HTTP and of `ProcessStateToDF.process_state`.
+"""
+
+import argparse
+import json
+import time
+import tracemalloc
+
+from web3 import Web3
+
+from src.local_node.block_timestamps import BlockTimestampResolver
+from src.local_node.event_scanner import EventScanner
+from src.local_node.rpc_transport import JsonRpcTransport
+from src.local_node.process_state_to_df import ProcessStateToDF
+from src.uniswap_v2_pair_abi import UNISWAP_V2_PAIR_ABI
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, PAIR_ADDRESS
+from test.local_node.stand_in_node import StandInNode
+
+CONFIGURATIONS = {
+    "sequential": {},
+    "concurrent": {"concurrency": 4},
+    "no timestamps": {"timestamp_mode": BlockTimestampResolver.NONE},
+    "high latency": {"latency": 0.02, "concurrency": 4},
+    "size limited": {"max_response_bytes": 200000},
+    "transport": {"transport": True, "concurrency": 4},
+    "transport gzip": {"transport": True, "compress": True, "concurrency": 4},
+}
+
+
+def make_http_scanner(node: StandInNode, state, timestamp_mode=BlockTimestampResolver.EXACT, timeout=10,
+                      transport=False, **kwargs) -> EventScanner:
+    """EventScanner for the fake pair talking to the stand-in node over HTTP, like `ScannerRunner.make_scanner`.
+
+    :param transport: Go through a `JsonRpcTransport` instead of web3.py's provider
+    """
+    transport = JsonRpcTransport(node.url, timeout=timeout) if transport else None
+    provider = Web3.HTTPProvider(node.url, request_kwargs={'timeout': timeout})
+    provider.middlewares.clear()
+    web3 = Web3(provider)
+    contract = web3.eth.contract(abi=json.loads(UNISWAP_V2_PAIR_ABI))
+    kwargs.setdefault("max_chunk_scan_size", 10000)
+    kwargs.setdefault("request_retry_seconds", 0.05)
+    return EventScanner(
+        web3=web3, contract=contract, state=state, events=[contract.events.Sync, contract.events.Swap],
+        filters={"address": PAIR_ADDRESS},
+        timestamp_resolver=BlockTimestampResolver(web3, mode=timestamp_mode, transport=transport), transport=transport,
+        **kwargs)
+
+
+def run_benchmark(blocks: int = 20000, swap_every: int = 3, latency: float = 0.0, max_response_bytes=None,
+                  stall_every: int = 0, compress: bool = False, **scanner_kwargs) -> dict:
+    """Scan a fresh synthetic history of `blocks` blocks and turn it into the swap DataFrame.
+
+    :param scanner_kwargs: Passed on to `EventScanner`, plus `timestamp_mode` and `transport`
+    """
+    first_block = 100
+    last_block = first_block + blocks - 1
+    provider = FakePairProvider(first_block, last_block, swap_every=swap_every)
+    with StandInNode(provider, latency=latency, max_response_bytes=max_response_bytes, stall_every=stall_every,
+                     stall_seconds=1.5, compress=compress) as node:
+        state = InMemoryState()
+        scanner = make_http_scanner(node, state, timeout=1 if stall_every else 10, **scanner_kwargs)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        scanner.scan(first_block, last_block, start_chunk_size=100)
+        scan_seconds = time.perf_counter() - start
+        _, scan_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    logs = len(provider.logs)
+    rpc_calls = sum(count for method, count in provider.calls.items() if method != "batch")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    swaps = ProcessStateToDF.process_state(state.state["blocks"])
+    df_seconds = time.perf_counter() - start
+    _, df_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "blocks_per_second": blocks / scan_seconds,
+        "logs_per_second": logs / scan_seconds,
+        "rpc_calls_per_10k_blocks": rpc_calls * 10000 / blocks,
+        "http_requests_per_10k_blocks": node.http_requests * 10000 / blocks,
+        "scan_peak_memory_mb": scan_peak / 2 ** 20,
+        "swaps_per_second": len(swaps) / df_seconds,
+        "df_peak_memory_mb": df_peak / 2 ** 20,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--blocks", type=int, default=20000)
+    parser.add_argument("--swap-every", type=int, default=3)
+    parser.add_argument("--only", choices=list(CONFIGURATIONS), action="append")
+    args = parser.parse_args()
+
+    for name, configuration in CONFIGURATIONS.items():
+        if args.only and name not in args.only:
+            continue
+        result = run_benchmark(args.blocks, args.swap_every, **configuration)
+        print(f"{name:>14}: " + ", ".join(f"{key} {value:,.1f}" for key, value in result.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""An in-process JSON-RPC provider serving a synthetic Uniswap V2 pair history.
+
+Lets the scanner tests run without an archive node.
+"""
+
+import json
+import random
+from typing import Any, Dict, List, Optional
+
+from eth_utils import keccak
+from web3 import Web3
+from web3.providers.base import BaseProvider
+
+from src.local_node.event_scanner import EventScanner, EventScannerState, JSONifiedState
+from src.uniswap_v2_pair_abi import UNISWAP_V2_PAIR_ABI
+
+PAIR_ADDRESS = "0x85Cb0baB616Fe88a89A35080516a8928F38B518b"
+SYNC_TOPIC = "0x" + keccak(text="Sync(uint112,uint112)").hex()
+SWAP_TOPIC = "0x" + keccak(text="Swap(address,uint256,uint256,uint256,uint256,address)").hex()
+GENESIS_TIMESTAMP = 1600000000
+
+
+OTHER_PAIR_ADDRESS = "0xA478c2975Ab1Ea89e8196811F51A7B7Ade33eB11"
+
+
+def _word(value: int) -> str:
+    return format(value, "064x")
+
+
+def _address_topic(address: str) -> str:
+    return "0x" + "0" * 24 + address[2:].lower()
+
+
+class FakePairProvider(BaseProvider):
+    """Serve `eth_getLogs`, `eth_getBlockByNumber` and `eth_blockNumber` for a deterministic swap history.
+
+    Every `swap_every` blocks a transaction does a Sync followed by a Swap, like the pair contract emits them.
+    """
+
+    def __init__(self, first_block: int = 100, last_block: int = 1100, swap_every: int = 3, seed: int = 1,
+                 address: str = PAIR_ADDRESS, max_logs_per_response: Optional[int] = None):
+        self.max_logs_per_response = max_logs_per_response
+        self.first_block = first_block
+        self.last_block = last_block
+        self.swap_every = swap_every
+        self.calls: Dict[str, int] = {}
+        # `eth_getLogs` requests answered with an error
+        self.failed_requests = 0
+        self.logs: List[dict] = []
+        self.pairs: List[str] = []
+        self.pair_histories: List[tuple] = []
+        # Blocks from which the chain was reorganised, every one changes the hashes of the blocks after it
+        self.fork_blocks: List[int] = []
+        self.add_pair(address, first_block, seed)
+
+    def add_pair(self, address: str, first_block: int, seed: int = 1):
+        """Add the history of another pair, created at `first_block`."""
+        self.pairs.append(address)
+        self.pair_histories.append((address, first_block, seed))
+        self.logs += self._pair_logs(len(self.pairs) - 1, seed)
+        self.logs.sort(key=lambda log: (int(log["blockNumber"], 16), int(log["logIndex"], 16)))
+
+    def reorg(self, fork_block: int):
+        """Replace every block from `fork_block` on, with other hashes and other swaps."""
+        self.fork_blocks.append(fork_block)
+        self.logs = [log for log in self.logs if int(log["blockNumber"], 16) < fork_block]
+        for pair_index, (_, _, seed) in enumerate(self.pair_histories):
+            self.logs += [log for log in self._pair_logs(pair_index, seed + 1000 * len(self.fork_blocks))
+                          if int(log["blockNumber"], 16) >= fork_block]
+        self.logs.sort(key=lambda log: (int(log["blockNumber"], 16), int(log["logIndex"], 16)))
+
+    def _pair_logs(self, pair_index: int, seed: int) -> List[dict]:
+        address, first_block, _ = self.pair_histories[pair_index]
+        logs = []
+        rng = random.Random(seed)
+        reserve0, reserve1 = 10 ** 21, 5 * 10 ** 23
+        sender = "0x" + "11" * 20
+        for block in range(first_block, self.last_block + 1, self.swap_every):
+            amount0_in = rng.randint(1, 10 ** 18)
+            amount1_out = reserve1 * amount0_in // (reserve0 + amount0_in)
+            reserve0 += amount0_in
+            reserve1 -= amount1_out
+            txhash = "0x" + keccak(text=f"{address}-{block}-{seed}").hex()
+            log_index = 2 * pair_index
+            logs.append(self._log(address, block, txhash, log_index, [SYNC_TOPIC],
+                                  _word(reserve0) + _word(reserve1)))
+            logs.append(self._log(address, block, txhash, log_index + 1,
+                                  [SWAP_TOPIC, _address_topic(sender), _address_topic(sender)],
+                                  _word(amount0_in) + _word(0) + _word(0) + _word(amount1_out)))
+        return logs
+
+    def _log(self, address: str, block: int, txhash: str, log_index: int, topics: List[str], data: str) -> dict:
+        return {
+            "address": address,
+            "blockHash": self.block_hash(block),
+            "blockNumber": hex(block),
+            "data": "0x" + data,
+            "logIndex": hex(log_index),
+            "removed": False,
+            "topics": topics,
+            "transactionHash": txhash,
+            "transactionIndex": "0x0",
+        }
+
+    def block_hash(self, block: int) -> str:
+        forks = sum(1 for fork_block in self.fork_blocks if fork_block <= block)
+        return "0x" + keccak(block.to_bytes(32, "big") + forks.to_bytes(4, "big")).hex()
+
+    def get_logs(self, params: dict) -> List[dict]:
+        from_block = int(params["fromBlock"], 16)
+        to_block = int(params["toBlock"], 16)
+        topic0 = params.get("topics", [None])[0]
+        if isinstance(topic0, str):
+            topic0 = [topic0]
+        addresses = params.get("address")
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        if addresses is not None:
+            addresses = {address.lower() for address in addresses}
+        return [log for log in self.logs
+                if from_block <= int(log["blockNumber"], 16) <= to_block
+                and (topic0 is None or log["topics"][0] in topic0)
+                and (addresses is None or log["address"].lower() in addresses)]
+
+    def get_block(self, block: int) -> Any:
+        if block > self.last_block:
+            return None
+        return {
+            "number": hex(block),
+            "hash": self.block_hash(block),
+            "parentHash": self.block_hash(block - 1),
+            "timestamp": hex(GENESIS_TIMESTAMP + 12 * block),
+        }
+
+    def make_request(self, method, params) -> Dict[str, Any]:
+        self.calls[method] = self.calls.get(method, 0) + 1
+        if method == "eth_getLogs":
+            result = self.get_logs(params[0])
+            if self.max_logs_per_response is not None and len(result) > self.max_logs_per_response:
+                self.failed_requests += 1
+                return {"jsonrpc": "2.0", "id": 1, "error": {
+                    "code": -32005, "message": f"query returned more than {self.max_logs_per_response} results"}}
+        elif method == "eth_getBlockByNumber":
+            result = self.get_block(int(params[0], 16))
+        elif method == "eth_blockNumber":
+            result = hex(self.last_block)
+        elif method == "eth_chainId":
+            result = "0x1"
+        else:
+            return {"jsonrpc": "2.0", "id": 1, "error": {"code": -32601, "message": f"Unknown method {method}"}}
+        return {"jsonrpc": "2.0", "id": 1, "result": result}
+
+    def make_batch_request(self, calls) -> List[Dict[str, Any]]:
+        self.calls["batch"] = self.calls.get("batch", 0) + 1
+        return [self.make_request(method, params) for method, params in calls]
+
+    def isConnected(self) -> bool:
+        return True
+
+
+class InMemoryState(JSONifiedState):
+    """JSONifiedState that never writes to disk and remembers the order of committed chunks."""
+
+    def __init__(self):
+        super().__init__("unused.json")
+        self.reset()
+        # (first block, chunk size) of every started chunk
+        self.chunk_starts = []
+        self.chunk_ends = []
+
+    def save(self):
+        pass
+
+    def start_chunk(self, block_number, chunk_size):
+        self.chunk_starts.append((block_number, chunk_size))
+        super().start_chunk(block_number, chunk_size)
+
+    def end_chunk(self, block_number):
+        self.chunk_ends.append(block_number)
+        super().end_chunk(block_number)
+
+
+def make_pair_scanner(provider: BaseProvider, state: EventScannerState, **kwargs) -> EventScanner:
+    """EventScanner for Sync and Swap events of the fake pair."""
+    web3 = Web3(provider)
+    contract = web3.eth.contract(abi=json.loads(UNISWAP_V2_PAIR_ABI))
+    kwargs.setdefault("max_chunk_scan_size", 100)
+    return EventScanner(
+        web3=web3, contract=contract, state=state, events=[contract.events.Sync, contract.events.Swap],
+        filters={"address": PAIR_ADDRESS}, **kwargs)
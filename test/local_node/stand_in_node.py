@@ -0,0 +1,120 @@
+"""A local JSON-RPC server standing in for an archive node, serving the synthetic history of `FakePairProvider`.
+
+Unlike the in-process provider it goes through HTTP, so the scanner runs exactly as it does against a real node,
+with batches, connection reuse and client timeouts. Latency, response size limits, stalled requests and reorgs
+can be injected to see how the scanner copes.
+"""
+
+import gzip
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from test.local_node.fake_provider import FakePairProvider
+
+
+class StandInNode:
+    """Serve a `FakePairProvider` over HTTP on localhost."""
+
+    def __init__(self, provider: Optional[FakePairProvider] = None, latency: float = 0.0,
+                 max_response_bytes: Optional[int] = None, stall_every: int = 0, stall_seconds: float = 2.0,
+                 compress: bool = False):
+        """
+        :param latency: Seconds added to every HTTP request
+        :param max_response_bytes: Answer `eth_getLogs` with an error above this size, like node response limits
+        :param stall_every: Hold back every n-th `eth_getLogs` for `stall_seconds`, to trigger client timeouts
+        :param compress: Gzip responses for clients that accept it, like nodes behind a reverse proxy
+        """
+        self.provider = provider or FakePairProvider()
+        self.latency = latency
+        self.max_response_bytes = max_response_bytes
+        self.stall_every = stall_every
+        self.stall_seconds = stall_seconds
+        self.compress = compress
+        self.http_requests = 0
+        self.compressed_responses = 0
+        self.get_logs_requests = 0
+        self.lock = threading.Lock()
+        self.server: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'StandInNode':
+        node = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                response = json.dumps(node.handle(body)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                if node.compress and "gzip" in self.headers.get("Accept-Encoding", ""):
+                    response = gzip.compress(response, compresslevel=1)
+                    self.send_header("Content-Encoding", "gzip")
+                    with node.lock:
+                        node.compressed_responses += 1
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                try:
+                    self.wfile.write(response)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client timed out on a stalled request
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self) -> 'StandInNode':
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def reorg(self, fork_block: int):
+        with self.lock:
+            self.provider.reorg(fork_block)
+
+    def handle(self, body):
+        """Answer a single JSON-RPC request or a batch."""
+        with self.lock:
+            self.http_requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if isinstance(body, list):
+            with self.lock:
+                self.provider.calls["batch"] = self.provider.calls.get("batch", 0) + 1
+            return [self.handle_request(request) for request in body]
+        return self.handle_request(body)
+
+    def handle_request(self, request: dict) -> dict:
+        method = request["method"]
+        if method == "eth_getLogs":
+            with self.lock:
+                self.get_logs_requests += 1
+                stall = self.stall_every and self.get_logs_requests % self.stall_every == 0
+            if stall:
+                time.sleep(self.stall_seconds)
+        with self.lock:
+            response = self.provider.make_request(method, request.get("params", []))
+        response["id"] = request.get("id")
+        if (method == "eth_getLogs" and self.max_response_bytes is not None and "result" in response
+                and len(json.dumps(response["result"])) > self.max_response_bytes):
+            response = {"jsonrpc": "2.0", "id": request.get("id"),
+                        "error": {"code": -32005, "message": "response size exceeded"}}
+        return response
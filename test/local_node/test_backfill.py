@@ -0,0 +1,95 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from src.local_node.backfill import BackfillCoordinator, plan_shards
+from src.local_node.sqlite_state import SQLiteState
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, make_pair_scanner
+
+FIRST_BLOCK = 100
+LAST_BLOCK = 4099
+
+
+def fake_scanner(state):
+    return make_pair_scanner(FakePairProvider(FIRST_BLOCK, LAST_BLOCK), state)
+
+
+class FailOnceScanner:
+    """Scanner factory failing the first attempt at one shard, picklable for the worker processes."""
+
+    def __init__(self, marker_dir: str, failing_partition: str):
+        self.marker_dir = marker_dir
+        self.failing_partition = failing_partition
+
+    def __call__(self, state):
+        marker = os.path.join(self.marker_dir, "failed")
+        if os.path.basename(state.path) == self.failing_partition and not os.path.exists(marker):
+            open(marker, "w").close()
+            raise ConnectionError("Node went away")
+        return fake_scanner(state)
+
+
+class TestBackfill(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tmp_dir.name, "backfill")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def merged_blocks(self, coordinator: BackfillCoordinator) -> dict:
+        state = SQLiteState("merged.sqlite", self.tmp_dir.name)
+        state.restore()
+        coordinator.merge(state)
+        self.assertEqual(state.get_last_scanned_block(), LAST_BLOCK)
+        blocks = state.get_blocks()
+        state.close()
+        return blocks
+
+    def expected_blocks(self) -> dict:
+        state = InMemoryState()
+        fake_scanner(state).scan(FIRST_BLOCK, LAST_BLOCK)
+        return state.state["blocks"]
+
+    def test_plan_is_contiguous(self):
+        shards = plan_shards(FIRST_BLOCK, LAST_BLOCK, 7)
+        self.assertEqual(shards[0].start_block, FIRST_BLOCK)
+        self.assertEqual(shards[-1].end_block, LAST_BLOCK)
+        for previous, shard in zip(shards, shards[1:]):
+            self.assertEqual(shard.start_block, previous.end_block + 1)
+
+    def test_merge_matches_single_scan(self):
+        coordinator = BackfillCoordinator(self.directory, fake_scanner, FIRST_BLOCK, LAST_BLOCK, shards=4)
+        results = coordinator.run()
+        self.assertEqual(sorted(results), [0, 1, 2, 3])
+        self.assertEqual(coordinator.verify_coverage(), [])
+        self.assertEqual(self.merged_blocks(coordinator), self.expected_blocks())
+
+    def test_merge_keeps_a_later_last_scanned_block(self):
+        coordinator = BackfillCoordinator(self.directory, fake_scanner, FIRST_BLOCK, LAST_BLOCK, shards=2)
+        coordinator.run()
+        state = SQLiteState("merged.sqlite", self.tmp_dir.name)
+        state.restore()
+        # The target followed the chain tip while the history was backfilled
+        state.start_chunk(LAST_BLOCK + 500, 1)
+        state.end_chunk(LAST_BLOCK + 500)
+        coordinator.merge(state)
+        self.assertEqual(state.get_last_scanned_block(), LAST_BLOCK + 500)
+        state.close()
+
+    def test_failed_shard_is_retried_alone(self):
+        factory = FailOnceScanner(self.tmp_dir.name, "shard-0002.sqlite")
+        coordinator = BackfillCoordinator(self.directory, factory, FIRST_BLOCK, LAST_BLOCK, shards=4)
+        with self.assertRaises(RuntimeError):
+            coordinator.run(retries=0)
+        self.assertEqual([shard.index for shard in coordinator.verify_coverage()], [2])
+        with self.assertRaises(ValueError):
+            self.merged_blocks(coordinator)
+
+        # A rerun finds the plan and the complete partitions on disk, only shard 2 scans anything
+        coordinator = BackfillCoordinator(self.directory, factory, FIRST_BLOCK, LAST_BLOCK, shards=8)
+        results = coordinator.run(retries=0)
+        self.assertEqual(len(coordinator.shards), 4)
+        self.assertEqual([index for index, result in results.items() if result.events], [2])
+        self.assertEqual(self.merged_blocks(coordinator), self.expected_blocks())
@@ -0,0 +1,154 @@
+import json
+import tempfile
+from unittest import TestCase
+
+from src.local_node.block_hashes import BlockHashIndex
+from src.local_node.event_scanner import EventScanner, JSONifiedState
+from src.local_node.sqlite_state import SQLiteState
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, make_pair_scanner
+
+
+class TestBlockHashIndex(TestCase):
+
+    def setUp(self):
+        self.chain = {block: f"0x{block:064x}" for block in range(1000)}
+        self.index = BlockHashIndex({block: self.chain[block] for block in range(0, 1000, 10)})
+        self.lookups = []
+
+    def get_hash(self, block):
+        self.lookups.append(block)
+        return self.chain.get(block)
+
+    def test_no_fork(self):
+        self.assertIsNone(self.index.find_fork_block(self.get_hash))
+        self.assertEqual(self.lookups, [990])
+
+    def test_finds_fork_with_few_lookups(self):
+        for block in range(537, 1000):
+            self.chain[block] = "0xforked"
+        self.assertEqual(self.index.find_fork_block(self.get_hash), 531)
+        self.assertLessEqual(len(self.lookups), 9)
+
+    def test_fork_before_oldest_block(self):
+        self.chain = {}
+        self.assertEqual(self.index.find_fork_block(self.get_hash), 0)
+
+    def test_thinning_keeps_oldest_and_recent_blocks(self):
+        index = BlockHashIndex(max_entries=100)
+        for block in range(1000):
+            index.record(block, self.chain[block])
+        self.assertLessEqual(len(index), 100)
+        self.assertEqual(index.blocks[0], 0)
+        self.assertEqual(index.blocks[-50:], list(range(950, 1000)))
+
+        for block in range(300, 1000):
+            self.chain[block] = "0xforked"
+        fork_block = index.find_fork_block(self.get_hash)
+        self.assertLessEqual(fork_block, 300)
+
+
+class TestReorgRescan(TestCase):
+
+    def setUp(self):
+        self.provider = FakePairProvider(100, 1100)
+        self.state = InMemoryState()
+        self.scanner = make_pair_scanner(self.provider, self.state)
+        self.scanner.scan(100, 1100)
+
+    def test_no_fork_rescans_nothing(self):
+        blocks = dict(self.state.state["blocks"])
+        self.assertEqual(self.scanner.rewind_to_fork(), 1101)
+        self.assertEqual(self.state.state["blocks"], blocks)
+
+    def test_rescans_forked_suffix_only(self):
+        self.provider.reorg(950)
+        start_block = self.scanner.rewind_to_fork()
+        self.assertGreater(start_block, 940)
+        self.assertLessEqual(start_block, 950)
+        self.scanner.scan(start_block, 1100)
+
+        expected = InMemoryState()
+        make_pair_scanner(self.provider, expected).scan(100, 1100)
+        self.assertEqual(self.state.state["blocks"], expected.state["blocks"])
+
+    def test_deep_reorg(self):
+        self.provider.reorg(150)
+        start_block = self.scanner.rewind_to_fork()
+        self.assertLessEqual(start_block, 150)
+        self.scanner.scan(max(start_block, 100), 1100)
+
+        expected = InMemoryState()
+        make_pair_scanner(self.provider, expected).scan(100, 1100)
+        self.assertEqual(self.state.state["blocks"], expected.state["blocks"])
+
+    def test_interrupted_scan_rescans_unverified_blocks(self):
+        self.state.get_block_hash_index().truncate(1000)
+        self.assertEqual(self.scanner.get_suggested_scan_start_block(), 998)
+
+
+class TestPersistedBlockHashes(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_json_state_after_restore(self):
+        state = JSONifiedState("state.json", self.tmp_dir.name)
+        state.reset()
+        provider = FakePairProvider(100, 1100)
+        make_pair_scanner(provider, state).scan(100, 1100)
+        state.save()
+
+        restored = JSONifiedState("state.json", self.tmp_dir.name)
+        restored.restore()
+        self.assertEqual(restored.get_block_hash_index().to_dict(), state.get_block_hash_index().to_dict())
+        # Block keys are strings after the JSON round trip
+        self.assertEqual(restored.delete_data(1000), len([block for block in state.state["blocks"] if block >= 1000]))
+        self.assertTrue(all(int(block) < 1000 for block in restored.state["blocks"]))
+        self.assertEqual(restored.get_last_scanned_block(), 999)
+        with open(state.path) as f:
+            self.assertIn("block_hashes", json.load(f))
+
+    def test_json_state_saved_before_block_hashes(self):
+        state = JSONifiedState("state.json", self.tmp_dir.name)
+        state.reset()
+        provider = FakePairProvider(100, 1000)
+        make_pair_scanner(provider, state).scan(100, 1000)
+        state.save()
+        with open(state.path) as f:
+            saved = json.load(f)
+        del saved["block_hashes"], saved["coverage"]
+        with open(state.path, "w") as f:
+            json.dump(saved, f)
+
+        restored = JSONifiedState("state.json", self.tmp_dir.name)
+        restored.restore()
+        start_block = make_pair_scanner(provider, restored).rewind_to_fork()
+        # Only the last blocks are rescanned, like before block hashes were kept
+        self.assertEqual(start_block, 1000 - EventScanner.NUM_BLOCKS_RESCAN_FOR_FORKS)
+        self.assertEqual(restored.get_last_scanned_block(), start_block - 1)
+        self.assertEqual({int(block) for block in restored.state["blocks"]},
+                         {block for block in state.state["blocks"] if block < start_block})
+
+    def test_sqlite_state_after_restore(self):
+        state = SQLiteState("state.sqlite", self.tmp_dir.name)
+        state.restore()
+        provider = FakePairProvider(100, 1100)
+        make_pair_scanner(provider, state).scan(100, 1100)
+        hashes = state.get_block_hash_index().to_dict()
+        state.close()
+
+        state.restore()
+        self.assertEqual(state.get_block_hash_index().to_dict(), hashes)
+        provider.reorg(1000)
+        scanner = make_pair_scanner(provider, state)
+        start_block = scanner.rewind_to_fork()
+        self.assertLessEqual(start_block, 1000)
+        self.assertEqual(state.get_last_scanned_block(), start_block - 1)
+        state.close()
+
+        state.restore()
+        self.assertLess(state.get_block_hash_index().last_block, 1000)
+        state.close()
@@ -0,0 +1,70 @@
+import calendar
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from unittest import TestCase
+
+from web3 import Web3
+
+from src.local_node.block_timestamps import BlockTimestampCache, BlockTimestampResolver
+from test.local_node.fake_provider import FakePairProvider, GENESIS_TIMESTAMP
+
+
+def fill_cache(path: str, first_block: int) -> int:
+    """Write timestamps in many small transactions, like a backfill worker process."""
+    cache = BlockTimestampCache(path)
+    for start in range(first_block, first_block + 2000, 20):
+        cache.put_many({block: GENESIS_TIMESTAMP + 12 * block for block in range(start, start + 20)})
+    cache.close()
+    return first_block
+
+
+class TestBlockTimestampResolver(TestCase):
+
+    def setUp(self):
+        self.provider = FakePairProvider(100, 1100)
+        self.web3 = Web3(self.provider)
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp_dir.name, "timestamps.sqlite")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_one_batch_per_resolve(self):
+        resolver = BlockTimestampResolver(self.web3)
+        timestamps = resolver.resolve([200, 300, 400, 2000])
+        self.assertEqual(self.provider.calls["batch"], 1)
+        self.assertEqual(calendar.timegm(timestamps[300].timetuple()), GENESIS_TIMESTAMP + 12 * 300)
+        # Not mined yet
+        self.assertIsNone(timestamps[2000])
+
+    def test_persistent_cache_is_shared_across_resolvers(self):
+        cache = BlockTimestampCache(self.cache_path)
+        BlockTimestampResolver(self.web3, cache=cache).resolve([200, 300])
+        cache.close()
+
+        provider = FakePairProvider(100, 1100)
+        cache = BlockTimestampCache(self.cache_path)
+        timestamps = BlockTimestampResolver(Web3(provider), cache=cache).resolve([200, 300])
+        cache.close()
+        self.assertNotIn("batch", provider.calls)
+        self.assertEqual(len(timestamps), 2)
+
+    def test_cache_is_shared_by_processes(self):
+        with ProcessPoolExecutor(max_workers=4) as executor:
+            list(executor.map(fill_cache, [self.cache_path] * 4, range(0, 8000, 2000)))
+        cache = BlockTimestampCache(self.cache_path)
+        self.assertEqual(len(cache.get_many(list(range(8000)))), 8000)
+        self.assertEqual(cache.connection.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+        cache.close()
+
+    def test_interpolated_and_disabled_modes(self):
+        resolver = BlockTimestampResolver(self.web3, mode=BlockTimestampResolver.INTERPOLATED, anchor_interval=100)
+        self.assertEqual(resolver.interpolate([250, 260]), {250: GENESIS_TIMESTAMP + 12 * 250,
+                                                             260: GENESIS_TIMESTAMP + 12 * 260})
+        # Only the two anchors were asked
+        self.assertEqual(self.provider.calls["eth_getBlockByNumber"], 2)
+
+        disabled = BlockTimestampResolver(self.web3, mode=BlockTimestampResolver.NONE)
+        self.assertEqual(disabled.resolve([250]), {250: None})
+
@@ -0,0 +1,43 @@
+from unittest import TestCase
+
+from src.local_node.chunk_size import AdaptiveChunkSizeController
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, make_pair_scanner
+
+
+class TestAdaptiveChunkSizeController(TestCase):
+
+    def test_settles_on_target_logs_per_request(self):
+        controller = AdaptiveChunkSizeController(min_chunk_size=10, max_chunk_size=10000, target_logs_per_request=500)
+        chunk_size = 10
+        for _ in range(50):
+            # 2 logs every 3 blocks, fast node
+            controller.record_success(chunk_size, chunk_size * 2 // 3, 0.001 * chunk_size / 1000)
+            chunk_size = controller.next_chunk_size(chunk_size, 1)
+        self.assertAlmostEqual(chunk_size, 750, delta=10)
+
+    def test_latency_budget(self):
+        controller = AdaptiveChunkSizeController(max_chunk_size=10000, latency_budget=2.0)
+        chunk_size = 10
+        for _ in range(50):
+            controller.record_success(chunk_size, 0, chunk_size / 1000)
+            chunk_size = controller.next_chunk_size(chunk_size, 0)
+        self.assertAlmostEqual(chunk_size, 2000, delta=10)
+
+    def test_failure_decreases_and_grows_additively(self):
+        controller = AdaptiveChunkSizeController(additive_increase=100, base_retry_delay=1.0, max_retry_delay=4.0)
+        end_block, delay = controller.record_failure(1000, 2999, 0, ValueError())
+        self.assertEqual(end_block, 1999)
+        self.assertTrue(0.5 <= delay <= 1.0)
+        self.assertLessEqual(controller.record_failure(1000, 1999, 5, ValueError())[1], 4.0)
+
+        chunk_size = controller.next_chunk_size(2000, 1)
+        self.assertEqual(chunk_size, 600)
+        self.assertEqual(controller.next_chunk_size(chunk_size, 1), 700)
+
+    def test_scan_with_response_size_limit(self):
+        provider = FakePairProvider(100, 5100, max_logs_per_response=300)
+        controller = AdaptiveChunkSizeController(target_logs_per_request=200, base_retry_delay=0)
+        scanner = make_pair_scanner(provider, InMemoryState(), max_chunk_scan_size=10000,
+                                    chunk_size_controller=controller)
+        processed, _ = scanner.scan(100, 5100)
+        self.assertEqual(len(processed), len(provider.logs))
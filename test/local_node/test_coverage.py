@@ -0,0 +1,106 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from src.local_node.coverage import BlockCoverage
+from src.local_node.sqlite_state import SQLiteState
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, make_pair_scanner
+
+
+class RecordingProvider(FakePairProvider):
+    """Remembers the block range of every `eth_getLogs` and fails once `fail_after` of them were served."""
+
+    def __init__(self, *args, fail_after=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.ranges = []
+        self.fail_after = fail_after
+
+    def get_logs(self, params):
+        if self.fail_after is not None and len(self.ranges) >= self.fail_after:
+            raise ConnectionError("Node went away")
+        self.ranges.append((int(params["fromBlock"], 16), int(params["toBlock"], 16)))
+        return super().get_logs(params)
+
+
+class TestBlockCoverage(TestCase):
+
+    def test_add_merges_overlapping_and_adjacent(self):
+        coverage = BlockCoverage([(10, 20), (40, 50)])
+        coverage.add(21, 25)
+        self.assertEqual(coverage.to_list(), [[10, 25], [40, 50]])
+        coverage.add(30, 45)
+        self.assertEqual(coverage.to_list(), [[10, 25], [30, 50]])
+        coverage.add(1, 100)
+        self.assertEqual(coverage.to_list(), [[1, 100]])
+
+    def test_gaps_and_contains(self):
+        coverage = BlockCoverage([(10, 20), (40, 50)])
+        self.assertEqual(coverage.gaps(1, 60), [(1, 9), (21, 39), (51, 60)])
+        self.assertEqual(coverage.gaps(15, 45), [(21, 39)])
+        self.assertEqual(coverage.gaps(12, 18), [])
+        self.assertTrue(coverage.contains(40, 50))
+        self.assertFalse(coverage.contains(15, 40))
+
+    def test_truncate(self):
+        coverage = BlockCoverage([(10, 20), (40, 50)])
+        coverage.truncate(15)
+        self.assertEqual(coverage.to_list(), [[10, 14]])
+        coverage.truncate(100)
+        self.assertEqual(coverage.to_list(), [[10, 14]])
+
+
+class TestFillGaps(TestCase):
+    FIRST_BLOCK = 100
+    LAST_BLOCK = 1100
+
+    def expected_blocks(self) -> dict:
+        state = InMemoryState()
+        make_pair_scanner(FakePairProvider(self.FIRST_BLOCK, self.LAST_BLOCK), state).scan(
+            self.FIRST_BLOCK, self.LAST_BLOCK)
+        return state.state["blocks"]
+
+    def test_out_of_order_ranges(self):
+        provider = RecordingProvider(self.FIRST_BLOCK, self.LAST_BLOCK)
+        state = InMemoryState()
+        scanner = make_pair_scanner(provider, state)
+        scanner.scan(700, 900)
+        scanner.scan(200, 400)
+        self.assertEqual(state.get_last_scanned_block(), 900)
+        gaps = scanner.plan_gaps(self.FIRST_BLOCK, self.LAST_BLOCK)
+        self.assertEqual(gaps, [(100, 199), (401, 699), (901, 1100)])
+
+        provider.ranges = []
+        scanner.scan_gaps(self.FIRST_BLOCK, self.LAST_BLOCK)
+        self.assertEqual(state.state["blocks"], self.expected_blocks())
+        self.assertEqual(state.get_coverage().to_list(), [[self.FIRST_BLOCK, self.LAST_BLOCK]])
+        for start, end in provider.ranges:
+            self.assertTrue(any(gap_start <= start and end <= gap_end for gap_start, gap_end in gaps))
+
+    def test_resume_after_crash_without_refetching(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        path = os.path.join(tmp_dir.name, "state.sqlite")
+        state = SQLiteState(path)
+        state.restore()
+
+        provider = RecordingProvider(self.FIRST_BLOCK, self.LAST_BLOCK, fail_after=5)
+        with self.assertRaises(ConnectionError):
+            make_pair_scanner(provider, state, max_request_retries=1).scan(self.FIRST_BLOCK, self.LAST_BLOCK)
+        fetched = list(provider.ranges)
+        state.close()
+
+        state = SQLiteState(path)
+        state.restore()
+        covered = state.get_coverage().to_list()
+        self.assertEqual(len(covered), 1)
+        provider = RecordingProvider(self.FIRST_BLOCK, self.LAST_BLOCK)
+        make_pair_scanner(provider, state).scan_gaps(self.FIRST_BLOCK, self.LAST_BLOCK)
+
+        # Every block was requested exactly once over both runs
+        requested = sorted(fetched + provider.ranges)
+        self.assertEqual(requested[0][0], self.FIRST_BLOCK)
+        self.assertEqual(requested[-1][1], self.LAST_BLOCK)
+        for (_, end), (start, _) in zip(requested, requested[1:]):
+            self.assertEqual(start, end + 1)
+        self.assertEqual(state.get_blocks(), self.expected_blocks())
+        state.close()
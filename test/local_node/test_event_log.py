@@ -0,0 +1,87 @@
+import os
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+import pandas as pd
+
+from src.local_node.event_log import EventLog, EventLogState, HEADER, RECORD
+from src.local_node.process_state_to_df import ProcessStateToDF
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, make_pair_scanner
+
+
+class TestEventLog(TestCase):
+    FIRST_BLOCK = 100
+    LAST_BLOCK = 1100
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "pair.events")
+        self.state = self.open_state()
+
+    def tearDown(self):
+        self.state.close()
+        self.tmp_dir.cleanup()
+
+    def open_state(self) -> EventLogState:
+        state = EventLogState(self.path)
+        state.restore()
+        return state
+
+    def scan(self, state, first_block=FIRST_BLOCK):
+        scanner = make_pair_scanner(FakePairProvider(self.FIRST_BLOCK, self.LAST_BLOCK), state)
+        scanner.scan(first_block, self.LAST_BLOCK)
+
+    def expected_swaps(self, compact=False) -> pd.DataFrame:
+        json_state = InMemoryState()
+        self.scan(json_state)
+        return ProcessStateToDF.process_state(json_state.state["blocks"], compact=compact)
+
+    def test_swaps_match_json_state(self):
+        self.scan(self.state)
+        log = EventLog(self.path)
+        self.assertIsInstance(log.records, np.memmap)
+        self.assertEqual(log.last_scanned_block, self.state.get_last_scanned_block())
+        # Amounts that fit 64 bits come out of pandas as int64, the log always gives Python ints
+        pd.testing.assert_frame_equal(log.swaps(compact=False), self.expected_swaps(), check_dtype=False)
+        pd.testing.assert_frame_equal(log.swaps(), self.expected_swaps(compact=True))
+
+    def test_block_range(self):
+        self.scan(self.state)
+        log = EventLog(self.path)
+        records = log.block_range(500, 510)
+        self.assertEqual(set(records["block"]), {502, 505, 508})
+        self.assertTrue(np.shares_memory(records, log.records))
+        self.assertEqual(len(log.block_range(self.LAST_BLOCK + 1)), 0)
+
+    def test_delete_data_and_resume(self):
+        self.scan(self.state)
+        self.state.close()
+
+        self.state = self.open_state()
+        deleted = self.state.delete_data(1000)
+        self.assertGreater(deleted, 0)
+        self.assertEqual(self.state.get_last_scanned_block(), 999)
+        self.assertEqual(EventLog(self.path).records["block"].max(), 997)
+
+        self.scan(self.state, first_block=1000)
+        pd.testing.assert_frame_equal(EventLog(self.path).swaps(), self.expected_swaps(compact=True))
+
+    def test_uncommitted_rows_dropped(self):
+        self.scan(self.state)
+        rows = len(EventLog(self.path))
+        self.state.close()
+        with open(self.path, "ab") as f:
+            f.write(b"\xff" * (RECORD.itemsize + 7))
+
+        self.state = self.open_state()
+        self.assertEqual(os.path.getsize(self.path), HEADER.itemsize + rows * RECORD.itemsize)
+        # Events must keep their order in the log
+        with self.assertRaises(ValueError):
+            self.scan(self.state, first_block=1000)
+
+    def test_rejects_other_files(self):
+        with open(os.path.join(self.tmp_dir.name, "other"), "wb") as f:
+            f.write(b"{}" * 64)
+        with self.assertRaises(ValueError):
+            EventLog(os.path.join(self.tmp_dir.name, "other"))
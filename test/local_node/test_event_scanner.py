@@ -0,0 +1,62 @@
+from unittest import TestCase
+
+from web3 import Web3
+
+from src.local_node.block_timestamps import BlockTimestampResolver
+from src.local_node.event_scanner import EventScanner
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, make_pair_scanner
+
+
+class TestEventScanner(TestCase):
+    FIRST_BLOCK = 100
+    LAST_BLOCK = 1100
+
+    def make_scanner(self, **kwargs) -> EventScanner:
+        self.provider = FakePairProvider(self.FIRST_BLOCK, self.LAST_BLOCK)
+        return make_pair_scanner(self.provider, InMemoryState(), **kwargs)
+
+    def test_sequential_scan(self):
+        scanner = self.make_scanner()
+        processed, _ = scanner.scan(self.FIRST_BLOCK, self.LAST_BLOCK)
+        self.assertEqual(len(processed), len(self.provider.logs))
+        self.assertGreaterEqual(scanner.state.get_last_scanned_block(), self.LAST_BLOCK)
+
+    def test_concurrent_scan_matches_sequential(self):
+        sequential = self.make_scanner()
+        sequential_processed, _ = sequential.scan(self.FIRST_BLOCK, self.LAST_BLOCK)
+
+        concurrent = self.make_scanner(concurrency=4, max_in_flight=8)
+        processed, chunks = concurrent.scan(self.FIRST_BLOCK, self.LAST_BLOCK)
+
+        self.assertEqual(processed, sequential_processed)
+        self.assertEqual(concurrent.state.state["blocks"], sequential.state.state["blocks"])
+        self.assertEqual(concurrent.state.get_last_scanned_block(), self.LAST_BLOCK)
+
+        # Chunks are committed in block order without gaps
+        state = concurrent.state
+        starts = [start for start, _ in state.chunk_starts]
+        self.assertEqual(len(state.chunk_ends), chunks)
+        self.assertEqual(starts[0], self.FIRST_BLOCK)
+        self.assertEqual(starts[1:], [end + 1 for end in state.chunk_ends[:-1]])
+        self.assertEqual(state.chunk_ends[-1], self.LAST_BLOCK)
+
+        # Both scans start a chunk of blocks `start` to `start + chunk size` with that chunk size
+        for scanner in (sequential, concurrent):
+            chunk_sizes = [size for _, size in scanner.state.chunk_starts]
+            spans = [end - start for (start, _), end in zip(scanner.state.chunk_starts, scanner.state.chunk_ends)]
+            self.assertEqual(chunk_sizes[:-1], spans[:-1])
+            self.assertLessEqual(spans[-1], chunk_sizes[-1])
+
+    def test_one_get_logs_call_per_chunk(self):
+        scanner = self.make_scanner()
+        end_block, events, _ = scanner.fetch_chunk(self.FIRST_BLOCK, self.FIRST_BLOCK + 50)
+        self.assertEqual(self.provider.calls["eth_getLogs"], 1)
+        self.assertEqual({evt["event"] for evt in events}, {"Sync", "Swap"})
+        keys = [(evt["blockNumber"], evt["logIndex"]) for evt in events]
+        self.assertEqual(keys, sorted(keys))
+
+    def test_rate_limit_covers_given_timestamp_resolver(self):
+        provider = FakePairProvider(self.FIRST_BLOCK, self.LAST_BLOCK)
+        resolver = BlockTimestampResolver(Web3(provider))
+        scanner = make_pair_scanner(provider, InMemoryState(), timestamp_resolver=resolver, max_requests_per_second=5)
+        self.assertEqual(resolver.before_request, scanner.rate_limiter.acquire)
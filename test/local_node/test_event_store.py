@@ -0,0 +1,83 @@
+import pickle
+import tempfile
+import tracemalloc
+from unittest import TestCase
+
+import pandas as pd
+
+from src.local_node.event_log import SWAP, SYNC
+from src.local_node.event_store import CompactState, EventStore
+from src.local_node.process_state_to_df import ProcessStateToDF
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, make_pair_scanner
+
+
+class TestEventStore(TestCase):
+    FIRST_BLOCK = 100
+    LAST_BLOCK = 3100
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def scan(self, state, first_block=FIRST_BLOCK):
+        scanner = make_pair_scanner(FakePairProvider(self.FIRST_BLOCK, self.LAST_BLOCK), state)
+        scanner.scan(first_block, self.LAST_BLOCK)
+        return state
+
+    def compact_state(self) -> CompactState:
+        state = CompactState("state.npz", self.tmp_dir.name)
+        state.restore()
+        return state
+
+    def test_matches_json_state(self):
+        store = self.scan(self.compact_state()).store
+        json_state = self.scan(InMemoryState())
+        self.assertEqual(store.to_blocks(), json_state.state["blocks"])
+        pd.testing.assert_frame_equal(store.swaps(), ProcessStateToDF.process_state(json_state.state["blocks"]))
+
+    def test_large_and_zero_values(self):
+        store = EventStore()
+        sender = "0x" + "11" * 20
+        store.append(10, 0, b"\x01" * 32, SYNC, (2 ** 112 - 1, 0))
+        store.append(10, 1, b"\x01" * 32, SWAP, (0, 2 ** 100, 5, 0), sender, sender)
+        store.append(11, 0, b"\x02" * 32, SYNC, (7, 2 ** 64))
+        self.assertEqual(len(store.txhashes), 64)
+        self.assertEqual(store.to_blocks(), {
+            10: {"0x" + "01" * 32: {0: {"reserve0": 2 ** 112 - 1, "reserve1": 0},
+                                    1: {"sender": sender, "to": sender, "amount0In": 0, "amount1In": 2 ** 100,
+                                        "amount0Out": 5, "amount1Out": 0}}},
+            11: {"0x" + "02" * 32: {0: {"reserve0": 7, "reserve1": 2 ** 64}}},
+        })
+        self.assertEqual(store.to_columns()["amount1In"].tolist(), [None, 2 ** 100, None])
+        with self.assertRaises(ValueError):
+            store.append(11, 0, b"\x02" * 32, SYNC, (1, 1))
+        with self.assertRaises(OverflowError):
+            store.append(12, 0, b"\x03" * 32, SYNC, (2 ** 128, 1))
+
+    def test_truncate_save_and_resume(self):
+        state = self.scan(self.compact_state())
+        state.save()
+
+        state = self.compact_state()
+        self.assertEqual(state.get_last_scanned_block(), self.LAST_BLOCK)
+        deleted = state.delete_data(1000)
+        self.assertGreater(deleted, 0)
+        self.assertEqual(state.store.last_block, 997)
+        self.assertEqual(state.get_last_scanned_block(), 999)
+
+        self.scan(state, first_block=1000)
+        self.assertEqual(state.store.to_blocks(), self.scan(InMemoryState()).state["blocks"])
+
+    def test_footprint(self):
+        store = self.scan(self.compact_state()).store
+        json_blocks = self.scan(InMemoryState()).state["blocks"]
+        # Measure a fresh copy, so objects shared with the scanner are counted too
+        serialized = pickle.dumps(json_blocks)
+        tracemalloc.start()
+        copy = pickle.loads(serialized)
+        json_bytes, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        self.assertGreater(len(copy), 0)
+        self.assertGreater(json_bytes / store.nbytes(), 10)
@@ -0,0 +1,49 @@
+import json
+from unittest import TestCase
+
+from web3 import Web3
+from web3._utils.events import get_event_data
+from web3.exceptions import LogTopicError
+
+from src.local_node.event_scanner import build_event_abis_by_topic
+from src.local_node import fast_decoder
+from src.local_node.fast_decoder import decode_logs, SWAP_TOPIC
+from src.uniswap_v2_pair_abi import UNISWAP_V2_PAIR_ABI
+from test.local_node.fake_provider import FakePairProvider, PAIR_ADDRESS
+
+
+class TestFastDecoder(TestCase):
+
+    def test_matches_generic_decoder(self):
+        web3 = Web3(FakePairProvider(100, 400))
+        contract = web3.eth.contract(abi=json.loads(UNISWAP_V2_PAIR_ABI))
+        abis = build_event_abis_by_topic([contract.events.Sync, contract.events.Swap, contract.events.Transfer])
+        logs = web3.eth.get_logs({"fromBlock": 100, "toBlock": 400, "address": PAIR_ADDRESS})
+
+        batch = decode_logs(web3.codec, abis, logs)
+        self.assertEqual(len(batch.sync), len(batch.swap))
+        self.assertEqual(batch.other, [])
+
+        expected = [get_event_data(web3.codec, abis[bytes(log["topics"][0])], log) for log in logs]
+        self.assertEqual(len(batch.to_events()), len(expected))
+        for fast, generic in zip(batch.to_events(), expected):
+            self.assertEqual(fast["event"], generic["event"])
+            self.assertEqual(dict(fast["args"]), dict(generic["args"]))
+            self.assertEqual(fast.blockNumber, generic.blockNumber)
+            self.assertEqual(fast.logIndex, generic.logIndex)
+            self.assertEqual(fast.transactionHash, generic.transactionHash)
+
+    def test_malformed_logs_use_generic_decoder(self):
+        web3 = Web3(FakePairProvider(100, 400))
+        contract = web3.eth.contract(abi=json.loads(UNISWAP_V2_PAIR_ABI))
+        abis = build_event_abis_by_topic([contract.events.Sync, contract.events.Swap])
+        logs = web3.eth.get_logs({"fromBlock": 100, "toBlock": 400, "address": PAIR_ADDRESS})
+        swap_log = next(log for log in logs if bytes(log["topics"][0]) == SWAP_TOPIC)
+
+        with self.assertRaises(LogTopicError):
+            decode_logs(web3.codec, abis, [dict(swap_log, topics=swap_log["topics"][:1])])
+
+    def test_address_cache_is_bounded(self):
+        for i in range(fast_decoder.MAX_CACHED_ADDRESSES + 10):
+            self.assertTrue(fast_decoder._addresses[i.to_bytes(32, "big")].startswith("0x"))
+        self.assertLessEqual(len(fast_decoder._addresses), fast_decoder.MAX_CACHED_ADDRESSES)
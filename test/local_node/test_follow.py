@@ -0,0 +1,88 @@
+from unittest import TestCase
+
+from src.local_node.follow import AdaptivePollInterval, ChainFollower, PolledRange
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, make_pair_scanner
+
+
+class FakeClock:
+    """Time that only moves when the follower sleeps, while the fake chain mines a block every 12 seconds."""
+
+    def __init__(self, provider: FakePairProvider, block_time: float = 12.0):
+        self.provider = provider
+        self.block_time = block_time
+        self.now = 0.0
+        self.first_head = provider.last_block
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        self.provider.last_block = self.first_head + int(self.now // self.block_time)
+
+
+class TestAdaptivePollInterval(TestCase):
+
+    def test_learns_block_time_and_backs_off_when_late(self):
+        interval = AdaptivePollInterval(block_time=2.0, min_interval=0.25, max_interval=4.0, smoothing=0.5)
+        for head in range(10):
+            interval.record_head(head, head * 12.0)
+        self.assertAlmostEqual(interval.block_time, 12.0, delta=0.1)
+        self.assertAlmostEqual(interval.next_delay(108.0 + 1.0), 11.0, delta=0.1)
+        late = [interval.next_delay(121.0) for _ in range(6)]
+        self.assertEqual(late, [0.25, 0.5, 1.0, 2.0, 4.0, 4.0])
+
+
+class TestChainFollower(TestCase):
+
+    def test_follows_head_and_commits_every_block(self):
+        provider = FakePairProvider(100, 1100)
+        provider.last_block = 500
+        state = InMemoryState()
+        clock = FakeClock(provider)
+        follower = ChainFollower(make_pair_scanner(provider, state), clock=clock, sleep=clock.sleep)
+
+        follower.follow(100, stop=lambda: state.get_last_scanned_block() >= 599)
+        self.assertEqual(state.get_last_scanned_block(), 599)
+
+        expected = InMemoryState()
+        make_pair_scanner(provider, expected).scan(100, 599)
+        self.assertEqual(state.state["blocks"], expected.state["blocks"])
+
+        # Once caught up every block is its own commit, soon after it appeared
+        self.assertTrue(all(end - start <= 1 for start, end in zip(state.chunk_ends[-50:], state.chunk_ends[-49:])))
+        summary = follower.latency_summary()
+        self.assertGreater(summary["count"], 90)
+        self.assertLess(summary["p95"], 1.0)
+        # Polls are timed to the block time instead of hammering the node
+        self.assertLess(len(clock.sleeps), 5 * 100)
+
+    def test_catch_up_poll_returns_only_the_range(self):
+        provider = FakePairProvider(100, 1100)
+        provider.last_block = 800
+        state = InMemoryState()
+        clock = FakeClock(provider)
+        follower = ChainFollower(make_pair_scanner(provider, state), clock=clock, sleep=clock.sleep)
+
+        polled = follower.poll(100)
+        logs = [log for log in provider.logs if int(log["blockNumber"], 16) <= 799]
+        self.assertEqual(polled, PolledRange(100, 799, len(state.chunk_ends), len(logs)))
+        self.assertIsNone(follower.poll(100))
+
+    def test_reorg_while_following(self):
+        provider = FakePairProvider(100, 1100)
+        provider.last_block = 800
+        state = InMemoryState()
+        clock = FakeClock(provider)
+        follower = ChainFollower(make_pair_scanner(provider, state), clock=clock, sleep=clock.sleep)
+        follower.poll(100)
+
+        provider.reorg(790)
+        provider.last_block = 820
+        follower.poll(100)
+
+        expected = InMemoryState()
+        make_pair_scanner(provider, expected).scan(100, 819)
+        self.assertEqual(state.state["blocks"], expected.state["blocks"])
@@ -0,0 +1,133 @@
+import tempfile
+from unittest import TestCase
+
+from pandas.testing import assert_frame_equal
+
+from src.local_node.event_scanner import JSONifiedState
+from src.local_node.multi_pair import PairPartitionedState, scan_pairs
+from src.local_node.process_state_to_df import ProcessStateToDF
+from test.local_node.fake_provider import (FakePairProvider, InMemoryState, make_pair_scanner, OTHER_PAIR_ADDRESS,
+                                           PAIR_ADDRESS)
+
+THIRD_PAIR_ADDRESS = "0x0d4a11d5EEaaC28EC3F61d100daF4d40471f1852"
+
+
+class TestMultiPair(TestCase):
+
+    def setUp(self):
+        self.provider = FakePairProvider(100, 1100)
+        self.provider.add_pair(OTHER_PAIR_ADDRESS, 600, seed=2)
+        self.provider.add_pair(THIRD_PAIR_ADDRESS, 300, seed=3)
+        self.pair_states = {}
+
+    def make_state(self, first_blocks) -> PairPartitionedState:
+        return PairPartitionedState(first_blocks, lambda address: self.pair_states.setdefault(address, InMemoryState()))
+
+    def test_plan_segments(self):
+        state = self.make_state({PAIR_ADDRESS: 100, OTHER_PAIR_ADDRESS: 600})
+        self.assertEqual(state.plan_segments(1100), [
+            (100, 599, [PAIR_ADDRESS]),
+            (600, 1100, [PAIR_ADDRESS, OTHER_PAIR_ADDRESS]),
+        ])
+
+    def test_scan_is_partitioned_by_pair(self):
+        state = self.make_state({PAIR_ADDRESS: 100, OTHER_PAIR_ADDRESS: 600})
+        scan_pairs(make_pair_scanner(self.provider, state), state, 1100)
+
+        for address in (PAIR_ADDRESS, OTHER_PAIR_ADDRESS):
+            pair_logs = [log for log in self.provider.logs if log["address"] == address]
+            blocks = self.pair_states[address].state["blocks"]
+            self.assertEqual(sum(len(txn) for block in blocks.values() for txn in block.values()), len(pair_logs))
+            self.assertEqual(self.pair_states[address].get_last_scanned_block(), 1100)
+
+        frames = ProcessStateToDF.process_partitions(
+            {address: pair_state.state["blocks"] for address, pair_state in self.pair_states.items()}, max_workers=2)
+        for address, pair_state in self.pair_states.items():
+            assert_frame_equal(frames[address], ProcessStateToDF.process_state(pair_state.state["blocks"]))
+
+    def test_added_pair_only_backfills_its_range(self):
+        state = self.make_state({PAIR_ADDRESS: 100, OTHER_PAIR_ADDRESS: 600})
+        scan_pairs(make_pair_scanner(self.provider, state), state, 1100)
+
+        state = self.make_state({PAIR_ADDRESS: 100, OTHER_PAIR_ADDRESS: 600, THIRD_PAIR_ADDRESS: 300})
+        self.assertEqual(state.plan_segments(1100), [(300, 1100, [THIRD_PAIR_ADDRESS])])
+        scan_pairs(make_pair_scanner(self.provider, state), state, 1100)
+        self.assertEqual(self.pair_states[THIRD_PAIR_ADDRESS].get_last_scanned_block(), 1100)
+        self.assertEqual(state.get_last_scanned_block(), 1100)
+
+    def test_coverage_round_trip(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+
+        def make_file_state(address):
+            return JSONifiedState(f"{address}.json", tmp_dir.name)
+
+        first_blocks = {PAIR_ADDRESS: 100, OTHER_PAIR_ADDRESS: 600}
+        state = PairPartitionedState(first_blocks, make_file_state)
+        state.restore()
+        scanner = make_pair_scanner(self.provider, state)
+        scan_pairs(scanner, state, 1100)
+        self.assertEqual(scanner.plan_gaps(100, 1100), [])
+        state.save()
+
+        state = PairPartitionedState(first_blocks, make_file_state)
+        state.restore()
+        self.assertEqual(state.get_pair_state(PAIR_ADDRESS).get_coverage().to_list(), [[100, 1100]])
+        self.assertEqual(state.get_pair_state(OTHER_PAIR_ADDRESS).get_coverage().to_list(), [[600, 1100]])
+        scanner = make_pair_scanner(self.provider, state)
+        self.assertEqual(scanner.plan_gaps(100, 1100), [])
+        self.assertEqual(scanner.plan_gaps(100, 1200), [(1101, 1200)])
+
+    def test_fill_gap_of_one_pair(self):
+        state = self.make_state({PAIR_ADDRESS: 100, OTHER_PAIR_ADDRESS: 600})
+        scanner = make_pair_scanner(self.provider, state)
+        scan_pairs(scanner, state, 1100)
+        expected = self.pair_states[OTHER_PAIR_ADDRESS].state["blocks"].copy()
+        self.pair_states[OTHER_PAIR_ADDRESS].delete_data(800)
+        self.assertEqual(scanner.plan_gaps(100, 1100), [(800, 1100)])
+
+        chunks = len(self.pair_states[PAIR_ADDRESS].chunk_ends)
+        scanner.scan_gaps(100, 1100)
+        self.assertEqual(scanner.plan_gaps(100, 1100), [])
+        self.assertEqual(self.pair_states[OTHER_PAIR_ADDRESS].state["blocks"], expected)
+        # The pair that has the blocks takes no part in filling the gap
+        self.assertEqual(len(self.pair_states[PAIR_ADDRESS].chunk_ends), chunks)
+
+    def test_block_hashes_per_pair(self):
+        state = self.make_state({PAIR_ADDRESS: 100, OTHER_PAIR_ADDRESS: 600})
+        scanner = make_pair_scanner(self.provider, state)
+        scan_pairs(scanner, state, 1100)
+        for address, first_block in ((PAIR_ADDRESS, 100), (OTHER_PAIR_ADDRESS, 600)):
+            index = self.pair_states[address].get_block_hash_index()
+            self.assertEqual(index.last_block, 1100)
+            self.assertGreaterEqual(min(index.blocks), first_block)
+        self.assertIsNone(scanner.find_fork_block())
+        self.assertEqual(state.find_fork_blocks(scanner.get_block_hash), {})
+
+    def test_pair_without_block_hashes_rescans_its_last_blocks(self):
+        state = self.make_state({PAIR_ADDRESS: 100, OTHER_PAIR_ADDRESS: 600})
+        scanner = make_pair_scanner(self.provider, state)
+        scan_pairs(scanner, state, 1100)
+        # Like a pair state saved before block hashes were kept
+        self.pair_states[OTHER_PAIR_ADDRESS].get_block_hash_index().truncate(0)
+        self.assertEqual(state.find_fork_blocks(scanner.get_block_hash),
+                         {OTHER_PAIR_ADDRESS: 1100 - scanner.NUM_BLOCKS_RESCAN_FOR_FORKS})
+
+    def test_reorg_rewinds_every_pair(self):
+        state = self.make_state({PAIR_ADDRESS: 100, OTHER_PAIR_ADDRESS: 600, THIRD_PAIR_ADDRESS: 300})
+        scanner = make_pair_scanner(self.provider, state)
+        scan_pairs(scanner, state, 1100)
+
+        self.provider.reorg(950)
+        fork_blocks = state.find_fork_blocks(scanner.get_block_hash)
+        self.assertEqual(set(fork_blocks), {PAIR_ADDRESS, OTHER_PAIR_ADDRESS, THIRD_PAIR_ADDRESS})
+        self.assertTrue(all(940 < block <= 950 for block in fork_blocks.values()))
+        self.assertGreater(state.rewind_to_fork(scanner.get_block_hash), 0)
+        scan_pairs(scanner, state, 1100)
+
+        rescanned = self.pair_states
+        self.pair_states = {}
+        expected = self.make_state({PAIR_ADDRESS: 100, OTHER_PAIR_ADDRESS: 600, THIRD_PAIR_ADDRESS: 300})
+        scan_pairs(make_pair_scanner(self.provider, expected), expected, 1100)
+        for address, pair_state in self.pair_states.items():
+            self.assertEqual(rescanned[address].state["blocks"], pair_state.state["blocks"])
@@ -0,0 +1,81 @@
+import json
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+from pandas.testing import assert_frame_equal
+
+from src.local_node.event_scanner import WatermarkState
+from src.local_node.process_state_to_df import ProcessStateToDF, StreamingSwapWriter
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, make_pair_scanner
+
+
+def scanned_blocks(first_block=100, last_block=1100) -> dict:
+    state = InMemoryState()
+    make_pair_scanner(FakePairProvider(first_block, last_block), state).scan(first_block, last_block)
+    return state.state["blocks"]
+
+
+class TestProcessStateToDF(TestCase):
+
+    def test_matches_block_by_block_processing(self):
+        blocks = scanned_blocks()
+        # A mint in its own transaction and a block with two swaps
+        blocks[101] = {"0xmint": {0: {"reserve0": 2 * 10 ** 21, "reserve1": 10 ** 24}}}
+        first_swap_block = blocks[103]
+        txhash, events = next(iter(first_swap_block.items()))
+        first_swap_block["0xsecond"] = {
+            5: {"reserve0": 3 * 10 ** 21, "reserve1": 10 ** 24},
+            6: dict(events[1], amount0In=10 ** 18),
+        }
+
+        expected = ProcessStateToDF.process_state_by_block(blocks, self)
+        actual = ProcessStateToDF.process_state(blocks, self)
+        assert_frame_equal(actual, expected)
+        self.assertEqual(actual["reserve0"][1], 2 * 10 ** 21)
+
+    def test_json_round_trip_state(self):
+        blocks = json.loads(json.dumps(scanned_blocks()))
+        assert_frame_equal(ProcessStateToDF.process_state(blocks, self),
+                           ProcessStateToDF.process_state_by_block(blocks, self))
+
+    def test_compact_keeps_exact_values(self):
+        swaps = ProcessStateToDF.process_state(scanned_blocks())
+        compacted = ProcessStateToDF.process_state(scanned_blocks(), compact=True)
+        self.assertEqual(compacted['reserve1'].dtype, np.float64)
+        self.assertEqual(compacted['block'].dtype, np.int64)
+        self.assertEqual(ProcessStateToDF.exact_column(compacted, 'reserve1').to_ints().tolist(),
+                         swaps['reserve1'].tolist())
+        swaps['block'] = swaps['block'].astype(np.int64)
+        # Amounts that fit 64 bits come out of pandas as int64, expand always gives Python ints
+        assert_frame_equal(ProcessStateToDF.expand(compacted), swaps, check_dtype=False)
+
+    def test_swap_without_sync_fails(self):
+        blocks = {10: {"0xabc": {"0": {"sender": "a", "to": "b", "amount0In": 1, "amount1In": 0,
+                                       "amount0Out": 0, "amount1Out": 1}}}}
+        with self.assertRaises(AssertionError):
+            ProcessStateToDF.process_state(blocks, self)
+
+
+class TestStreamingSwapWriter(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_matches_batch_processing_across_restarts(self):
+        provider = FakePairProvider(100, 2100)
+        writer = StreamingSwapWriter(self.tmp_dir.name, rows_per_batch=50, test_self=self)
+        scanner = make_pair_scanner(provider, WatermarkState())
+        writer.consume(scanner.scan_iter(100, 1000))
+
+        # A new writer resumes with the reserves left by the first one
+        writer = StreamingSwapWriter(self.tmp_dir.name, rows_per_batch=50, test_self=self)
+        self.assertEqual(writer.resume_block(100), 1001)
+        scanner = make_pair_scanner(provider, WatermarkState(1000))
+        writer.consume(scanner.scan_iter(writer.resume_block(100), 2100))
+
+        expected = ProcessStateToDF.process_state(scanned_blocks(100, 2100), self)
+        assert_frame_equal(StreamingSwapWriter.read_swaps(self.tmp_dir.name), expected)
@@ -0,0 +1,69 @@
+import pickle
+from unittest import TestCase
+
+from src.local_node.rpc_transport import JsonRpcError, JsonRpcTransport
+from test.local_node.benchmark_scanner import make_http_scanner
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, PAIR_ADDRESS, make_pair_scanner
+from test.local_node.stand_in_node import StandInNode
+
+
+class TestJsonRpcTransport(TestCase):
+    FIRST_BLOCK = 100
+    LAST_BLOCK = 2100
+
+    def expected_blocks(self, provider: FakePairProvider) -> dict:
+        state = InMemoryState()
+        make_pair_scanner(provider, state).scan(self.FIRST_BLOCK, self.LAST_BLOCK)
+        return state.state["blocks"]
+
+    def test_scan_matches_web3(self):
+        provider = FakePairProvider(self.FIRST_BLOCK, self.LAST_BLOCK)
+        with StandInNode(provider, compress=True) as node:
+            state = InMemoryState()
+            scanner = make_http_scanner(node, state, transport=True, concurrency=4)
+            scanner.scan(self.FIRST_BLOCK, self.LAST_BLOCK, start_chunk_size=100)
+            self.assertEqual(scanner.get_suggested_scan_end_block(), self.LAST_BLOCK - 1)
+            self.assertGreater(node.compressed_responses, 0)
+        self.assertEqual(state.state["blocks"], self.expected_blocks(provider))
+        self.assertGreater(provider.calls["batch"], 0)
+        # Hashes of blocks with events are recorded the same way as through web3
+        self.assertEqual(state.block_hashes.hashes[-1], provider.block_hash(state.block_hashes.last_block))
+
+    def test_get_logs_records(self):
+        provider = FakePairProvider(self.FIRST_BLOCK, self.LAST_BLOCK)
+        with StandInNode(provider) as node:
+            logs = JsonRpcTransport(node.url).get_logs(
+                {"fromBlock": self.FIRST_BLOCK, "toBlock": self.FIRST_BLOCK + 10, "address": PAIR_ADDRESS})
+        self.assertGreater(len(logs), 0)
+        self.assertIsInstance(logs[0]["blockNumber"], int)
+        self.assertEqual(logs[0]["blockHash"].hex(), provider.block_hash(logs[0]["blockNumber"]))
+        self.assertEqual(logs[0]["address"], PAIR_ADDRESS)
+
+    def test_batch_in_call_order(self):
+        with StandInNode(FakePairProvider(self.FIRST_BLOCK, self.LAST_BLOCK)) as node:
+            transport = JsonRpcTransport(node.url)
+            responses = transport.make_batch_request(
+                [("eth_getBlockByNumber", [hex(block), False]) for block in (500, 200, self.LAST_BLOCK + 1)])
+            self.assertEqual(node.http_requests, 1)
+            self.assertEqual(transport.block_number(), self.LAST_BLOCK)
+        self.assertEqual([int(r["result"]["number"], 16) for r in responses[:2]], [500, 200])
+        self.assertIsNone(responses[2]["result"])
+
+    def test_errors_raise_and_retry(self):
+        provider = FakePairProvider(self.FIRST_BLOCK, self.LAST_BLOCK)
+        with StandInNode(provider, max_response_bytes=50000) as node:
+            transport = JsonRpcTransport(node.url)
+            with self.assertRaises(JsonRpcError):
+                transport.get_logs({"fromBlock": self.FIRST_BLOCK, "toBlock": self.LAST_BLOCK})
+            with self.assertRaises(JsonRpcError):
+                transport.call("eth_unknown", [])
+
+            state = InMemoryState()
+            make_http_scanner(node, state, transport=True).scan(self.FIRST_BLOCK, self.LAST_BLOCK)
+        self.assertEqual(state.state["blocks"], self.expected_blocks(provider))
+
+    def test_pickles_without_session(self):
+        transport = pickle.loads(pickle.dumps(JsonRpcTransport("http://127.0.0.1:8545", timeout=5, pool_size=32)))
+        self.assertEqual((transport.endpoint_uri, transport.timeout, transport.pool_size),
+                         ("http://127.0.0.1:8545", 5, 32))
+        self.assertIsNotNone(transport.session)
@@ -0,0 +1,64 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from src.local_node.scan_metrics import JsonLinesSink, PrometheusTextFileSink, ScanMetrics
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, make_pair_scanner
+
+
+class TestScanMetrics(TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def scan(self, hooks, concurrency=1, **provider_kwargs):
+        provider = FakePairProvider(100, 2100, **provider_kwargs)
+        state = InMemoryState()
+        scanner = make_pair_scanner(provider, state, hooks=hooks, concurrency=concurrency, request_retry_seconds=0)
+        scanner.scan(100, 2100)
+        for hook in hooks:
+            hook.close()
+        return provider, state
+
+    def test_counts_every_chunk_and_log(self):
+        for concurrency in (1, 3):
+            metrics = ScanMetrics()
+            provider, state = self.scan([metrics], concurrency=concurrency, max_logs_per_response=50)
+            self.assertEqual(metrics.counters["chunks_total"], len(state.chunk_ends))
+            self.assertEqual(metrics.counters["blocks_total"], 2001)
+            self.assertEqual(metrics.counters["logs_total"], len(provider.logs))
+            self.assertEqual(metrics.counters["requests_total"], provider.calls["eth_getLogs"])
+            self.assertGreater(metrics.counters["retries_total"], 0)
+            self.assertEqual(metrics.counters["retries_total"], provider.failed_requests)
+            self.assertEqual(metrics.histograms["rpc_seconds"].count, len(state.chunk_ends))
+            self.assertGreater(metrics.histograms["decode_seconds"].sum, 0)
+
+    def test_split_ranges_are_not_retries(self):
+        # A concurrent chunk throttled down by a failure needs a follow up request for the rest of its range
+        metrics = ScanMetrics()
+        provider, state = self.scan([metrics], concurrency=3, max_logs_per_response=50)
+        extra_requests = metrics.counters["requests_total"] - metrics.counters["chunks_total"]
+        self.assertEqual(metrics.counters["retries_total"], provider.failed_requests)
+        self.assertLess(metrics.counters["retries_total"], extra_requests)
+
+    def test_prometheus_text_file(self):
+        path = os.path.join(self.tmp_dir.name, "scanner.prom")
+        sink = PrometheusTextFileSink(path)
+        self.scan([sink])
+        with open(path) as f:
+            text = f.read()
+        self.assertIn("# TYPE event_scanner_rpc_seconds histogram", text)
+        self.assertIn('event_scanner_logs_per_chunk_bucket{le="+Inf"} ' + str(sink.counters["chunks_total"]), text)
+        self.assertIn("event_scanner_last_scanned_block 2100", text)
+
+    def test_json_lines(self):
+        path = os.path.join(self.tmp_dir.name, "scanner.jsonl")
+        _, state = self.scan([JsonLinesSink(path)])
+        with open(path) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([record["end_block"] for record in records], state.chunk_ends)
+        self.assertTrue(all(record["requests"] >= 1 for record in records))
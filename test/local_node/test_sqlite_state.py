@@ -0,0 +1,63 @@
+import tempfile
+from unittest import TestCase
+
+from src.local_node.sqlite_state import SQLiteState
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, make_pair_scanner
+
+
+class TestSQLiteState(TestCase):
+    FIRST_BLOCK = 100
+    LAST_BLOCK = 1100
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.state = SQLiteState("state.sqlite", self.tmp_dir.name)
+        self.state.restore()
+
+    def tearDown(self):
+        self.state.close()
+        self.tmp_dir.cleanup()
+
+    def scan(self, state):
+        scanner = make_pair_scanner(FakePairProvider(self.FIRST_BLOCK, self.LAST_BLOCK), state)
+        scanner.scan(self.FIRST_BLOCK, self.LAST_BLOCK)
+
+    def test_matches_json_state(self):
+        self.scan(self.state)
+        json_state = InMemoryState()
+        self.scan(json_state)
+
+        self.assertEqual(self.state.get_blocks(), json_state.state["blocks"])
+        self.assertEqual(self.state.get_last_scanned_block(), json_state.get_last_scanned_block())
+
+    def test_delete_data_and_resume(self):
+        self.scan(self.state)
+        self.state.close()
+
+        self.state.restore()
+        self.assertGreaterEqual(self.state.get_last_scanned_block(), self.LAST_BLOCK)
+        deleted = self.state.delete_data(1000)
+        self.assertGreater(deleted, 0)
+        self.assertEqual(max(self.state.get_blocks()), 997)
+        self.assertEqual(set(self.state.get_blocks(500, 510)), {502, 505, 508})
+
+    def test_rescan_after_failed_chunk(self):
+        process_event = self.state.process_event
+        calls = []
+
+        def fail_in_second_chunk(block_when, event):
+            calls.append(event.blockNumber)
+            if len(calls) == 50:
+                raise ValueError("Process failed")
+            return process_event(block_when, event)
+
+        self.state.process_event = fail_in_second_chunk
+        with self.assertRaises(ValueError):
+            self.scan(self.state)
+        self.assertTrue(self.state.connection.in_transaction)
+
+        self.state.process_event = process_event
+        self.scan(self.state)
+        json_state = InMemoryState()
+        self.scan(json_state)
+        self.assertEqual(self.state.get_blocks(), json_state.state["blocks"])
@@ -0,0 +1,50 @@
+from unittest import TestCase
+
+from test.local_node.benchmark_scanner import make_http_scanner, run_benchmark
+from test.local_node.fake_provider import FakePairProvider, InMemoryState, make_pair_scanner
+from test.local_node.stand_in_node import StandInNode
+
+
+class TestStandInNode(TestCase):
+    FIRST_BLOCK = 100
+    LAST_BLOCK = 2100
+
+    def expected_blocks(self, provider: FakePairProvider) -> dict:
+        state = InMemoryState()
+        make_pair_scanner(provider, state).scan(self.FIRST_BLOCK, self.LAST_BLOCK)
+        return state.state["blocks"]
+
+    def scan_over_http(self, node: StandInNode, **kwargs) -> InMemoryState:
+        state = InMemoryState()
+        make_http_scanner(node, state, **kwargs).scan(self.FIRST_BLOCK, self.LAST_BLOCK, start_chunk_size=100)
+        return state
+
+    def test_scan_over_http_matches_in_process(self):
+        provider = FakePairProvider(self.FIRST_BLOCK, self.LAST_BLOCK)
+        with StandInNode(provider, latency=0.001) as node:
+            state = self.scan_over_http(node, concurrency=4)
+        self.assertEqual(state.state["blocks"], self.expected_blocks(provider))
+        # Block timestamps go out as JSON-RPC batches
+        self.assertGreater(provider.calls["batch"], 0)
+
+    def test_survives_size_limits_and_stalls(self):
+        provider = FakePairProvider(self.FIRST_BLOCK, self.LAST_BLOCK)
+        with StandInNode(provider, max_response_bytes=50000, stall_every=5, stall_seconds=0.5) as node:
+            state = self.scan_over_http(node, timeout=0.2)
+        self.assertEqual(state.state["blocks"], self.expected_blocks(provider))
+
+    def test_reorg_rescans_suffix(self):
+        provider = FakePairProvider(self.FIRST_BLOCK, self.LAST_BLOCK)
+        with StandInNode(provider) as node:
+            state = self.scan_over_http(node)
+            node.reorg(2000)
+            scanner = make_http_scanner(node, state)
+            start_block = scanner.rewind_to_fork()
+            self.assertGreater(start_block, 1990)
+            scanner.scan(start_block, self.LAST_BLOCK)
+        self.assertEqual(state.state["blocks"], self.expected_blocks(provider))
+
+    def test_benchmark_reports(self):
+        result = run_benchmark(blocks=1000, concurrency=2)
+        for key in ("blocks_per_second", "logs_per_second", "rpc_calls_per_10k_blocks", "scan_peak_memory_mb"):
+            self.assertGreater(result[key], 0, key)
@@ -0,0 +1,56 @@
+import math
+import random
+from unittest import TestCase
+
+import numpy as np
+
+from src.local_node import uint128
+from src.local_node.uint128 import UInt128Column
+
+
+def random_uints(count: int, bits: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [rng.getrandbits(rng.randint(1, bits)) for _ in range(count)] + [0, (1 << bits) - 1]
+
+
+class TestUInt128Column(TestCase):
+
+    def setUp(self):
+        self.a = random_uints(1000, 112, 1)
+        self.b = random_uints(1000, 112, 2)
+
+    def test_round_trip(self):
+        self.assertEqual(UInt128Column.from_ints(self.a).to_ints().tolist(), self.a)
+        with self.assertRaises(OverflowError):
+            UInt128Column.from_ints([1 << 128])
+        with self.assertRaises(OverflowError):
+            UInt128Column.from_ints([-1])
+
+    def test_exact_arithmetic(self):
+        a, b = UInt128Column.from_ints(self.a), UInt128Column.from_ints(self.b)
+        self.assertEqual(uint128.add(a, b).to_ints().tolist(), [x + y for x, y in zip(self.a, self.b)])
+        larger = [max(x, y) for x, y in zip(self.a, self.b)]
+        smaller = [min(x, y) for x, y in zip(self.a, self.b)]
+        self.assertEqual(uint128.sub(UInt128Column.from_ints(larger), UInt128Column.from_ints(smaller)).to_ints().tolist(),
+                         [x - y for x, y in zip(larger, smaller)])
+        self.assertEqual(uint128.cumsum(a).to_ints().tolist(), np.cumsum(np.array(self.a, dtype=object)).tolist())
+
+    def test_overflow_raises(self):
+        largest = UInt128Column.from_ints([(1 << 128) - 1])
+        with self.assertRaises(OverflowError):
+            uint128.add(largest, UInt128Column.from_ints([1]))
+        with self.assertRaises(OverflowError):
+            uint128.sub(UInt128Column.from_ints([1]), UInt128Column.from_ints([2]))
+        with self.assertRaises(OverflowError):
+            uint128.cumsum(UInt128Column.from_ints([(1 << 127), (1 << 127)]))
+
+    def test_ratio_and_log_error_bound(self):
+        a, b = UInt128Column.from_ints(self.a), UInt128Column.from_ints(self.b)
+        ratios = uint128.ratio(a, b)
+        for x, y, ratio in zip(self.a, self.b, ratios):
+            if y:
+                self.assertAlmostEqual(ratio, x / y, delta=abs(x / y) * 2 ** -50)
+        logs = uint128.log(a)
+        for x, value in zip(self.a, logs):
+            if x:
+                self.assertAlmostEqual(value, math.log(x), delta=2 ** -45)